@@ -1,5 +1,30 @@
-from selenium import webdriver
-from bs4 import BeautifulSoup as bs
+import time
+from collections import OrderedDict
+from Fetchers import CAPTCHA_MARKER, default_fetcher
+from Metrics import METRICS
+from PageParsers import parse_asins, parse_review_link_page, parse_review_page
+
+
+BASE_URL = "https://www.amazon.in"
+
+
+def review_page_url(review_link, page_nr, base_url=BASE_URL, sort_by=None):
+    """
+    Returns the URL of a page of reviews
+    Parameters:
+        review_link (str): A URL which contains the reviews
+        page_nr (int): page number
+        base_url (str): the site root (default is https://www.amazon.in)
+        sort_by (str): review order, e.g. 'recent' for the newest reviews first (default is None, Amazon's order)
+
+    Returns:
+        str: the URL of the review page
+
+    """
+    url = base_url + review_link + '&pageNumber=' + str(page_nr)
+    if sort_by:
+        url += '&sortBy=' + sort_by
+    return url
 
 
 class AmazonScrapper:
@@ -9,35 +34,50 @@ class AmazonScrapper:
     Parameters:
         search_term (str): The search term used on Amazon
         sleep_time (float): Time delay between HTTP requests to avoid being blocked (default is 2 seconds)
+        page_cache_size (int): Number of fetched pages kept for repeat requests in this run (default is 32)
+        fetcher (callable): Fetches the HTML of a URL (default is pooled HTTP with Chrome as fallback)
     """
 
 
-    def __init__(self, search_term, sleep_time=2):
+    def __init__(self, search_term, sleep_time=2, page_cache_size=32, fetcher=None):
         """
         Initialize the AmazonScrapper object.
         Parameters:
             search_term (str): The search term used on Amazon
             sleep_time (float): Time delay between HTTP requests to avoid being blocked (default is 2 seconds)
+            page_cache_size (int): Number of fetched pages kept for repeat requests in this run (default is 32)
+            fetcher (callable): Fetches the HTML of a URL (default is pooled HTTP with Chrome as fallback)
         """
         self.base_url = "https://www.amazon.in/s?k="
         self.sleep_time = sleep_time
         self.search_term = search_term
-        self.browser = webdriver.Chrome()
+        self.page_cache = OrderedDict()
+        self.page_cache_size = page_cache_size
+        self.last_request = 0
+        # A fetcher passed in is closed by its owner
+        self.owns_fetcher = fetcher is None
+        self.fetcher = fetcher if fetcher is not None else default_fetcher()
+
+    def close(self):
+        """
+        Closes the fetcher created by the scraper, the browser included if it was started
+        """
+        if self.owns_fetcher and hasattr(self.fetcher, 'close'):
+            self.fetcher.close()
 
-    #Get http request wrapper using chromedriver
+    #Get http request wrapper using the fetcher
     def get_amazon_search_results(self):
         """
-        Get HTTP request wrapper using chromedriver.
+        Get HTTP request wrapper using the fetcher.
         Returns:
             str: The HTML content of the Amazon search results page.
 
         """
         try:
             url = self.base_url+self.search_term
-            self.browser.get(url)
-            page_html = self.browser.page_source
+            page_html = self.get_page(url)
 
-            if "api-services-support@amazon.com" in page_html:
+            if CAPTCHA_MARKER in page_html:
                 raise Exception("CAPTCHA is not bypassed")
             return page_html
 
@@ -52,13 +92,10 @@ class AmazonScrapper:
             list: A list of ASIN numbers
 
         """
-        asin_list = []
         try:
             response = self.get_amazon_search_results()
-            soup = bs(response, 'html.parser')
-            for item in soup.findAll("div", {'data-component-type': 's-search-result'}):
-                asin_list.append(item['data-asin'])
-            return asin_list
+            with METRICS.time('parse', page='search'):
+                return parse_asins(response)
 
         except Exception as e:
             raise Exception(f"get_asin-Error: {str(e)}")
@@ -74,18 +111,70 @@ class AmazonScrapper:
             str: a URL that contains the reviews
 
         """
-        url = "https://www.amazon.in/dp/" + asin
+        url = BASE_URL + "/dp/" + asin
         try:
-            self.browser.get(url)
-            asin_html = self.browser.page_source
+            asin_html = self.get_page(url)
 
-            if "api-services-support@amazon.com" not in asin_html:
-                soup = bs(asin_html, 'html.parser')
-                for a in soup.find_all("a", {'data-hook': "see-all-reviews-link-foot"}):
-                    return a['href']
+            if CAPTCHA_MARKER not in asin_html:
+                with METRICS.time('parse', page='product'):
+                    return parse_review_link_page(asin_html)
         except Exception as e:
             raise Exception(f"get_asin_reviewlink: error - {str(e)}")
 
+    # Fetch a page, reusing pages already fetched in this run
+    def get_page(self, url):
+        """
+        Fetch a page with the fetcher, pages already fetched in this run are served from the page cache
+        Parameters:
+            url (str): the URL of the page
+
+        Returns:
+            str: The HTML content of the page
+
+        """
+        if url in self.page_cache:
+            self.page_cache.move_to_end(url)
+            METRICS.count('page_cache_hits')
+            return self.page_cache[url]
+        # Keep at least sleep_time seconds between requests
+        wait = self.last_request + self.sleep_time - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        page = self.fetcher(url)
+        self.last_request = time.monotonic()
+        # CAPTCHA pages are not cached so that the next request tries again
+        if CAPTCHA_MARKER not in page:
+            self.page_cache[url] = page
+            if len(self.page_cache) > self.page_cache_size:
+                self.page_cache.popitem(last=False)
+        else:
+            METRICS.count('captcha_hits')
+        return page
+
+    # Extract reviews and next page status
+    def get_review_page(self, review_link, page_nr):
+        """
+        Fetch and parse a review page once, extracting both its reviews and the next page status
+        Parameters:
+            review_link (str): A URL which contains the reviews
+            page_nr (int): page number
+
+        Returns:
+            tuple: (reviews, np_status) the list of reviews in the given URL and page number, and True if the
+            next page exists, otherwise False. Both are None if the page could not be read.
+
+        """
+        url = review_page_url(review_link, page_nr)
+        try:
+            page = self.get_page(url)
+            if CAPTCHA_MARKER not in page:
+                with METRICS.time('parse', page='review'):
+                    return parse_review_page(page, review_link)
+            return None, None
+
+        except Exception as e:
+            raise Exception(f"get_review_page: Error- {str(e)}")
+
     # Extract reviews
     def get_reviews(self, review_link, page_nr):
         """
@@ -98,53 +187,8 @@ class AmazonScrapper:
             list: A list of reviews in the given URL and page number
 
         """
-        reviews_list = []
-
-        url = "https://www.amazon.in" + review_link + '&pageNumber=' + str(page_nr)
-        # print(url)
         try:
-            self.browser.get(url)
-            page = self.browser.page_source
-            if "api-services-support@amazon.com" not in page:
-                soup = bs(page, 'html.parser')
-                reviews = soup.find_all('div', {'data-hook': 'review'})
-                for item in reviews:
-
-                    try:
-                        review_title = item.find('a', {'data-hook': 'review-title'}).text.split("\n")[1]
-                    except:
-                        review_title = 'no title'
-
-                    try:
-                        ratings = float(
-                            item.find('i', {'data-hook': 'review-star-rating'}).text.replace(' out of 5 stars', ''))
-                    except:
-                        ratings = 'no ratings'
-
-                    try:
-                        review_body = item.find('span', {'data-hook': 'review-body'}).text.strip()
-                    except:
-                        review_body = 'no review'
-
-                    try:
-                        ele1 = item.find('i', {'class': 'a-icon a-icon-text-separator'}).next_sibling
-                        ele2 = item.find('i', {'class': 'a-icon a-icon-text-separator'}).previous_sibling
-                        if "Size: " in ele1:
-                            size = ele1.replace("Size: ", "")
-                        elif "Size: " in ele2:
-                            size = ele2.replace("Size: ", "")
-                    except:
-                        size = 'no size'
-
-                    review = {'review_title': review_title,
-                              'ratings': ratings,
-                              'review_comment': review_body,
-                              'size': size,
-                              'asin': review_link.split("/")[3]}
-
-                    reviews_list.append(review)
-                return reviews_list
-
+            return self.get_review_page(review_link, page_nr)[0]
         except Exception as e:
             raise Exception(f"get_reviews: Error- {str(e)}")
 
@@ -160,20 +204,7 @@ class AmazonScrapper:
             bool: True or False. Returns False if next page does not exist, True if next page exists.
 
         """
-        url = "https://www.amazon.in" + review_link + '&pageNumber=' + str(page_nr)
-
         try:
-            self.browser.get(url)
-            page = self.browser.page_source
-
-            if "api-services-support@amazon.com" not in page:
-                soup = bs(page, 'html.parser')
-                if not soup.find('ul', {'class': 'a-pagination'}):
-                    return False
-                elif soup.find('li', {'class': 'a-disabled a-last'}):
-                    return False
-                else:
-                    return True
-
+            return self.get_review_page(review_link, page_nr)[1]
         except Exception as e:
             raise Exception(f"get_np_status: Error - {str(e)}")
@@ -0,0 +1,197 @@
+import json
+import os
+from MongoDBOperations import FINGERPRINT_FIELD, review_fingerprint
+
+
+CHECKPOINT_VERSION = 1
+
+# Fields identifying a review, the columns of Reviews.csv
+REVIEW_FIELDS = ['review_title', 'ratings', 'review_comment', 'size', 'asin']
+
+
+class KnownReviews:
+    """
+    Keys of the reviews already stored, used to leave them out of a crawl and to stop paging through an ASIN
+    once a page has nothing new.
+
+    Parameters:
+        keys (iterable): review fingerprints, see review_fingerprint (default is None)
+    """
+
+    def __init__(self, keys=None):
+        self.keys = set(keys or ())
+
+    @classmethod
+    def load(cls, collection, asins):
+        """
+        Loads the keys of the reviews of the ASINs stored in a collection
+        Parameters:
+            collection (Collection): the collection holding the reviews
+            asins (list): the ASIN numbers
+
+        Returns:
+            KnownReviews: the keys of the stored reviews
+
+        """
+        try:
+            projection = {field: 1 for field in REVIEW_FIELDS + [FINGERPRINT_FIELD]}
+            projection['_id'] = 0
+            return cls(doc.get(FINGERPRINT_FIELD) or review_fingerprint(doc)
+                       for doc in collection.find({'asin': {'$in': list(asins)}}, projection))
+        except Exception as e:
+            raise Exception(f"load: Failed to load the stored reviews - {str(e)}")
+
+    def __len__(self):
+        return len(self.keys)
+
+    def is_known(self, review):
+        return review_fingerprint(review) in self.keys
+
+    def new(self, reviews):
+        """
+        Returns the reviews that are not stored yet
+        Parameters:
+            reviews (list): scraped reviews
+
+        Returns:
+            list: the reviews that are not known
+
+        """
+        return [review for review in reviews if not self.is_known(review)]
+
+    def has_new(self, asin, page_nr, reviews):
+        """
+        Checks if paging through an ASIN should go on after a page, used as should_continue of
+        CrawlScheduler.crawl
+        Parameters:
+            asin (str): the ASIN number
+            page_nr (int): the page number
+            reviews (list): the reviews of the page
+
+        Returns:
+            bool: False if all the reviews of the page are already known, otherwise True
+
+        """
+        return not reviews or not all(self.is_known(review) for review in reviews)
+
+
+class CrawlCheckpoint:
+    """
+    State of a crawl saved after every review page, so that an interrupted run resumes with the same ASINs,
+    skipping the ASINs already crawled and the pages already written.
+
+    Parameters:
+        path (str): the checkpoint file
+        search_term (str): the search term of the crawl, a checkpoint of another search term is not resumed
+    """
+
+    def __init__(self, path, search_term):
+        """
+        Initialize the CrawlCheckpoint object
+        Parameters:
+            path (str): the checkpoint file
+            search_term (str): the search term of the crawl
+        """
+        self.path = path
+        self.state = {'version': CHECKPOINT_VERSION, 'search_term': search_term, 'asins': None,
+                      'review_links': {}, 'last_page': {}, 'done': []}
+
+    @classmethod
+    def open(cls, path, search_term):
+        """
+        Loads the checkpoint of an interrupted crawl of the search term, or creates a new one
+        Parameters:
+            path (str): the checkpoint file
+            search_term (str): the search term of the crawl
+
+        Returns:
+            CrawlCheckpoint: the checkpoint, resumed is True if it was loaded
+
+        """
+        checkpoint = cls(path, search_term)
+        if os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    state = json.load(f)
+            except Exception as e:
+                raise Exception(f"open: Failed to load the crawl checkpoint {path} - {str(e)}")
+            if state.get('version') == CHECKPOINT_VERSION and state.get('search_term') == search_term:
+                checkpoint.state = state
+        return checkpoint
+
+    @property
+    def resumed(self):
+        return self.state['asins'] is not None
+
+    @property
+    def asins(self):
+        return self.state['asins']
+
+    def save(self):
+        """
+        Writes the checkpoint, replacing the previous one only once it is fully written
+        """
+        try:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            raise Exception(f"save: Failed to save the crawl checkpoint {self.path} - {str(e)}")
+
+    def start(self, asins):
+        """
+        Starts a new crawl
+        Parameters:
+            asins (list): the ASIN numbers to crawl
+        """
+        self.state.update(asins=list(asins), review_links={}, last_page={}, done=[])
+        self.save()
+
+    def pending(self):
+        """
+        Returns the ASINs that are not fully crawled yet
+        """
+        done = set(self.state['done'])
+        return [asin for asin in self.state['asins'] if asin not in done]
+
+    def review_links(self):
+        """
+        Returns the review links found so far by ASIN
+        """
+        return dict(self.state['review_links'])
+
+    def start_pages(self):
+        """
+        Returns the page to resume each partly crawled ASIN from
+        """
+        return {asin: page_nr + 1 for asin, page_nr in self.state['last_page'].items()}
+
+    def record_page(self, asin, page_nr, review_link):
+        """
+        Records that the reviews of a page are stored
+        Parameters:
+            asin (str): the ASIN number
+            page_nr (int): the page number
+            review_link (str): the review link of the ASIN
+        """
+        self.state['review_links'][asin] = review_link
+        self.state['last_page'][asin] = page_nr
+        self.save()
+
+    def finish_asin(self, asin):
+        """
+        Records that the reviews of all the pages of an ASIN are stored
+        Parameters:
+            asin (str): the ASIN number
+        """
+        self.state['done'].append(asin)
+        self.state['last_page'].pop(asin, None)
+        self.save()
+
+    def clear(self):
+        """
+        Removes the checkpoint once the crawl is complete
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,310 @@
+import queue
+import random
+import threading
+import time
+from urllib.parse import urlparse
+from AmazonReviewScrap import BASE_URL, review_page_url
+from Fetchers import CAPTCHA_MARKER, default_fetcher
+from Metrics import METRICS, COUNT_BUCKETS
+from PageParsers import parse_review_link_page, parse_review_page
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket allowing rate requests per second on average, with bursts of up to burst requests.
+
+    Parameters:
+        rate (float): tokens added per second, None for no limit apart from the pauses
+        burst (int): maximum number of tokens held (default is 1)
+    """
+
+    def __init__(self, rate, burst=1):
+        """
+        Initialize the TokenBucket object
+        Parameters:
+            rate (float): tokens added per second, None for no limit apart from the pauses
+            burst (int): maximum number of tokens held (default is 1)
+        """
+        if rate is not None and rate <= 0:
+            raise ValueError("rate should be > 0")
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until a token is available and takes it
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if self.rate is None:
+                    if now >= self.paused_until:
+                        return
+                    wait = self.paused_until - now
+                else:
+                    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if now >= self.paused_until and self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """
+        Stops handing out tokens for the given number of seconds, e.g. after a CAPTCHA
+        Parameters:
+            seconds (float): length of the pause
+        """
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+class HostRateLimiter:
+    """
+    One token bucket per host, shared by all the fetch workers.
+
+    Parameters:
+        rate (float): requests per second allowed per host, None for no limit
+        burst (int): maximum burst of requests per host (default is 1)
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, url):
+        """
+        Returns the token bucket of the host of the URL
+        """
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate, self.burst)
+            return self.buckets[host]
+
+    def acquire(self, url):
+        self.bucket(url).acquire()
+
+    def pause(self, url, seconds):
+        self.bucket(url).pause(seconds)
+
+
+class CrawlScheduler:
+    """
+    Crawls the reviews of many ASINs with a pool of fetch workers. Each worker takes (asin, page) jobs from a
+    shared queue, every request waits for a token from the bucket of its host, and pages showing the CAPTCHA
+    pause that host and are retried with exponential backoff and jitter. The pages are yielded in ASIN order
+    and page order whatever order they were fetched in. The review link of each ASIN is kept in review_links.
+
+    Parameters:
+        fetcher_factory (callable): called once per worker, returns a callable fetching the HTML of a URL
+            (default is default_fetcher, pooled HTTP with Chrome as fallback)
+        workers (int): number of fetch workers (default is 2)
+        rate (float): requests per second allowed per host, None for no limit (default is 0.5)
+        burst (int): maximum burst of requests per host (default is 1)
+        max_retries (int): retries of a failing or CAPTCHA page before giving up on it (default is 3)
+        backoff (float): base delay in seconds before retrying a failed request (default is 2)
+        captcha_backoff (float): base pause in seconds of a host after a CAPTCHA page (default is 30)
+        base_url (str): the site root (default is https://www.amazon.in)
+        sort_by (str): review order of the pages, e.g. 'recent' for the newest reviews first (default is None,
+            Amazon's order)
+    """
+
+    def __init__(self, fetcher_factory=default_fetcher, workers=2, rate=0.5, burst=1, max_retries=3, backoff=2.0,
+                 captcha_backoff=30.0, base_url=BASE_URL, sort_by=None):
+        """
+        Initialize the CrawlScheduler object
+        """
+        self.fetcher_factory = fetcher_factory
+        self.workers = workers
+        self.limiter = HostRateLimiter(rate, burst)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.captcha_backoff = captcha_backoff
+        self.base_url = base_url
+        self.sort_by = sort_by
+        self.review_links = {}
+        self.stats = {'requests': 0, 'captcha_hits': 0, 'errors': 0, 'failed_pages': 0, 'duplicate_reviews': 0,
+                      'early_stops': 0}
+        self.stats_lock = threading.Lock()
+
+    def _count(self, key, n=1):
+        with self.stats_lock:
+            self.stats[key] += n
+
+    def fetch(self, fetcher, url):
+        """
+        Fetches a page within the host rate limit, retrying errors and CAPTCHA pages
+        Parameters:
+            fetcher (callable): the fetcher of the worker
+            url (str): the URL of the page
+
+        Returns:
+            str: The HTML content of the page, None if it could not be fetched
+
+        """
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(url)
+            self._count('requests')
+            try:
+                page = fetcher(url)
+            except Exception:
+                self._count('errors')
+                time.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+                continue
+            if CAPTCHA_MARKER not in page:
+                return page
+            self._count('captcha_hits')
+            METRICS.count('captcha_hits')
+            self.limiter.pause(url, self.captcha_backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+        self._count('failed_pages')
+        return None
+
+    def _handle(self, fetcher, job):
+        asin, link, page_nr = job
+        if link is None:
+            page = self.fetch(fetcher, self.base_url + "/dp/" + asin)
+            link = None
+            if page is not None:
+                with METRICS.time('parse', page='product'):
+                    link = parse_review_link_page(page)
+            if link is None:
+                self._finish(asin, 0)
+            else:
+                self.review_links[asin] = link
+                self._submit((asin, link, self.start_pages.get(asin, 1)))
+            return
+
+        page = self.fetch(fetcher, review_page_url(link, page_nr, self.base_url, self.sort_by))
+        if page is None:
+            self._store(asin, page_nr, [])
+            self._finish(asin, page_nr)
+            return
+        with METRICS.time('parse', page='review'):
+            reviews, np_status = parse_review_page(page, link)
+        METRICS.count('reviews_scraped', len(reviews))
+        self._store(asin, page_nr, reviews)
+        if np_status and self.should_continue is not None:
+            try:
+                keep_paging = self.should_continue(asin, page_nr, reviews)
+            except Exception:
+                # The reviews of the page are stored already, only the paging through the ASIN stops
+                self._count('errors')
+                keep_paging = False
+            else:
+                if not keep_paging:
+                    self._count('early_stops')
+            np_status = keep_paging
+        if np_status:
+            self._submit((asin, link, page_nr + 1))
+        else:
+            self._finish(asin, page_nr)
+
+    def _submit(self, job):
+        key = (job[0], job[2])
+        with self.condition:
+            if key in self.submitted:
+                return
+            self.submitted.add(key)
+        self.jobs.put(job)
+
+    def _store(self, asin, page_nr, reviews):
+        with self.condition:
+            self.pages[asin][page_nr] = reviews
+            self.condition.notify_all()
+
+    def _finish(self, asin, last_page):
+        METRICS.observe('pages_per_asin', max(last_page - self.start_pages.get(asin, 1) + 1, 0), buckets=COUNT_BUCKETS)
+        with self.condition:
+            self.last_page[asin] = last_page
+            self.condition.notify_all()
+
+    def _worker(self):
+        fetcher = self.fetcher_factory()
+        try:
+            while not self.stopped.is_set():
+                job = self.jobs.get()
+                if job is None:
+                    break
+                try:
+                    self._handle(fetcher, job)
+                except Exception:
+                    self._count('errors')
+                    self._count('failed_pages')
+                    self._store(job[0], job[2], [])
+                    self._finish(job[0], job[2])
+        finally:
+            if hasattr(fetcher, 'close'):
+                fetcher.close()
+
+    def crawl(self, asins, review_links=None, start_pages=None, should_continue=None, on_asin_done=None):
+        """
+        Crawls all the review pages of the ASINs
+        Parameters:
+            asins (list): the ASIN numbers, repeated ASINs are crawled once
+            review_links (dict): already known review links by ASIN, the product page of the others is
+                fetched to find their review link (default is None)
+            start_pages (dict): page to start from by ASIN, e.g. to resume a crawl (default is None, page 1)
+            should_continue (callable): called with (asin, page_nr, reviews) after every page that has a next
+                page, paging through the ASIN stops when it returns False (default is None, crawl all pages)
+            on_asin_done (callable): called with the ASIN once its last page has been consumed (default is None)
+
+        Returns:
+            generator: (asin, page_nr, reviews) for every review page, in ASIN and page order, reviews already
+            yielded for the same ASIN are left out
+
+        """
+        asins = list(dict.fromkeys(asins))
+        self.review_links = dict(review_links or {})
+        self.start_pages = start_pages or {}
+        self.should_continue = should_continue
+        self.jobs = queue.Queue()
+        self.condition = threading.Condition()
+        self.stopped = threading.Event()
+        self.submitted = set()
+        self.pages = {asin: {} for asin in asins}
+        self.last_page = {}
+
+        threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for asin in asins:
+            link = self.review_links.get(asin)
+            self._submit((asin, link, 0 if link is None else self.start_pages.get(asin, 1)))
+        try:
+            for asin in asins:
+                seen = set()
+                page_nr = self.start_pages.get(asin, 1)
+                while True:
+                    with self.condition:
+                        self.condition.wait_for(lambda: page_nr in self.pages[asin]
+                                                or self.last_page.get(asin, page_nr) < page_nr)
+                        if page_nr not in self.pages[asin]:
+                            break
+                        reviews = self.pages[asin].pop(page_nr)
+                    unique = []
+                    for review in reviews:
+                        key = tuple(sorted(review.items()))
+                        if key in seen:
+                            self._count('duplicate_reviews')
+                        else:
+                            seen.add(key)
+                            unique.append(review)
+                    yield asin, page_nr, unique
+                    page_nr += 1
+                if on_asin_done is not None:
+                    on_asin_done(asin)
+        finally:
+            self.stopped.set()
+            for _ in threads:
+                self.jobs.put(None)
+            for thread in threads:
+                thread.join()
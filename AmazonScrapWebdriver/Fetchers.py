@@ -0,0 +1,157 @@
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from Metrics import METRICS
+
+
+logger = logging.getLogger(__name__)
+
+CAPTCHA_MARKER = "api-services-support@amazon.com"
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+                  "Chrome/124.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
+    "Accept-Language": "en-IN,en-GB;q=0.9,en-US;q=0.8,en;q=0.7",
+    "Accept-Encoding": "gzip, deflate",
+    "Connection": "keep-alive",
+    "Upgrade-Insecure-Requests": "1",
+}
+
+# Text of the pages that plain HTTP clients get instead of the real page
+BROWSER_ONLY_MARKERS = (CAPTCHA_MARKER, "/errors/validateCaptcha")
+
+
+class HttpFetcher:
+    """
+    Fetches pages with a keep-alive requests session, reusing pooled connections and accepting compressed
+    responses.
+
+    Parameters:
+        pool_size (int): connections kept per host (default is 10)
+        timeout (float): request timeout in seconds (default is 20)
+        headers (dict): request headers (default is DEFAULT_HEADERS)
+    """
+    name = 'http'
+
+    def __init__(self, pool_size=10, timeout=20, headers=None):
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(headers or DEFAULT_HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def __call__(self, url):
+        try:
+            with METRICS.time('fetch', backend=self.name):
+                response = self.session.get(url, timeout=self.timeout)
+                response.raise_for_status()
+            return response.text
+        except Exception as e:
+            raise Exception(f"HttpFetcher: could not fetch {url} - {str(e)}")
+
+    def close(self):
+        self.session.close()
+
+
+class SeleniumFetcher:
+    """
+    Fetches pages with a Chrome browser, which is only started on the first request.
+    """
+    name = 'selenium'
+
+    def __init__(self):
+        self.browser = None
+
+    def __call__(self, url):
+        try:
+            if self.browser is None:
+                with METRICS.time('browser_start'):
+                    from selenium import webdriver
+                    self.browser = webdriver.Chrome()
+            with METRICS.time('fetch', backend=self.name):
+                self.browser.get(url)
+                page = self.browser.page_source
+            return page
+        except Exception as e:
+            raise Exception(f"SeleniumFetcher: could not fetch {url} - {str(e)}")
+
+    def close(self):
+        if self.browser is not None:
+            self.browser.quit()
+            self.browser = None
+
+
+def needs_browser(page):
+    """
+    Checks if a page fetched over plain HTTP has to be fetched again with the browser
+    Parameters:
+        page (str): The HTML content of the page
+
+    Returns:
+        bool: True if the page is a CAPTCHA or needs JavaScript, otherwise False
+
+    """
+    return any(marker in page for marker in BROWSER_ONLY_MARKERS)
+
+
+class FallbackFetcher:
+    """
+    Fetches pages with a primary fetcher and only goes to the fallback fetcher for the pages the primary one
+    cannot get, i.e. when it fails or returns a page for which needs_browser is True. The backend used for
+    every page is logged and counted.
+
+    Parameters:
+        primary (callable): the fetcher tried first (default is HttpFetcher())
+        fallback (callable): the fetcher used for pages the primary one cannot get (default is SeleniumFetcher())
+        needs_fallback (callable): checks a page returned by the primary fetcher (default is needs_browser)
+    """
+
+    def __init__(self, primary=None, fallback=None, needs_fallback=needs_browser):
+        self.primary = primary if primary is not None else HttpFetcher()
+        self.fallback = fallback if fallback is not None else SeleniumFetcher()
+        self.needs_fallback = needs_fallback
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def _record(self, url, backend):
+        with self.lock:
+            self.counts[backend] = self.counts.get(backend, 0) + 1
+        METRICS.count('pages_fetched', backend=backend)
+        logger.info("fetched %s with %s", url, backend)
+
+    def __call__(self, url):
+        try:
+            page = self.primary(url)
+            if not self.needs_fallback(page):
+                self._record(url, getattr(self.primary, 'name', 'primary'))
+                return page
+        except Exception as e:
+            logger.warning("primary fetch of %s failed, falling back - %s", url, str(e))
+        METRICS.count('fetch_fallbacks')
+        page = self.fallback(url)
+        self._record(url, getattr(self.fallback, 'name', 'fallback'))
+        return page
+
+    def fallback_rate(self):
+        """
+        Returns the share of pages that needed the fallback fetcher
+        """
+        with self.lock:
+            total = sum(self.counts.values())
+            fallback = self.counts.get(getattr(self.fallback, 'name', 'fallback'), 0)
+        return fallback / total if total else 0.0
+
+    def close(self):
+        for fetcher in (self.primary, self.fallback):
+            if hasattr(fetcher, 'close'):
+                fetcher.close()
+
+
+def default_fetcher():
+    """
+    Returns the default fetcher: pooled HTTP, with the browser only for CAPTCHA or JavaScript pages
+    """
+    return FallbackFetcher(HttpFetcher(), SeleniumFetcher())
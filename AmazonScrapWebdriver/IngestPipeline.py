@@ -0,0 +1,186 @@
+import csv
+import logging
+import queue
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# Tells the writer thread that no more pages are coming
+_CLOSE = object()
+
+
+class CsvSink:
+    """
+    Appends reviews to a CSV file, writing the header only when the file is new.
+
+    Parameters:
+        path (str): the CSV file
+        fieldnames (list): the columns
+    """
+
+    def __init__(self, path, fieldnames):
+        self.file = open(path, 'a', encoding="utf-8", newline="")
+        self.writer = csv.DictWriter(self.file, fieldnames=fieldnames)
+        if self.file.tell() == 0:
+            self.writer.writeheader()
+
+    def __call__(self, reviews):
+        self.writer.writerows(reviews)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class IngestPipeline:
+    """
+    Streams scraped review pages into MongoDB. The crawl puts pages into a bounded queue and a writer thread
+    upserts them in batches, see MongoDBOps.upsert_reviews. When the database falls behind the queue fills up
+    and put blocks the crawl until there is room again. The callback of a page, e.g. recording it in the crawl
+    checkpoint, only runs once its reviews are stored, so an interrupted run resumes from the last stored page;
+    as the upserts are idempotent, pages stored again after a resume create no duplicates.
+
+    Parameters:
+        mongo_ops (MongoDBOps): the MongoDB operations object
+        db_name (str): name of the database
+        collection_name (str): name of the collection holding the reviews
+        batch_size (int): number of reviews stored per bulk write (default is 500)
+        max_pending_pages (int): number of pages the queue holds before put blocks (default is 16)
+        flush_interval (float): seconds after which a batch is written even if it is not full (default is 2)
+        sinks (list): callables also given every stored batch of reviews, e.g. a CsvSink (default is None)
+        max_retries (int): retries of a failing bulk write before the pipeline stops (default is 3)
+    """
+
+    def __init__(self, mongo_ops, db_name, collection_name, batch_size=500, max_pending_pages=16,
+                 flush_interval=2.0, sinks=None, max_retries=3):
+        """
+        Initialize the IngestPipeline object
+        """
+        self.mongo_ops = mongo_ops
+        self.db_name = db_name
+        self.collection_name = collection_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sinks = list(sinks or [])
+        self.max_retries = max_retries
+        self.queue = queue.Queue(maxsize=max_pending_pages)
+        self.error = None
+        self.stats = {'pages': 0, 'reviews': 0, 'batches': 0, 'inserted': 0, 'matched': 0, 'skipped': 0,
+                      'backpressure_waits': 0, 'blocked_seconds': 0.0}
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Pages already queued are still stored when the crawl stops on an error or an interruption
+        self.close(raise_error=exc_type is None)
+
+    def _put(self, item):
+        try:
+            self.queue.put_nowait(item)
+            return
+        except queue.Full:
+            pass
+        self.stats['backpressure_waits'] += 1
+        start = time.monotonic()
+        while True:
+            if self.error is not None:
+                raise Exception(f"put: the pipeline stopped - {str(self.error)}")
+            try:
+                self.queue.put(item, timeout=0.5)
+                break
+            except queue.Full:
+                continue
+        self.stats['blocked_seconds'] += time.monotonic() - start
+
+    def put(self, reviews, on_stored=None):
+        """
+        Queues the reviews of a page, blocking while the queue is full
+        Parameters:
+            reviews (list): the reviews of the page, may be empty
+            on_stored (callable): called without arguments once the reviews are stored (default is None)
+        """
+        if self.error is not None:
+            raise Exception(f"put: the pipeline stopped - {str(self.error)}")
+        self._put((reviews, on_stored))
+
+    def _store(self, reviews):
+        for attempt in range(self.max_retries + 1):
+            try:
+                # upsert_reviews adds the fingerprint to the documents it is given, the sinks get the scraped fields
+                return self.mongo_ops.upsert_reviews(db_name=self.db_name, collection_name=self.collection_name,
+                                                     source=[dict(review) for review in reviews])
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning("storing %d reviews failed, retrying - %s", len(reviews), str(e))
+                time.sleep(2 ** attempt)
+
+    def _flush(self, reviews, callbacks):
+        if reviews:
+            counts = self._store(reviews)
+            for key in ('inserted', 'matched', 'skipped'):
+                self.stats[key] += counts[key]
+            self.stats['batches'] += 1
+            self.stats['reviews'] += len(reviews)
+            for sink in self.sinks:
+                sink(reviews)
+        for callback in callbacks:
+            if callback is not None:
+                callback()
+        self.stats['pages'] += len(callbacks)
+
+    def _run(self):
+        reviews, callbacks = [], []
+        deadline = None
+        try:
+            while True:
+                timeout = None if not callbacks else max(0.0, deadline - time.monotonic())
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+                if item is _CLOSE:
+                    break
+                if item is not None:
+                    if not callbacks:
+                        deadline = time.monotonic() + self.flush_interval
+                    reviews.extend(item[0])
+                    callbacks.append(item[1])
+                    if len(reviews) < self.batch_size:
+                        continue
+                self._flush(reviews, callbacks)
+                reviews, callbacks = [], []
+            self._flush(reviews, callbacks)
+        except Exception as e:
+            # A put waiting for room raises at its next check instead of queueing a page that is never stored
+            logger.error("the ingest pipeline stopped - %s", str(e))
+            self.error = e
+
+    def close(self, raise_error=True):
+        """
+        Stores the queued pages and stops the writer thread
+        Parameters:
+            raise_error (bool): raise if the pipeline stopped on an error (default is True)
+
+        Returns:
+            dict: the pipeline stats
+
+        """
+        if self.thread.is_alive() and self.error is None:
+            try:
+                self._put(_CLOSE)
+            except Exception:
+                pass
+        self.thread.join()
+        for sink in self.sinks:
+            if hasattr(sink, 'close'):
+                sink.close()
+        self.sinks = []
+        if raise_error and self.error is not None:
+            raise Exception(f"close: the pipeline stopped - {str(self.error)}")
+        return self.stats
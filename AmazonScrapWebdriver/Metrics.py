@@ -0,0 +1,313 @@
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Upper bounds of the buckets of histograms of counts, e.g. pages per ASIN
+COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+# Error categories by the class name of the original exception or of one of its base classes
+ERROR_CATEGORIES = (
+    ('timeout', ('TimeoutError', 'Timeout', 'TimeoutException', 'ServerSelectionTimeoutError',
+                 'ExecutionTimeout', 'NetworkTimeout')),
+    ('connection', ('ConnectionError', 'ConnectionFailure', 'AutoReconnect', 'WebDriverException')),
+    ('http', ('HTTPError',)),
+    ('duplicate', ('DuplicateKeyError',)),
+    ('database', ('OperationFailure', 'BulkWriteError', 'PyMongoError')),
+    ('data', ('ValueError', 'KeyError', 'TypeError', 'IndexError', 'AttributeError', 'UnicodeError',
+              'InvalidDocument', 'BSONError')),
+)
+
+
+def error_category(exc):
+    """
+    Returns the category of an error. The methods of this project wrap errors into a bare Exception carrying
+    the message, so the category is taken from the original exception, found through the exception chain.
+    Parameters:
+        exc (BaseException): the error
+
+    Returns:
+        str: one of the ERROR_CATEGORIES, or 'other'
+
+    """
+    seen = set()
+    while id(exc) not in seen:
+        seen.add(id(exc))
+        cause = exc.__cause__ or exc.__context__
+        if cause is None:
+            break
+        exc = cause
+    names = {cls.__name__ for cls in type(exc).__mro__}
+    for category, class_names in ERROR_CATEGORIES:
+        if names.intersection(class_names):
+            return category
+    return 'other'
+
+
+class Histogram:
+    """
+    Counts of observed values per bucket, with their sum, as in a Prometheus histogram.
+
+    Parameters:
+        buckets (tuple): increasing upper bounds of the buckets, values above the last one go to +Inf
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """
+        Returns the upper bound of the bucket holding the q quantile, None for the +Inf bucket
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+    def to_dict(self):
+        return {'count': self.count, 'sum': self.sum, 'mean': self.sum / self.count if self.count else None,
+                'p50': self.quantile(0.5), 'p95': self.quantile(0.95), 'p99': self.quantile(0.99),
+                'buckets': dict(zip([str(bound) for bound in self.buckets] + ['+Inf'], self.counts))}
+
+
+class _Timer:
+    __slots__ = ('metrics', 'stage', 'labels', 'start')
+
+    def __init__(self, metrics, stage, labels):
+        self.metrics = metrics
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.observe(self.stage + '_seconds', time.perf_counter() - self.start, **self.labels)
+        if exc_value is not None:
+            self.metrics.error(self.stage, exc_value, **self.labels)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """
+    Per stage latency histograms, counters and error categories of a run, exported at the end of the run as
+    a JSON summary and a Prometheus text file. While disabled every call returns at once, so the
+    instrumentation can stay in the hot paths.
+
+    Parameters:
+        enabled (bool): record the calls (default is False)
+        prefix (str): prefix of the exported metric names (default is 'review_pipeline')
+    """
+
+    def __init__(self, enabled=False, prefix='review_pipeline'):
+        self.enabled = enabled
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        # Stages of the timed functions running on each thread
+        self.local = threading.local()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+
+    def time(self, stage, **labels):
+        """
+        Returns a context manager recording the latency of a stage in the <stage>_seconds histogram, and the
+        category of an error raised inside it in the <stage>_errors counter
+        Parameters:
+            stage (str): the stage, e.g. 'fetch'
+            labels: labels of the measurement, e.g. backend='http'
+
+        Returns:
+            context manager: the timer
+
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, stage, labels)
+
+    def timed(self, stage, **labels):
+        """
+        Decorator recording every call of a function like time. A call made inside a timed function of the same
+        stage, e.g. bulk_load called by df_to_collection, is left to the outer one, so that its time and errors
+        are recorded once.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                running = self.local.__dict__.setdefault('stages', set())
+                if stage in running:
+                    return func(*args, **kwargs)
+                running.add(stage)
+                try:
+                    with _Timer(self, stage, labels):
+                        return func(*args, **kwargs)
+                finally:
+                    running.discard(stage)
+            return wrapper
+        return decorator
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        """
+        Adds a value to a histogram
+        Parameters:
+            name (str): the histogram
+            value (float): the value
+            buckets (tuple): bucket upper bounds of a new histogram (default is LATENCY_BUCKETS)
+            labels: labels of the value
+        """
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def count(self, name, value=1, **labels):
+        """
+        Adds to a counter
+        Parameters:
+            name (str): the counter, e.g. 'captcha_hits'
+            value (float): the amount added (default is 1)
+            labels: labels of the counter
+        """
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def error(self, stage, exc, **labels):
+        """
+        Counts an error of a stage in the <stage>_errors counter, labelled with its category
+        """
+        self.count(stage + '_errors', category=error_category(exc), **labels)
+
+    def summary(self):
+        """
+        Returns the recorded metrics
+        Returns:
+            dict: 'histograms' and 'counters', lists of entries with their name, labels and values
+
+        """
+        with self.lock:
+            histograms = [dict(name=name, labels=dict(labels), **histogram.to_dict())
+                          for (name, labels), histogram in sorted(self.histograms.items())]
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self.counters.items())]
+        return {'histograms': histograms, 'counters': counters}
+
+    def to_prometheus(self):
+        """
+        Returns the recorded metrics in the Prometheus text exposition format, counters get the _total suffix
+        """
+        lines = []
+        summary = self.summary()
+        declared = set()
+        for entry in summary['histograms']:
+            name = f"{self.prefix}_{entry['name']}"
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in entry['buckets'].items():
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(entry['labels'], le=bound)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(entry['labels'])} {entry['sum']}")
+            lines.append(f"{name}_count{_labels(entry['labels'])} {entry['count']}")
+        for entry in summary['counters']:
+            name = f"{self.prefix}_{entry['name']}_total"
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_labels(entry['labels'])} {entry['value']}")
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path):
+        """
+        Writes the JSON summary of the run
+        Parameters:
+            path (str): the file to write
+        """
+        try:
+            _write(path, json.dumps(self.summary(), indent=1))
+        except Exception as e:
+            raise Exception(f"write_json: Failed to write the metrics to {path} - {str(e)}")
+
+    def write_prometheus(self, path):
+        """
+        Writes the metrics in the Prometheus text format, e.g. for the node exporter textfile collector
+        Parameters:
+            path (str): the file to write
+        """
+        try:
+            _write(path, self.to_prometheus())
+        except Exception as e:
+            raise Exception(f"write_prometheus: Failed to write the metrics to {path} - {str(e)}")
+
+
+def _labels(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+
+def _write(path, text):
+    # Readers such as the textfile collector never see a partly written file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+# Metrics of the run shared by the scraper, database and analysis modules, enabled by setting PIPELINE_METRICS
+METRICS = Metrics(enabled=os.environ.get('PIPELINE_METRICS', '') not in ('', '0'))
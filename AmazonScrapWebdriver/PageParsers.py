@@ -0,0 +1,178 @@
+import lxml.html
+
+
+# XPath equivalents of the BeautifulSoup lookups the scraper used, tests/test_page_parsers.py checks that both
+# give the same results on the pages of tests/fixtures
+_REVIEWS = "//div[@data-hook='review']"
+_TITLE = ".//a[@data-hook='review-title']"
+_STARS = ".//i[@data-hook='review-star-rating']"
+_BODY = ".//span[@data-hook='review-body']"
+_SEPARATOR = ".//i[normalize-space(@class)='a-icon a-icon-text-separator']"
+_PAGINATION = "//ul[contains(concat(' ', normalize-space(@class), ' '), ' a-pagination ')]"
+_LAST_DISABLED = "//li[normalize-space(@class)='a-disabled a-last']"
+_SEARCH_RESULTS = "//div[@data-component-type='s-search-result']"
+_REVIEW_LINK = "//a[@data-hook='see-all-reviews-link-foot']"
+# BeautifulSoup's .text leaves out the content of script, style and template tags
+_TEXT = ".//text()[not(ancestor::script or ancestor::style or ancestor::template)]"
+
+
+def parse_html(page):
+    """
+    Parse a page with the lxml HTML parser
+    Parameters:
+        page (str): The HTML content of the page
+
+    Returns:
+        lxml element: the root of the document
+
+    """
+    try:
+        return lxml.html.document_fromstring(page)
+    except ValueError:
+        # lxml refuses str input that carries an XML encoding declaration
+        return lxml.html.document_fromstring(page.encode("utf-8"))
+
+
+def _first(element, path):
+    found = element.xpath(path)
+    return found[0] if found else None
+
+
+def _text(element):
+    return "".join(element.xpath(_TEXT))
+
+
+def _next_sibling(element):
+    """
+    Returns what BeautifulSoup's next_sibling gives: the text right after the element, otherwise the next
+    element (as an empty tuple, in which no text is found) or None
+    """
+    if element.tail:
+        return element.tail
+    return () if element.getnext() is not None else None
+
+
+def _previous_sibling(element):
+    """
+    Returns what BeautifulSoup's previous_sibling gives: the text right before the element, otherwise the
+    previous element (as an empty tuple, in which no text is found) or None
+    """
+    previous = element.getprevious()
+    if previous is not None:
+        return previous.tail if previous.tail else ()
+    parent = element.getparent()
+    return parent.text if parent is not None and parent.text else None
+
+
+def extract_reviews(root, review_link):
+    """
+    Extract the reviews from a review page parsed with parse_html, with the same fallbacks as the BeautifulSoup
+    parser it replaces
+    Parameters:
+        root (lxml element): the parsed review page
+        review_link (str): the review link of the page, used for the asin
+
+    Returns:
+        list: A list of reviews in the page
+
+    """
+    reviews_list = []
+    asin = None
+    for item in root.xpath(_REVIEWS):
+
+        try:
+            review_title = _text(_first(item, _TITLE)).split("\n")[1]
+        except:
+            review_title = 'no title'
+
+        try:
+            ratings = float(_text(_first(item, _STARS)).replace(' out of 5 stars', ''))
+        except:
+            ratings = 'no ratings'
+
+        try:
+            review_body = _text(_first(item, _BODY)).strip()
+        except:
+            review_body = 'no review'
+
+        try:
+            separator = _first(item, _SEPARATOR)
+            ele1 = _next_sibling(separator)
+            ele2 = _previous_sibling(separator)
+            if "Size: " in ele1:
+                size = ele1.replace("Size: ", "")
+            elif "Size: " in ele2:
+                size = ele2.replace("Size: ", "")
+        except:
+            size = 'no size'
+
+        if asin is None:
+            asin = review_link.split("/")[3]
+        review = {'review_title': review_title,
+                  'ratings': ratings,
+                  'review_comment': review_body,
+                  'size': size,
+                  'asin': asin}
+
+        reviews_list.append(review)
+    return reviews_list
+
+
+def extract_np_status(root):
+    """
+    Get next page status from a review page parsed with parse_html
+    Parameters:
+        root (lxml element): the parsed review page
+
+    Returns:
+        bool: True or False. Returns False if next page does not exist, True if next page exists.
+
+    """
+    if not root.xpath(_PAGINATION):
+        return False
+    elif root.xpath(_LAST_DISABLED):
+        return False
+    else:
+        return True
+
+
+def parse_review_page(page, review_link):
+    """
+    Parse a review page once and extract its reviews and next page status
+    Parameters:
+        page (str): The HTML content of the review page
+        review_link (str): the review link of the page, used for the asin
+
+    Returns:
+        tuple: (reviews, np_status)
+
+    """
+    root = parse_html(page)
+    return extract_reviews(root, review_link), extract_np_status(root)
+
+
+def parse_asins(page):
+    """
+    Extract the ASIN numbers from a search result page
+    Parameters:
+        page (str): The HTML content of the search result page
+
+    Returns:
+        list: A list of ASIN numbers
+
+    """
+    return [item.attrib['data-asin'] for item in parse_html(page).xpath(_SEARCH_RESULTS)]
+
+
+def parse_review_link_page(page):
+    """
+    Extract the link to all the reviews from a product page
+    Parameters:
+        page (str): The HTML content of the product page
+
+    Returns:
+        str: a URL that contains the reviews, None if the page has no review link
+
+    """
+    link = _first(parse_html(page), _REVIEW_LINK)
+    return link.attrib['href'] if link is not None else None
@@ -0,0 +1,91 @@
+## The BeautifulSoup parsers the scraper used before PageParsers, kept as the reference of its tests and of
+## benchmark_parsing.py
+
+from bs4 import BeautifulSoup as bs
+
+
+def parse_review_link(soup):
+    """
+    Returns the link to all the reviews of a product page
+    """
+    for a in soup.find_all("a", {'data-hook': "see-all-reviews-link-foot"}):
+        return a['href']
+
+
+def parse_reviews(soup, review_link):
+    """
+    Returns the reviews of a review page
+    """
+    reviews_list = []
+    reviews = soup.find_all('div', {'data-hook': 'review'})
+    for item in reviews:
+
+        try:
+            review_title = item.find('a', {'data-hook': 'review-title'}).text.split("\n")[1]
+        except:
+            review_title = 'no title'
+
+        try:
+            ratings = float(
+                item.find('i', {'data-hook': 'review-star-rating'}).text.replace(' out of 5 stars', ''))
+        except:
+            ratings = 'no ratings'
+
+        try:
+            review_body = item.find('span', {'data-hook': 'review-body'}).text.strip()
+        except:
+            review_body = 'no review'
+
+        try:
+            ele1 = item.find('i', {'class': 'a-icon a-icon-text-separator'}).next_sibling
+            ele2 = item.find('i', {'class': 'a-icon a-icon-text-separator'}).previous_sibling
+            if "Size: " in ele1:
+                size = ele1.replace("Size: ", "")
+            elif "Size: " in ele2:
+                size = ele2.replace("Size: ", "")
+        except:
+            size = 'no size'
+
+        review = {'review_title': review_title,
+                  'ratings': ratings,
+                  'review_comment': review_body,
+                  'size': size,
+                  'asin': review_link.split("/")[3]}
+
+        reviews_list.append(review)
+    return reviews_list
+
+
+def parse_np_status(soup):
+    """
+    Returns True if the review page has a next page
+    """
+    if not soup.find('ul', {'class': 'a-pagination'}):
+        return False
+    elif soup.find('li', {'class': 'a-disabled a-last'}):
+        return False
+    else:
+        return True
+
+
+def parse_asins(soup):
+    """
+    Returns the ASINs of a search page
+    """
+    return [item['data-asin'] for item in soup.find_all('div', {'data-component-type': 's-search-result'})]
+
+
+def parse_review_page(page, review_link):
+    """
+    Parse a review page with html.parser and extract its reviews and next page status, as
+    PageParsers.parse_review_page
+    Parameters:
+        page (str): The HTML content of the review page
+        review_link (str): the review link of the page, used for the asin
+
+    Returns:
+        tuple: (reviews, np_status)
+
+    """
+    soup = bs(page, 'html.parser')
+    return parse_reviews(soup, review_link), parse_np_status(soup)
@@ -1,44 +1,86 @@
 from AmazonReviewScrap import AmazonScrapper
-import csv
-import pandas as pd
+import logging
+from functools import partial
 from MongoDBOperations import MongoDBOps
+from CrawlScheduler import CrawlScheduler
+from CrawlCheckpoint import CrawlCheckpoint, KnownReviews, REVIEW_FIELDS
+from IngestPipeline import IngestPipeline, CsvSink
+from Metrics import METRICS
+
+# Number of workers fetching review pages in parallel
+CRAWL_WORKERS = 2
+
+# Crawl state, a page is recorded once its reviews are stored so that an interrupted run resumes from there
+CHECKPOINT_PATH = "crawl_checkpoint.json"
+
+# Incremental mode reads the reviews newest first and stops paging through an ASIN at the first page that only
+# has reviews already in the collection
+INCREMENTAL = True
+
+# The stored reviews are also appended to the CSV file, None to only store them in MongoDB
+REVIEWS_CSV = "Reviews.csv"
+
+# Reviews stored per bulk write, and pages waiting to be stored before the crawl is held back
+WRITE_BATCH = 500
+MAX_PENDING_PAGES = 16
+
+# Stage timings, counts and error categories of the run, written at the end of the run as JSON and in the
+# Prometheus text format. Setting PIPELINE_METRICS also enables them.
+COLLECT_METRICS = True
+METRICS_JSON = "run_metrics.json"
+METRICS_PROM = "run_metrics.prom"
+
+# Logs the fetch backend (http or selenium) used for every page
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+
+if COLLECT_METRICS:
+    METRICS.enable()
 
 search_term = input("Enter keywords separated with +: ")
 ob = AmazonScrapper(search_term)
-asins = ob.get_asin()
-
-
-# For each ASIN extract reviews
-
-output_review = open("Reviews.csv", 'a', encoding="utf-8", newline="")
-writer = csv.DictWriter(output_review, fieldnames=['review_title', 'ratings', 'review_comment', 'size', 'asin'])
-writer.writeheader()
-
-for i in range(len(asins)):
-    link = ob.get_asin_reviewlink(asin=asins[i])
-    if link is not None:
-        #print(link)
-        page_nr = 1
-        while page_nr > 0:
-            reviews = ob.get_reviews(review_link=link, page_nr=page_nr)
-            np_status = ob.get_np_status(review_link=link, page_nr=page_nr)
-            if reviews:
-                writer.writerows(reviews)
-                #print(reviews)
-
-            if np_status:
-                page_nr += 1
-            else:
-                break
-
-# Transfer data from csv to mongoDB database
-df_rev = pd.read_csv('Reviews.csv', sep=",")
-df_rev.drop_duplicates(inplace=True)
 mongo_client = MongoDBOps(username="ABC", pwd='XYZ')
 db_name = 'Neemai'
 collection_name = 'maternity_wear'
-mongo_client.df_to_collection(db_name=db_name, collection_name=collection_name, df=df_rev)
 
+checkpoint = CrawlCheckpoint.open(CHECKPOINT_PATH, search_term)
+try:
+    if checkpoint.resumed:
+        logging.info("resuming the crawl of %d ASINs", len(checkpoint.pending()))
+    else:
+        checkpoint.start(ob.get_asin())
+finally:
+    # The search page is the only page fetched by ob, the crawl workers have fetchers of their own
+    ob.close()
+
+# Reviews already in the collection are not stored again
+known = KnownReviews.load(mongo_client.get_collection(collection_name=collection_name, db_name=db_name),
+                          checkpoint.asins)
 
+# The n-gram summaries of ReviewDataAnalysis/ngram_sketch.py are updated from the collection by the analysis
+sinks = [CsvSink(REVIEWS_CSV, REVIEW_FIELDS)] if REVIEWS_CSV else []
 
+# Crawl the review pages of all the ASINs with a pool of fetchers, within the per host request rate, and stream
+# the new reviews of every page to MongoDB
+# A sleep_time of 0 turns the throttling off
+scheduler = CrawlScheduler(workers=CRAWL_WORKERS, rate=1 / ob.sleep_time if ob.sleep_time else None,
+                           sort_by='recent' if INCREMENTAL else None)
+try:
+    with IngestPipeline(mongo_client, db_name, collection_name, batch_size=WRITE_BATCH,
+                        max_pending_pages=MAX_PENDING_PAGES, sinks=sinks) as pipeline:
+        pages = scheduler.crawl(checkpoint.pending(), review_links=checkpoint.review_links(),
+                                start_pages=checkpoint.start_pages(),
+                                should_continue=known.has_new if INCREMENTAL else None,
+                                on_asin_done=lambda asin: pipeline.put([], partial(checkpoint.finish_asin, asin)))
+        for asin, page_nr, reviews in pages:
+            # The page is recorded in the checkpoint once its reviews are stored
+            pipeline.put(known.new(reviews),
+                         partial(checkpoint.record_page, asin, page_nr, scheduler.review_links[asin]))
+finally:
+    mongo_client.close_mongo_client()
+    if METRICS.enabled:
+        METRICS.write_json(METRICS_JSON)
+        METRICS.write_prometheus(METRICS_PROM)
 
+logging.info("crawl stats: %s", scheduler.stats)
+logging.info("ingest stats: %s", pipeline.stats)
+checkpoint.clear()
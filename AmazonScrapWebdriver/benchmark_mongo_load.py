@@ -0,0 +1,82 @@
+## Benchmark of the chunked bulk loader against the whole-frame JSON insert
+#
+# Usage: python benchmark_mongo_load.py mongodb_url [n_rows ...]
+#
+# e.g. python benchmark_mongo_load.py mongodb://localhost:27017 10000 100000 1000000
+# The documents are written to scratch collections of the benchmark_load database, dropped afterwards.
+
+import json
+import sys
+import time
+import numpy as np
+import pandas as pd
+import pymongo
+from MongoDBOperations import MongoDBOps
+
+
+DB_NAME = 'benchmark_load'
+
+
+def synthetic_reviews(n_rows, seed=0):
+    """
+    Returns a dataframe shaped like Reviews.csv
+    Parameters:
+        n_rows (int): number of reviews
+        seed (int): seed of the random generator (default is 0)
+
+    Returns:
+        DataFrame: the reviews
+
+    """
+    rng = np.random.default_rng(seed)
+    words = np.array(['good', 'quality', 'fabric', 'size', 'comfortable', 'not', 'worth', 'price', 'fit', 'loose'])
+    comments = [' '.join(rng.choice(words, size=n)) for n in rng.integers(5, 60, size=n_rows)]
+    return pd.DataFrame({'review_title': [comment[:30] for comment in comments],
+                         'ratings': rng.integers(1, 6, size=n_rows).astype(float),
+                         'review_comment': comments,
+                         'size': rng.choice(['S', 'M', 'L', 'XL', 'XXL'], size=n_rows),
+                         'asin': rng.choice([f'B0{i:08d}' for i in range(50)], size=n_rows)})
+
+
+def json_insert(collection, df):
+    """
+    The previous df_to_collection: the whole frame through one JSON string and one ordered insert_many
+    """
+    collection.insert_many(json.loads(df.T.to_json()).values())
+
+
+def benchmark_loads(mongo_ops, sizes, chunk_size=10000, workers=4):
+    """
+    Times the JSON insert and the bulk loader, sequential and parallel, at each size
+    Parameters:
+        mongo_ops (MongoDBOps): the MongoDB operations object
+        sizes (list): numbers of rows
+        chunk_size (int): number of documents per insert of the bulk loader (default is 10000)
+        workers (int): number of parallel inserts of the parallel run (default is 4)
+
+    Returns:
+        DataFrame: seconds and documents per second of each method at each size
+
+    """
+    rows = []
+    for n_rows in sizes:
+        df = synthetic_reviews(n_rows)
+        runs = {'json_insert_many': lambda name: json_insert(mongo_ops.get_collection(name, DB_NAME), df),
+                'bulk_load': lambda name: mongo_ops.bulk_load(DB_NAME, name, df, chunk_size),
+                f'bulk_load_{workers}_workers': lambda name: mongo_ops.bulk_load(DB_NAME, name, df, chunk_size,
+                                                                                 workers)}
+        for method, run in runs.items():
+            name = f'{method}_{n_rows}'
+            mongo_ops.drop_collection(name, DB_NAME)
+            start = time.perf_counter()
+            run(name)
+            seconds = time.perf_counter() - start
+            mongo_ops.drop_collection(name, DB_NAME)
+            rows.append({'rows': n_rows, 'method': method, 'seconds': seconds, 'docs_per_sec': n_rows / seconds})
+    return pd.DataFrame(rows).set_index(['rows', 'method'])
+
+
+if __name__ == '__main__':
+    sizes = [int(n) for n in sys.argv[2:]] or [10000, 100000, 1000000]
+    with pymongo.MongoClient(sys.argv[1]) as client, MongoDBOps(username=None, pwd=None, client=client) as mongo_ops:
+        print(benchmark_loads(mongo_ops, sizes).to_string())
@@ -0,0 +1,107 @@
+## Throughput benchmark of the review page parser on saved pages
+#
+# Usage: python benchmark_parsing.py save review_link pages_dir [n_pages]
+#        python benchmark_parsing.py pages_dir [review_link] [repeats]
+#
+# The first form saves review pages with the scraper's fetcher, the second times the lxml parser of PageParsers
+# on the saved pages against the BeautifulSoup parser of ReferenceParsers, both building the tree and
+# extracting the reviews and next page status. That they give the same results is checked by
+# tests/test_page_parsers.py, saved pages can be copied to tests/fixtures to extend it.
+
+import glob
+import os
+import sys
+import time
+import pandas as pd
+from AmazonReviewScrap import AmazonScrapper, review_page_url
+from Fetchers import CAPTCHA_MARKER
+from PageParsers import parse_review_page
+import ReferenceParsers
+
+
+DEFAULT_REVIEW_LINK = "/product/product-reviews/B000000000/?ie=UTF8&reviewerType=all_reviews"
+
+
+def _outcome(parse, page, review_link):
+    try:
+        return parse(page, review_link)
+    except Exception as e:
+        return type(e).__name__
+
+
+def save_pages(review_link, pages_dir, n_pages=10):
+    """
+    Saves review pages to be used as parser fixtures
+    Parameters:
+        review_link (str): A URL which contains the reviews
+        pages_dir (str): the directory to write the pages to
+        n_pages (int): maximum number of pages to save (default is 10)
+
+    Returns:
+        int: number of pages saved
+
+    """
+    os.makedirs(pages_dir, exist_ok=True)
+    ob = AmazonScrapper(search_term="")
+    saved = 0
+    try:
+        for page_nr in range(1, n_pages + 1):
+            page = ob.get_page(review_page_url(review_link, page_nr))
+            if CAPTCHA_MARKER in page:
+                break
+            with open(os.path.join(pages_dir, f"page_{page_nr:03d}.html"), 'w', encoding='utf-8') as f:
+                f.write(page)
+            saved += 1
+            if not parse_review_page(page, review_link)[1]:
+                break
+    finally:
+        ob.fetcher.close()
+    return saved
+
+
+def benchmark_parsers(pages, review_link=DEFAULT_REVIEW_LINK, repeats=3):
+    """
+    Times the lxml parser and the BeautifulSoup reference parser on the saved pages
+    Parameters:
+        pages (dict): HTML content of the saved pages by name
+        review_link (str): the review link passed to the parsers (default is DEFAULT_REVIEW_LINK)
+        repeats (int): number of passes over the pages, the fastest one is kept (default is 3)
+
+    Returns:
+        DataFrame: pages per second and MB of HTML per second of each parser, and its speedup over
+            BeautifulSoup
+
+    """
+    size_mb = sum(len(page.encode('utf-8')) for page in pages.values()) / 1e6
+    rows = []
+    for parser, parse in (('bs4', ReferenceParsers.parse_review_page), ('lxml', parse_review_page)):
+        best = float('inf')
+        for _ in range(repeats):
+            start = time.perf_counter()
+            for page in pages.values():
+                _outcome(parse, page, review_link)
+            best = min(best, time.perf_counter() - start)
+        rows.append({'parser': parser, 'pages_per_sec': len(pages) / best, 'mb_per_sec': size_mb / best})
+    results = pd.DataFrame(rows).set_index('parser')
+    results['speedup'] = results['pages_per_sec'] / results.loc['bs4', 'pages_per_sec']
+    return results
+
+
+def load_pages(pages_dir):
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(pages_dir, '*.html'))):
+        with open(path, encoding='utf-8') as f:
+            pages[os.path.basename(path)] = f.read()
+    return pages
+
+
+if __name__ == '__main__':
+    if sys.argv[1] == 'save':
+        n_pages = int(sys.argv[4]) if len(sys.argv) > 4 else 10
+        print(f"saved {save_pages(sys.argv[2], sys.argv[3], n_pages)} pages")
+        sys.exit(0)
+
+    pages = load_pages(sys.argv[1])
+    review_link = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_REVIEW_LINK
+    repeats = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    print(benchmark_parsers(pages, review_link, repeats).to_string())
@@ -0,0 +1,40 @@
+## One-time migration of a review collection to the unique fingerprint index
+#
+# Usage: python migrate_fingerprints.py db_name collection_name [mongodb_url]
+#
+# e.g. python migrate_fingerprints.py Neemai maternity_wear
+# Recomputes the fingerprint of every stored review, deletes the reviews having the fingerprint of an earlier
+# one and builds the unique index upsert_reviews relies on. Without a url it connects to Atlas with the
+# credentials of app.py. Until it has run on a collection holding duplicates, upsert_reviews matches reviews
+# through a plain index and logs a warning.
+
+import sys
+import pymongo
+from MongoDBOperations import MongoDBOps
+
+
+def migrate(mongo_ops, db_name, collection_name):
+    """
+    Fingerprints the reviews of a collection, removes the duplicates and creates the unique fingerprint index
+    Parameters:
+        mongo_ops (MongoDBOps): the MongoDB operations object
+        db_name (str): name of the database
+        collection_name (str): name of the collection holding the reviews
+
+    Returns:
+        dict: number of documents fingerprinted and of duplicates removed, and whether the index is unique
+
+    """
+    return mongo_ops.ensure_fingerprint_index(db_name=db_name, collection_name=collection_name,
+                                              remove_duplicates=True, refresh=True)
+
+
+if __name__ == '__main__':
+    db_name, collection_name = sys.argv[1], sys.argv[2]
+    if len(sys.argv) > 3:
+        with pymongo.MongoClient(sys.argv[3]) as client, \
+                MongoDBOps(username=None, pwd=None, client=client) as mongo_ops:
+            print(migrate(mongo_ops, db_name, collection_name))
+    else:
+        with MongoDBOps(username="ABC", pwd='XYZ') as mongo_ops:
+            print(migrate(mongo_ops, db_name, collection_name))
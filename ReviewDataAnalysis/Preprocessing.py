@@ -1,13 +1,306 @@
 ## Function to clean the text data
 
+import hashlib
+import os
 import string
+import sys
 import contractions
 import re
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 from nltk.corpus import stopwords
 from nltk.tokenize import word_tokenize
+from analysis_metrics import METRICS
+from TextCache import CleanTextCache
 
 
-def clean_text_df(df, col_name):
+# Remove emojis
+EMOJI_PATTERN = (
+    "["
+    u"\U0001F600-\U0001F64F"  # emoticons
+    u"\U0001F300-\U0001F5FF"  # symbols & pictographs
+    u"\U0001F680-\U0001F6FF"  # transport & map symbols
+    u"\U0001F700-\U0001F77F"  # alchemical symbols
+    u"\U0001F780-\U0001F7FF"  # Geometric Shapes Extended
+    u"\U0001F800-\U0001F8FF"  # Supplemental Arrows-C
+    u"\U0001F900-\U0001F9FF"  # Supplemental Symbols and Pictographs
+    u"\U0001FA00-\U0001FA6F"  # Chess Symbols
+    u"\U0001FA70-\U0001FAFF"  # Symbols and Pictographs Extended-A
+    u"\U00002702-\U000027B0"  # Dingbats
+    u"\U000024C2-\U0001F251"
+    "]+"
+)
+
+# Remove emoticons
+EMOTICONS = {
+    u":‑)": "Happy face or smiley",
+    u":)": "Happy face or smiley",
+    u":-]": "Happy face or smiley",
+    u":]": "Happy face or smiley",
+    u":-3": "Happy face smiley",
+    u":3": "Happy face smiley",
+    u":->": "Happy face smiley",
+    u":>": "Happy face smiley",
+    u"8-)": "Happy face smiley",
+    u":o)": "Happy face smiley",
+    u":-}": "Happy face smiley",
+    u":}": "Happy face smiley",
+    u":-)": "Happy face smiley",
+    u":c)": "Happy face smiley",
+    u":^)": "Happy face smiley",
+    u"=]": "Happy face smiley",
+}
+
+MEDIA_NOT_LOADED = 'the media could not be loaded'
+
+# Text made only of letters and spaces is tokenized by word_tokenize exactly like str.split(),
+# except for the few words its MacIntyre contraction rules break in two.
+_SIMPLE_TEXT = re.compile(r"[A-Za-z ]*")
+_TOKENIZER_SPLITS = {'cannot': 3, 'gimme': 3, 'gonna': 3, 'gotta': 3, 'lemme': 3, 'wanna': 3}
+
+# Bump when a change to the cleaning steps changes the output, so that cached results are not reused
+CLEANER_VERSION = 1
+
+# Below this many rows per worker, starting the process pool costs more than the cleaning itself
+MIN_ROWS_PER_WORKER = 5000
+
+_strip_table = None
+
+
+def tokenize(text, language='english'):
+    """
+    Split the text into words exactly like nltk's word_tokenize, without running its sentence and regex
+    pipeline on text made only of letters and spaces, which is what cleaned text is
+
+    Parameters:
+    - text (str): the text to be tokenized
+    - language (str): the language of the Punkt sentence tokenizer (default is 'english')
+
+    Returns:
+    - list: the list of tokens
+    """
+    if not _SIMPLE_TEXT.fullmatch(text):
+        return word_tokenize(text, language=language)
+    tokens = []
+    for word in text.split():
+        cut = _TOKENIZER_SPLITS.get(word.lower())
+        if cut:
+            tokens.append(word[:cut])
+            tokens.append(word[cut:])
+        else:
+            tokens.append(word)
+    return tokens
+
+
+def _get_strip_table():
+    """
+    Returns the str.translate table deleting every punctuation and digit character. Built once per process
+    because finding all the unicode digits means scanning the whole code point range.
+    """
+    global _strip_table
+    if _strip_table is None:
+        table = dict.fromkeys(map(ord, string.punctuation))
+        table.update(dict.fromkeys(c for c in range(sys.maxunicode + 1) if chr(c).isdigit()))
+        _strip_table = table
+    return _strip_table
+
+
+class TextCleaner:
+    """
+    Cleans review text the same way as clean_text, with every regex, lookup table and the stop word set
+    compiled once so that it can be reused for many texts.
+
+    Parameters:
+    - language (str): the language of the NLTK stop word list (default is 'english')
+    """
+
+    def __init__(self, language='english'):
+        """
+        Initialize the TextCleaner object
+
+        Parameters:
+        - language (str): the language of the NLTK stop word list (default is 'english')
+        """
+        self.language = language
+        self.stop_words = frozenset(stopwords.words(language))
+        self.strip_table = _get_strip_table()
+        self.expand_contractions = contractions.fix
+        # After punctuation removal no emoticon can be left, so both patterns go in one pass
+        self.pattern = re.compile(
+            EMOJI_PATTERN + "|" + "|".join(re.escape(emoticon) for emoticon in EMOTICONS.keys()))
+        config = "\n".join([str(CLEANER_VERSION), language, getattr(contractions, '__version__', '')]
+                            + sorted(self.stop_words))
+        self.config_key = hashlib.sha1(config.encode('utf-8')).hexdigest()
+
+    def tokenize(self, text):
+        """
+        Split the text into words, matching nltk's word_tokenize
+
+        Parameters:
+        - text (str): the text to be tokenized
+
+        Returns:
+        - list: the list of tokens
+        """
+        return tokenize(text, language=self.language)
+
+    def clean_tokens(self, text):
+        """
+        Clean the text like clean, returning the words instead of joining them back into a string
+
+        Parameters:
+        - text (str): the text to be cleaned
+
+        Returns:
+        - list: the words of the cleaned text
+        """
+        text = self.expand_contractions(text.lower())
+        text = ' '.join(text.translate(self.strip_table).split())
+        text = self.pattern.sub('', text)
+        text = text.replace(MEDIA_NOT_LOADED, '')
+        stop_words = self.stop_words
+        return [word for word in self.tokenize(text) if word not in stop_words]
+
+    def clean(self, text):
+        """
+        Convert the input text to lower case, remove contractions, punctuations, numbers, extra spaces, emojis,
+        emoticons and stop words
+
+        Parameters:
+        - text (str): the text to be cleaned
+
+        Returns:
+        - str: the cleaned text
+        """
+        return ' '.join(self.clean_tokens(text))
+
+    def clean_many(self, texts):
+        """
+        Clean an iterable of texts, None values are passed through unchanged
+
+        Parameters:
+        - texts (iterable): the texts to be cleaned
+
+        Returns:
+        - list: the cleaned texts in the input order
+        """
+        clean = self.clean
+        return [clean(text) if text is not None else None for text in texts]
+
+    def clean_series(self, series):
+        """
+        Clean a pandas Series of texts
+
+        Parameters:
+        - series (Series): the texts to be cleaned
+
+        Returns:
+        - Series: the cleaned texts with the index and name of the input
+        """
+        return pd.Series(self.clean_many(series), index=series.index, name=series.name, dtype=object)
+
+
+_default_cleaner = None
+
+
+def get_default_cleaner():
+    """
+    Returns the TextCleaner shared by clean_text and clean_text_df, creating it on first use
+    """
+    global _default_cleaner
+    if _default_cleaner is None:
+        _default_cleaner = TextCleaner()
+    return _default_cleaner
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    """
+    Returns the in-memory CleanTextCache shared by the clean_text_df calls, creating it on first use
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = CleanTextCache()
+    return _default_cache
+
+
+_worker_cleaner = None
+
+
+def _init_worker(language):
+    """
+    Process pool initializer, builds the stop word set and regexes once per worker process
+    """
+    global _worker_cleaner
+    _worker_cleaner = TextCleaner(language=language)
+
+
+def _clean_chunk(texts):
+    """
+    Clean one chunk of texts inside a worker process
+    """
+    return _worker_cleaner.clean_many(texts)
+
+
+def clean_many_parallel(texts, workers=-1, chunksize=10000, cleaner=None):
+    """
+    Clean a list of texts in a process pool. Chunks are cleaned independently and put back together in
+    the input order, so the result is the same as TextCleaner.clean_many.
+
+    Parameters:
+    - texts (list): the texts to be cleaned, None values are passed through unchanged
+    - workers (int): number of worker processes, -1 uses all cores (default is -1)
+    - chunksize (int): number of texts sent to a worker at a time (default is 10000)
+    - cleaner (TextCleaner): cleaner used for small inputs, workers build one with the same language
+      (default is the shared english cleaner)
+
+    Returns:
+    - list: the cleaned texts in the input order
+    """
+    cleaner = cleaner or get_default_cleaner()
+    if workers is None or workers < 1:
+        workers = os.cpu_count() or 1
+    if chunksize < 1:
+        raise ValueError("chunksize should be >=1")
+    texts = list(texts)
+    workers = min(workers, -(-len(texts) // chunksize))
+    if workers <= 1 or len(texts) < workers * MIN_ROWS_PER_WORKER:
+        return cleaner.clean_many(texts)
+
+    chunks = [texts[i:i + chunksize] for i in range(0, len(texts), chunksize)]
+    cleaned = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cleaner.language,)) as executor:
+        for chunk in executor.map(_clean_chunk, chunks):
+            cleaned.extend(chunk)
+    return cleaned
+
+
+def _clean_with_cache(texts, cache, cleaner, workers, chunksize):
+    """
+    Clean texts, looking every distinct text up in the cache first and cleaning only the misses
+    """
+    keys = {}
+    for text in texts:
+        if text is not None and text not in keys:
+            keys[text] = cache.make_key(text, cleaner.config_key)
+
+    cached = cache.get_many(list(keys.values()))
+    todo = [text for text, key in keys.items() if key not in cached]
+    METRICS.count('clean_cache_hits', len(keys) - len(todo))
+    METRICS.count('clean_cache_misses', len(todo))
+    if workers is None:
+        done = cleaner.clean_many(todo)
+    else:
+        done = clean_many_parallel(todo, workers=workers, chunksize=chunksize, cleaner=cleaner)
+    new_entries = {keys[text]: value for text, value in zip(todo, done)}
+    cache.put_many(new_entries)
+    cached.update(new_entries)
+    return [cached[keys[text]] if text is not None else None for text in texts]
+
+
+def clean_text_df(df, col_name, cleaner=None, workers=None, chunksize=10000, cache=None):
     """
     This function cleans the text data i.e., converts the text to lover case, removes punctuations, numbers,
     extra spaces, emojis, emoticons
@@ -15,11 +308,29 @@ def clean_text_df(df, col_name):
     Parameters:
     - df (DataFrame): The input DataFrame.
     - col_name (str): the name of the column containing the text that has to be cleaned.
+    - cleaner (TextCleaner): the cleaner to use (default is the shared english cleaner)
+    - workers (int): number of processes to clean with, -1 uses all cores (default is None, clean serially)
+    - chunksize (int): number of rows sent to a worker at a time when workers is set (default is 10000)
+    - cache (CleanTextCache): cache of already cleaned texts, only texts missing from it are cleaned and
+      cache.stats() reports the hit and miss counts (default is the shared in-memory cache), False cleans
+      every text without caching
 
     Returnes:
     - DataFrame: the DataFrame with cleaned text.
     """
-    df[col_name] = df[col_name].apply(lambda x: clean_text(x) if x is not None else None)
+    cleaner = cleaner or get_default_cleaner()
+    if cache is None:
+        cache = get_default_cache()
+    with METRICS.time('clean', mode='serial' if workers is None else 'parallel', cached=cache is not False):
+        if cache is not False:
+            cleaned = _clean_with_cache(df[col_name].tolist(), cache, cleaner, workers, chunksize)
+            df[col_name] = pd.Series(cleaned, index=df.index, name=col_name, dtype=object)
+        elif workers is None:
+            df[col_name] = cleaner.clean_series(df[col_name])
+        else:
+            cleaned = clean_many_parallel(df[col_name], workers=workers, chunksize=chunksize, cleaner=cleaner)
+            df[col_name] = pd.Series(cleaned, index=df.index, name=col_name, dtype=object)
+    METRICS.count('texts_cleaned', len(df))
     return df
 
 
@@ -28,71 +339,4 @@ def clean_text(text):
     Convert the input text to lower case, remove contractions, punctuations, numbers, extra spaces, emojis
     and emoticons
     """
-
-    # convert text to lower case
-    text = text.lower()
-
-    # Remove contractions: There are many words like don't, can't, it's and so on. That would be fixed in this step
-    text = contractions.fix(text)
-
-    # Remove punctuations
-    text = ''.join(char for char in text if char not in string.punctuation)
-
-    # Remove numbers
-    text = ''.join(char for char in text if not char.isdigit())
-
-    # Remove extra spaces
-    text = ' '.join(text.split())
-
-    # Remove emojis
-    emoji_pattern = re.compile(
-        "["
-        u"\U0001F600-\U0001F64F"  # emoticons
-        u"\U0001F300-\U0001F5FF"  # symbols & pictographs
-        u"\U0001F680-\U0001F6FF"  # transport & map symbols
-        u"\U0001F700-\U0001F77F"  # alchemical symbols
-        u"\U0001F780-\U0001F7FF"  # Geometric Shapes Extended
-        u"\U0001F800-\U0001F8FF"  # Supplemental Arrows-C
-        u"\U0001F900-\U0001F9FF"  # Supplemental Symbols and Pictographs
-        u"\U0001FA00-\U0001FA6F"  # Chess Symbols
-        u"\U0001FA70-\U0001FAFF"  # Symbols and Pictographs Extended-A
-        u"\U00002702-\U000027B0"  # Dingbats
-        u"\U000024C2-\U0001F251"
-        "]+"
-    )
-
-    text = emoji_pattern.sub('', text)
-
-    # Remove emoticons
-
-    emoticons = {
-        u":‑)": "Happy face or smiley",
-        u":)": "Happy face or smiley",
-        u":-]": "Happy face or smiley",
-        u":]": "Happy face or smiley",
-        u":-3": "Happy face smiley",
-        u":3": "Happy face smiley",
-        u":->": "Happy face smiley",
-        u":>": "Happy face smiley",
-        u"8-)": "Happy face smiley",
-        u":o)": "Happy face smiley",
-        u":-}": "Happy face smiley",
-        u":}": "Happy face smiley",
-        u":-)": "Happy face smiley",
-        u":c)": "Happy face smiley",
-        u":^)": "Happy face smiley",
-        u"=]": "Happy face smiley",
-    }
-
-    emoticon_pattern = re.compile("|".join(re.escape(emoticon) for emoticon in emoticons.keys()))
-    text = emoticon_pattern.sub('', text)
-
-    # Replace "media could not be loaded with ''"
-    text = text.replace('the media could not be loaded', '')
-
-    # Remove stop words
-    text = ' '.join(word for word in word_tokenize(text) if word not in stopwords.words('english'))
-
-    return text
-
-
+    return get_default_cleaner().clean(text)
@@ -0,0 +1,137 @@
+import hashlib
+import sqlite3
+from collections import OrderedDict
+
+
+class CleanTextCache:
+    """
+    A memoization cache for cleaned review text. Entries are keyed by a hash of the raw text and the cleaner
+    configuration, kept in a bounded in-memory LRU and optionally persisted in a SQLite file so that later
+    runs only clean new or changed reviews.
+
+    Parameters:
+        maxsize (int): maximum number of entries kept in memory (default is 100000)
+        path (str): path of the SQLite file for the on-disk tier (default is None, memory only)
+    """
+
+    # SQLite limits the number of host parameters in one statement
+    _SQL_BATCH = 500
+
+    def __init__(self, maxsize=100000, path=None):
+        """
+        Initialize the CleanTextCache object
+
+        Parameters:
+            maxsize (int): maximum number of entries kept in memory (default is 100000)
+            path (str): path of the SQLite file for the on-disk tier (default is None, memory only)
+        """
+        try:
+            self.maxsize = maxsize
+            self.path = path
+            self.memory = OrderedDict()
+            self.hits = 0
+            self.misses = 0
+            self.conn = None
+            if path is not None:
+                self.conn = sqlite3.connect(path)
+                self.conn.execute("CREATE TABLE IF NOT EXISTS cleaned_text (key TEXT PRIMARY KEY, value TEXT)")
+                self.conn.commit()
+        except Exception as e:
+            raise Exception(f"__init__: could not open the cache - {str(e)}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def make_key(text, config_key):
+        """
+        Returns the cache key of a raw text for a given cleaner configuration
+        Parameters:
+            text (str): the raw text
+            config_key (str): the configuration key of the cleaner
+
+        Returns:
+            str: hex digest identifying the text and configuration
+        """
+        return hashlib.blake2b((config_key + "\0" + text).encode("utf-8"), digest_size=16).hexdigest()
+
+    def _remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.maxsize:
+            self.memory.popitem(last=False)
+
+    def get_many(self, keys):
+        """
+        Looks up many keys at once, first in memory and then on disk
+        Parameters:
+            keys (list): the cache keys
+
+        Returns:
+            dict: the cached values of the keys that were found
+        """
+        try:
+            found = {}
+            missing = []
+            for key in keys:
+                if key in self.memory:
+                    self.memory.move_to_end(key)
+                    found[key] = self.memory[key]
+                else:
+                    missing.append(key)
+
+            if self.conn is not None:
+                for i in range(0, len(missing), self._SQL_BATCH):
+                    batch = missing[i:i + self._SQL_BATCH]
+                    placeholders = ",".join("?" * len(batch))
+                    rows = self.conn.execute(
+                        f"SELECT key, value FROM cleaned_text WHERE key IN ({placeholders})", batch)
+                    for key, value in rows:
+                        found[key] = value
+                        self._remember(key, value)
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+            return found
+        except Exception as e:
+            raise Exception(f"get_many: Failed to read from the cache - {str(e)}")
+
+    def put_many(self, items):
+        """
+        Stores many entries at once in memory and on disk
+        Parameters:
+            items (dict): cleaned values by cache key
+
+        """
+        try:
+            for key, value in items.items():
+                self._remember(key, value)
+            if self.conn is not None and items:
+                self.conn.executemany("INSERT OR REPLACE INTO cleaned_text (key, value) VALUES (?, ?)",
+                                      items.items())
+                self.conn.commit()
+        except Exception as e:
+            raise Exception(f"put_many: Failed to write to the cache - {str(e)}")
+
+    def stats(self):
+        """
+        Returns the hit and miss counts
+        Returns:
+            dict: hits, misses and the number of entries held in memory
+
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'memory_entries': len(self.memory)}
+
+    def close(self):
+        """
+        Closes the on-disk tier
+        """
+        try:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+        except Exception as e:
+            raise Exception(f"close: could not close the cache - {str(e)}")
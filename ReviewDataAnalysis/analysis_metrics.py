@@ -0,0 +1,51 @@
+## Metrics hook of the analysis modules, the registry recording them is injected by the caller
+
+from contextlib import nullcontext
+
+
+class MetricsHook:
+    """
+    Forwards the timings and counts of the cleaning and scoring code to a metrics registry, such as the METRICS
+    of the scraper's Metrics module, and drops them while no registry is set. The analysis modules record
+    through the shared METRICS hook below, so they do not depend on where the registry is defined.
+
+    Parameters:
+    - registry: an object with the time, count and observe methods of Metrics (default is None, nothing is
+      recorded)
+    """
+
+    def __init__(self, registry=None):
+        """
+        Initialize the MetricsHook object
+        """
+        self.registry = registry
+
+    def use(self, registry):
+        """
+        Sets the registry the calls are forwarded to
+
+        Parameters:
+        - registry: the registry, e.g. Metrics.METRICS, None to stop recording
+        """
+        self.registry = registry
+
+    @property
+    def enabled(self):
+        return self.registry is not None and self.registry.enabled
+
+    def time(self, stage, **labels):
+        if self.registry is None:
+            return nullcontext()
+        return self.registry.time(stage, **labels)
+
+    def count(self, name, value=1, **labels):
+        if self.registry is not None:
+            self.registry.count(name, value, **labels)
+
+    def observe(self, name, value, **labels):
+        if self.registry is not None:
+            self.registry.observe(name, value, **labels)
+
+
+# Shared by Preprocessing and sentiment, e.g. METRICS.use(Metrics.METRICS) to record them with the scraper stages
+METRICS = MetricsHook()
@@ -0,0 +1,57 @@
+## Throughput and memory benchmark of the sentiment backends
+#
+# Usage: python benchmark_sentiment.py Reviews.csv [model_name] [n_reviews]
+
+import multiprocessing
+import resource
+import sys
+import time
+import pandas as pd
+from sentiment import SentimentScorer, MODEL, review_texts, compare_backends
+
+
+def _run_backend(backend, model_name, texts, batch_size):
+    """
+    Scores the texts with one backend and returns the throughput and peak RSS of the process
+    """
+    scorer = SentimentScorer(model_name, backend=backend)
+    scorer.score_batch(texts[:batch_size], batch_size=batch_size)
+    start = time.perf_counter()
+    scorer.score_batch(texts, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {'backend': backend, 'reviews_per_sec': len(texts) / elapsed, 'peak_rss_mb': peak_rss_mb}
+
+
+def benchmark_backends(texts, model_name=MODEL, backends=('eager', 'int8', 'onnx'), batch_size=32):
+    """
+    Benchmarks each backend in its own process so that the peak RSS of one does not hide the others
+
+    Parameters:
+    - texts (list): the texts to be scored
+    - model_name (str): name or path of the pretrained model (default is MODEL)
+    - backends (tuple): backends to benchmark (default is ('eager', 'int8', 'onnx'))
+    - batch_size (int): number of model inputs per forward pass (default is 32)
+
+    Returns:
+    - DataFrame: reviews per second, peak RSS and max deviation from eager scores for each backend
+    """
+    context = multiprocessing.get_context('spawn')
+    rows = []
+    for backend in backends:
+        with context.Pool(1) as pool:
+            rows.append(pool.apply(_run_backend, (backend, model_name, texts, batch_size)))
+    results = pd.DataFrame(rows).set_index('backend')
+    deviations = compare_backends(texts, model_name, [b for b in backends if b != 'eager'], batch_size)
+    results['max_deviation'] = pd.Series(deviations)
+    results.loc[results.index == 'eager', 'max_deviation'] = 0.0
+    return results
+
+
+if __name__ == '__main__':
+    df = pd.read_csv(sys.argv[1])
+    model_name = sys.argv[2] if len(sys.argv) > 2 else MODEL
+    n_reviews = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    texts = review_texts(df.head(n_reviews))
+    print(benchmark_backends(texts, model_name).to_string())
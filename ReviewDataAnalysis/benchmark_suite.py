@@ -0,0 +1,267 @@
+## Throughput and peak memory of the pipeline's hot paths on synthetic corpora, saved as JSON to compare commits
+#
+# Usage: python benchmark_suite.py run results.json [--scales 1 10 100] [--mongodb-url URL] [--pages-dir DIR]
+#        python benchmark_suite.py compare baseline.json results.json
+#
+# The corpora are generated by SyntheticReviews from the bundled Reviews.csv, scale 1 being its size. The
+# MongoDB stages run against mongomock, installed with tests/dependencies.txt, unless a MongoDB url is given,
+# the parsing stage only runs on review pages saved with benchmark_parsing.py. compare prints the throughput and
+# memory ratios of two result files.
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from Preprocessing import clean_text, clean_text_df, get_default_cleaner
+from synthetic_corpus import SyntheticReviews
+from token_corpus import TokenCorpus
+
+
+RESULTS_VERSION = 1
+
+DB_NAME = 'benchmark_suite'
+
+# clean_text is called one text at a time, on at most this many texts of each corpus
+CLEAN_TEXT_SAMPLE = 20000
+
+STAGES = ('clean_text', 'clean_text_df', 'corpus_build', 'ngram_topk', 'wordcloud_frequencies', 'mongo_insert',
+          'mongo_read', 'parse_pages')
+
+
+def measure(run, setup=None, repeats=3):
+    """
+    Times a stage and measures the peak memory it allocates
+    Parameters:
+        run (callable): the stage
+        setup (callable): called before every run, outside the timing (default is None)
+        repeats (int): number of timed runs, the fastest one is kept (default is 3)
+
+    Returns:
+        tuple: (seconds, peak_mb) the fastest run and the peak of the Python allocations, numpy arrays
+        included, of one more run under tracemalloc
+
+    """
+    best = float('inf')
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak / 2 ** 20
+
+
+def _corpus_stages(df, mongo_ops, stages):
+    """
+    Returns the stages run on a corpus as {name: (run, setup, items)}
+    """
+    selected = {}
+    texts = [text for text in df['review_comment'] if isinstance(text, str)][:CLEAN_TEXT_SAMPLE]
+    selected['clean_text'] = (lambda: [clean_text(text) for text in texts], None, len(texts))
+    # Without the cache, the repeats would only time cache hits
+    selected['clean_text_df'] = (lambda: clean_text_df(df.copy(), 'review_comment', cache=False), None, len(df))
+
+    if {'corpus_build', 'ngram_topk', 'wordcloud_frequencies'} & set(stages):
+        cleaned = clean_text_df(df.copy(), 'review_comment')
+        corpus = TokenCorpus.from_df(cleaned)
+        high = corpus.column('ratings') >= 4
+        groups = np.where(high, '4_above', np.where(corpus.column('ratings') <= 2, '2_below', None))
+        selected['corpus_build'] = (lambda: TokenCorpus.from_df(cleaned), None, len(df))
+        selected['ngram_topk'] = (lambda: corpus.top_ngrams(ns=(2, 3), k=10, groups=groups), None, len(df))
+        selected['wordcloud_frequencies'] = (lambda: corpus.frequencies(high), None, len(df))
+
+    if mongo_ops is not None:
+        collection = f'reviews_{len(df)}'
+
+        def drop():
+            mongo_ops.drop_collection(collection, DB_NAME)
+
+        def load():
+            # Reads the corpus left by mongo_insert, or loads it when that stage did not run
+            if mongo_ops.get_collection(collection, DB_NAME).estimated_document_count() != len(df):
+                drop()
+                mongo_ops.df_to_collection(DB_NAME, collection, df)
+
+        selected['mongo_insert'] = (lambda: mongo_ops.df_to_collection(DB_NAME, collection, df), drop, len(df))
+        selected['mongo_read'] = (lambda: mongo_ops.get_dataframe_collection(DB_NAME, collection,
+                                                                             projection={'_id': 0}),
+                                  load, len(df))
+    return selected
+
+
+def _parse_stage(pages_dir):
+    """
+    Returns the parsing stage on the saved review pages, as (run, setup, items)
+    """
+    from PageParsers import parse_review_page
+    pages = []
+    for path in sorted(glob.glob(os.path.join(pages_dir, '*.html'))):
+        with open(path, encoding='utf-8') as f:
+            pages.append(f.read())
+    if not pages:
+        raise ValueError(f"no .html pages in {pages_dir}")
+
+    def run():
+        for page in pages:
+            try:
+                parse_review_page(page, "/product-reviews/B000000000/")
+            except Exception:
+                # Pages the scraper fails on, e.g. CAPTCHA pages, still cost their parsing time
+                pass
+
+    return run, None, len(pages)
+
+
+def _mongo_ops(mongodb_url):
+    # Only the MongoDB stages need the scraper's MongoDBOps
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "AmazonScrapWebdriver"))
+    from MongoDBOperations import MongoDBOps
+    if mongodb_url:
+        import pymongo
+        return MongoDBOps(username=None, pwd=None, client=pymongo.MongoClient(mongodb_url))
+    import mongomock
+    return MongoDBOps(username=None, pwd=None, client=mongomock.MongoClient())
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_suite(scales=(1, 10, 100), stages=STAGES, mongodb_url=None, pages_dir=None, repeats=3, seed=0,
+              source=None):
+    """
+    Runs the benchmarks on a synthetic corpus of each scale
+    Parameters:
+        scales (tuple): corpus sizes relative to the source reviews (default is (1, 10, 100))
+        stages (tuple): the stages to run, see STAGES (default is all of them)
+        mongodb_url (str): MongoDB server of the MongoDB stages (default is None, mongomock)
+        pages_dir (str): directory of saved review pages for the parse_pages stage (default is None, skipped)
+        repeats (int): number of timed runs of each stage, the fastest one is kept (default is 3)
+        seed (int): seed of the corpus generator (default is 0)
+        source (str): CSV file of the real reviews the corpora are modelled on (default is the bundled
+            Reviews.csv)
+
+    Returns:
+        dict: the environment, the result of every stage at every scale and the stages that were skipped
+
+    """
+    generator = SyntheticReviews.from_csv(source) if source else SyntheticReviews.from_csv()
+    get_default_cleaner()
+    results, skipped = [], []
+    parse_stage = None
+    if 'parse_pages' in stages:
+        if pages_dir is None:
+            skipped.append({'stage': 'parse_pages', 'reason': 'no pages directory'})
+        else:
+            parse_stage = _parse_stage(pages_dir)
+
+    def record(stage, scale, run, setup, items):
+        seconds, peak_mb = measure(run, setup, repeats)
+        results.append({'stage': stage, 'scale': scale, 'items': items, 'seconds': seconds,
+                        'items_per_sec': items / seconds if seconds else None, 'peak_mb': peak_mb})
+        label = stage if scale is None else f"{stage} x{scale}"
+        print(f"{label}: {items / seconds:,.0f} items/s, {peak_mb:,.1f} MB peak", file=sys.stderr)
+
+    mongo_ops = None
+    if any(stage.startswith('mongo_') for stage in stages):
+        try:
+            mongo_ops = _mongo_ops(mongodb_url)
+        except Exception as e:
+            skipped.extend({'stage': stage, 'reason': str(e)} for stage in stages if stage.startswith('mongo_'))
+    try:
+        for scale in scales:
+            df = generator.scaled(scale, seed=seed)
+            corpus_stages = _corpus_stages(df, mongo_ops, stages)
+            for stage in stages:
+                if stage in corpus_stages:
+                    record(stage, scale, *corpus_stages[stage])
+            if mongo_ops is not None:
+                mongo_ops.drop_collection(f'reviews_{len(df)}', DB_NAME)
+    finally:
+        if mongo_ops is not None:
+            mongo_ops.drop_db(DB_NAME)
+            # The client was passed in, close_mongo_client leaves it open
+            mongo_ops.client.close()
+
+    if parse_stage is not None:
+        record('parse_pages', None, *parse_stage)
+
+    return {'version': RESULTS_VERSION, 'commit': _git_commit(), 'python': platform.python_version(),
+            'platform': platform.platform(), 'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'seed': seed, 'source_rows': len(generator.source), 'repeats': repeats,
+            'mongodb': 'server' if mongodb_url else 'mongomock', 'results': results, 'skipped': skipped}
+
+
+def compare_results(baseline, current):
+    """
+    Compares two result files of run_suite
+    Parameters:
+        baseline (dict): the results to compare against, e.g. of the main branch
+        current (dict): the new results
+
+    Returns:
+        DataFrame: throughput and peak memory of both by stage and scale, a speedup below 1 or a memory ratio
+        above 1 is a regression
+
+    """
+    def frame(data):
+        rows = pd.DataFrame(data['results'])
+        rows['scale'] = rows['scale'].fillna(0)
+        return rows.set_index(['stage', 'scale'])[['items_per_sec', 'peak_mb']]
+
+    merged = frame(baseline).join(frame(current), lsuffix='_baseline', rsuffix='_current', how='inner')
+    merged['speedup'] = merged['items_per_sec_current'] / merged['items_per_sec_baseline']
+    merged['memory_ratio'] = merged['peak_mb_current'] / merged['peak_mb_baseline']
+    return merged
+
+
+def _read(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks of the review pipeline on synthetic corpora")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run')
+    run.add_argument('output')
+    run.add_argument('--scales', type=float, nargs='+', default=[1, 10, 100])
+    run.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    run.add_argument('--mongodb-url')
+    run.add_argument('--pages-dir')
+    run.add_argument('--repeats', type=int, default=3)
+    run.add_argument('--seed', type=int, default=0)
+    run.add_argument('--source')
+    compare = commands.add_parser('compare')
+    compare.add_argument('baseline')
+    compare.add_argument('current')
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        print(compare_results(_read(args.baseline), _read(args.current)).to_string())
+    else:
+        scales = [int(scale) if scale == int(scale) else scale for scale in args.scales]
+        report = run_suite(scales, args.stages, args.mongodb_url, args.pages_dir, args.repeats, args.seed,
+                           args.source)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=1)
@@ -0,0 +1,358 @@
+## Near-duplicate reviews found with MinHash signatures and locality-sensitive hashing of the cleaned text
+
+import hashlib
+import json
+import os
+import numpy as np
+from token_corpus import TokenCorpus
+
+
+INDEX_VERSION = 1
+
+# Shingles and their hashes are 32-bit values, permuted with (a * x + b) mod MERSENNE_PRIME
+MAX_HASH = np.uint64(0xFFFFFFFF)
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+
+# Number of shingles hashed at once, bounding the (shingles, num_perm) array of one step to about 64 MB at
+# 128 permutations
+CHUNK_SHINGLES = 1 << 16
+
+
+def lsh_bands(threshold, num_perm):
+    """
+    Chooses the number of bands and of rows per band splitting the signatures, the ones that minimize the
+    probability of missing a pair above the threshold plus the probability of comparing a pair below it
+
+    Parameters:
+    - threshold (float): the estimated Jaccard similarity of near-duplicates
+    - num_perm (int): length of the signatures
+
+    Returns:
+    - tuple: (bands, rows)
+    """
+    similarity = np.linspace(0, 1, 1001)
+    below = similarity < threshold
+    best, best_error = None, None
+    for bands in range(1, num_perm + 1):
+        rows = num_perm // bands
+        candidate = 1 - (1 - similarity ** rows) ** bands
+        error = candidate[below].mean() * threshold + (1 - candidate[~below]).mean() * (1 - threshold)
+        if best_error is None or error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+def _token_hashes(tokens):
+    # Stable across runs and vocabularies, unlike the token ids of a corpus
+    return np.array([int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'little')
+                     for token in tokens], dtype=np.uint64)
+
+
+def shingles(corpus, size=2):
+    """
+    Hashes the word shingles, the runs of size consecutive tokens, of every row of a corpus. A row shorter
+    than size is a single shingle of all its tokens.
+
+    Parameters:
+    - corpus (TokenCorpus): the tokenized cleaned texts
+    - size (int): number of tokens of a shingle (default is 2)
+
+    Returns:
+    - tuple: (hashes, rows) the 32-bit hash of every shingle as uint64 and the row it belongs to, by row
+    """
+    ids = np.asarray(corpus.ids)
+    offsets = np.asarray(corpus.offsets)
+    token_hashes = _token_hashes(corpus.tokens)
+    lengths = np.diff(offsets)
+    # One shingle per start position, size - 1 fewer than tokens in the longer rows and one in the shorter ones
+    counts = np.where(lengths >= size, lengths - size + 1, np.minimum(lengths, 1))
+    rows = np.repeat(np.arange(len(lengths)), counts)
+    row_starts = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(counts, out=row_starts[1:])
+    starts = offsets[rows] + np.arange(len(rows)) - row_starts[rows]
+    widths = np.minimum(lengths[rows], size)
+
+    hashes = token_hashes[ids[starts]]
+    for i in range(1, size):
+        more = widths > i
+        hashes[more] = hashes[more] * np.uint64(0x100000001B3) ^ token_hashes[ids[starts[more] + i]]
+    return (hashes ^ (hashes >> np.uint64(32))) & MAX_HASH, rows
+
+
+def minhash_signatures(hashes, rows, n_rows, num_perm=128, seed=1):
+    """
+    Computes the MinHash signatures of rows from the hashes of their shingles, the minimum of every hash
+    permutation over the shingles of a row
+
+    Parameters:
+    - hashes (ndarray): 32-bit shingle hashes as uint64, sorted by row
+    - rows (ndarray): row of each shingle
+    - n_rows (int): number of rows
+    - num_perm (int): number of hash permutations (default is 128)
+    - seed (int): seed of the permutations, signatures are only comparable with the same seed (default is 1)
+
+    Returns:
+    - ndarray: (n_rows, num_perm) uint32 signatures, all 0xFFFFFFFF for rows without shingles
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+    signatures = np.full((n_rows, num_perm), MAX_HASH, dtype=np.uint32)
+    present = np.flatnonzero(np.bincount(rows, minlength=n_rows))
+    if len(present) == 0:
+        return signatures
+    first = np.searchsorted(rows, present)
+    # Chunks end at a row boundary, so that every row is reduced within one chunk
+    step = max(CHUNK_SHINGLES, 1)
+    start = 0
+    while start < len(present):
+        end = int(np.searchsorted(first, first[start] + step, side='left'))
+        end = max(end, start + 1)
+        stop = first[end] if end < len(present) else len(hashes)
+        permuted = (hashes[first[start]:stop, None] * a + b) % MERSENNE_PRIME & MAX_HASH
+        signatures[present[start:end]] = np.minimum.reduceat(permuted, first[start:end] - first[start], axis=0)
+        start = end
+    return signatures
+
+
+def _roots(parent):
+    while True:
+        grandparent = parent[parent]
+        if np.array_equal(grandparent, parent):
+            return parent
+        parent = grandparent
+
+
+def _union(parent, left, right):
+    """
+    Merges the clusters of the pairs (left[i], right[i]) in a parent array where every cluster points to its
+    smallest row, and returns the flattened array
+    """
+    parent = _roots(parent)
+    while len(left):
+        left_root, right_root = parent[left], parent[right]
+        merging = left_root != right_root
+        if not merging.any():
+            break
+        low = np.minimum(left_root[merging], right_root[merging])
+        high = np.maximum(left_root[merging], right_root[merging])
+        np.minimum.at(parent, high, low)
+        parent = _roots(parent)
+        left, right = left[merging], right[merging]
+    return parent
+
+
+class NearDuplicateIndex:
+    """
+    Clusters reviews whose cleaned texts are near-duplicates, e.g. the same review served with other whitespace,
+    emojis or the 'media could not be loaded' banner on several listings and variant ASINs, without comparing
+    every pair. Each text gets a MinHash signature of its word shingles, the signatures are cut into bands,
+    and only rows sharing a band are compared; rows whose signatures agree on at least threshold of their
+    values are linked into a cluster. The cluster id of a row is the position of the first row of its cluster,
+    so a report counts each cluster once by keeping one row per id. Rows are added incrementally and the
+    index is saved between runs.
+
+    Parameters:
+    - threshold (float): the estimated Jaccard similarity of the shingles of near-duplicates (default is 0.8)
+    - num_perm (int): length of the signatures, more is more accurate and slower (default is 128)
+    - shingle_size (int): number of tokens of a shingle (default is 2)
+    - seed (int): seed of the hash permutations (default is 1)
+    """
+
+    def __init__(self, threshold=0.8, num_perm=128, shingle_size=2, seed=1):
+        """
+        Initialize the NearDuplicateIndex object
+        """
+        if not 0 < threshold <= 1:
+            raise ValueError(f"threshold must be in (0, 1], got {threshold}")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.seed = seed
+        self.bands, self.rows_per_band = lsh_bands(threshold, num_perm)
+        self.signatures = np.empty((0, num_perm), dtype=np.uint32)
+        self.band_keys = np.empty((0, self.bands), dtype=np.uint64)
+        self.clusters = np.empty(0, dtype=np.int64)
+        self.keys = []
+        self._positions = None
+
+    def __len__(self):
+        return len(self.clusters)
+
+    def _band_keys(self, signatures):
+        keys = np.zeros((len(signatures), self.bands), dtype=np.uint64)
+        for band in range(self.bands):
+            columns = signatures[:, band * self.rows_per_band:(band + 1) * self.rows_per_band].astype(np.uint64)
+            for column in columns.T:
+                keys[:, band] = keys[:, band] * np.uint64(1000003) ^ column
+        return keys
+
+    def _similar(self, left, right):
+        agreement = (self.signatures[left] == self.signatures[right]).mean(axis=1)
+        return agreement >= self.threshold
+
+    def _candidates(self, band, n_old, valid):
+        """
+        Returns the pairs of rows sharing a band key with a new row: each new row with the first row and with
+        the previous row of the same key
+        """
+        rows = np.flatnonzero(valid)
+        keys = self.band_keys[rows, band]
+        order = np.lexsort((rows, keys))
+        rows, keys = rows[order], keys[order]
+        run_start = np.ones(len(rows), dtype=bool)
+        run_start[1:] = keys[1:] != keys[:-1]
+        leaders = rows[np.maximum.accumulate(np.where(run_start, np.arange(len(rows)), 0))]
+        # A row only follows smaller rows in its run, so pairs of two old rows were linked before
+        linked = ~run_start & (rows >= n_old)
+        positions = np.flatnonzero(linked)
+        new_rows = rows[positions]
+        return np.concatenate([new_rows, new_rows]), np.concatenate([leaders[positions], rows[positions - 1]])
+
+    def add_corpus(self, corpus, keys=None):
+        """
+        Adds the rows of a corpus of cleaned texts
+
+        Parameters:
+        - corpus (TokenCorpus): the tokenized cleaned texts
+        - keys (list): an identifier of each row, e.g. the review _id, to look rows up with cluster_ids
+          (default is None)
+
+        Returns:
+        - ndarray: the cluster id of each added row
+        """
+        n_old, n_new = len(self), len(corpus)
+        if keys is not None and len(keys) != n_new:
+            raise ValueError(f"{len(keys)} keys for {n_new} rows")
+        hashes, rows = shingles(corpus, self.shingle_size)
+        signatures = minhash_signatures(hashes, rows, n_new, self.num_perm, self.seed)
+        self.signatures = np.concatenate([self.signatures, signatures])
+        self.band_keys = np.concatenate([self.band_keys, self._band_keys(signatures)])
+        self.keys.extend(keys if keys is not None else [None] * n_new)
+        self._positions = None
+
+        # Rows without any token have no signature to compare and stay alone
+        valid = (self.signatures != MAX_HASH).any(axis=1)
+        parent = np.concatenate([self.clusters, np.arange(n_old, n_old + n_new)])
+        for band in range(self.bands):
+            left, right = self._candidates(band, n_old, valid)
+            similar = self._similar(left, right)
+            parent = _union(parent, left[similar], right[similar])
+        self.clusters = parent
+        return self.clusters[n_old:]
+
+    def add(self, texts, keys=None, cleaner=None):
+        """
+        Adds texts to the index. With keys, the texts whose key is already indexed are not added again.
+
+        Parameters:
+        - texts (iterable): the cleaned texts, None values stay alone in their cluster
+        - keys (iterable): an identifier of each text, e.g. the review _id (default is None)
+        - cleaner (TextCleaner): cleaner applied to raw text (default is None, the texts are already cleaned)
+
+        Returns:
+        - ndarray: the cluster id of each text, the new ones and the ones already indexed
+        """
+        try:
+            texts = [text if isinstance(text, str) else None for text in texts]
+            if keys is None:
+                return self.add_corpus(TokenCorpus.from_texts(texts, cleaner=cleaner)).copy()
+            keys = list(keys)
+            if len(keys) != len(texts):
+                raise ValueError(f"{len(keys)} keys for {len(texts)} texts")
+            positions = self._key_positions()
+            new, seen = [], set()
+            for i, key in enumerate(keys):
+                # The same key twice in one call is added once
+                if key not in positions and key not in seen:
+                    seen.add(key)
+                    new.append(i)
+            self.add_corpus(TokenCorpus.from_texts([texts[i] for i in new], cleaner=cleaner), [keys[i] for i in new])
+            return self.cluster_ids(keys)
+        except Exception as e:
+            raise Exception(f"add: Failed to index the texts - {str(e)}")
+
+    def _key_positions(self):
+        if self._positions is None:
+            self._positions = {key: i for i, key in enumerate(self.keys) if key is not None}
+        return self._positions
+
+    def cluster_ids(self, keys):
+        """
+        Returns the cluster ids of indexed rows
+
+        Parameters:
+        - keys (iterable): the keys the rows were added with
+
+        Returns:
+        - ndarray: the cluster id of each key
+        """
+        positions = self._key_positions()
+        return self.clusters[[positions[key] for key in keys]].astype(np.int64)
+
+    def cluster_sizes(self):
+        """
+        Returns the number of rows of every cluster
+
+        Returns:
+        - dict: cluster id to number of rows, for the clusters of more than one row
+        """
+        ids, counts = np.unique(self.clusters, return_counts=True)
+        return {int(cluster): int(count) for cluster, count in zip(ids, counts) if count > 1}
+
+    def save(self, path):
+        """
+        Saves the index in a directory: the arrays as .npy files and the parameters and keys as JSON
+
+        Parameters:
+        - path (str): the directory to write, created if needed
+        """
+        try:
+            os.makedirs(path, exist_ok=True)
+            np.save(os.path.join(path, 'signatures.npy'), self.signatures)
+            np.save(os.path.join(path, 'band_keys.npy'), self.band_keys)
+            np.save(os.path.join(path, 'clusters.npy'), self.clusters)
+            # Written last, a directory without it is not a complete index
+            with open(os.path.join(path, 'index.json'), 'w', encoding='utf-8') as f:
+                json.dump({'version': INDEX_VERSION, 'threshold': self.threshold, 'num_perm': self.num_perm,
+                           'shingle_size': self.shingle_size, 'seed': self.seed, 'keys': self.keys}, f)
+        except Exception as e:
+            raise Exception(f"save: Failed to save the index to {path} - {str(e)}")
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads an index saved with save
+
+        Parameters:
+        - path (str): the index directory
+
+        Returns:
+        - NearDuplicateIndex: the loaded index
+        """
+        try:
+            with open(os.path.join(path, 'index.json'), encoding='utf-8') as f:
+                data = json.load(f)
+            if data['version'] != INDEX_VERSION:
+                raise ValueError(f"unsupported version {data['version']}")
+            index = cls(data['threshold'], data['num_perm'], data['shingle_size'], data['seed'])
+            index.signatures = np.load(os.path.join(path, 'signatures.npy'))
+            index.band_keys = np.load(os.path.join(path, 'band_keys.npy'))
+            index.clusters = np.load(os.path.join(path, 'clusters.npy'))
+            index.keys = data['keys']
+            return index
+        except Exception as e:
+            raise Exception(f"load: Failed to load the index from {path} - {str(e)}")
+
+    @classmethod
+    def open(cls, path, threshold=0.8, num_perm=128, shingle_size=2, seed=1):
+        """
+        Loads the index saved in a directory, or creates an empty one with the parameters when there is none
+        """
+        if os.path.exists(os.path.join(path, 'index.json')):
+            index = cls.load(path)
+            if (index.threshold, index.num_perm, index.shingle_size, index.seed) != \
+                    (threshold, num_perm, shingle_size, seed):
+                raise ValueError(f"the index in {path} was built with other parameters")
+            return index
+        return cls(threshold, num_perm, shingle_size, seed)
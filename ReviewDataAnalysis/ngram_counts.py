@@ -0,0 +1,171 @@
+## Integer-encoded n-gram counting
+
+import numpy as np
+import pandas as pd
+from Preprocessing import tokenize
+
+
+def encode_texts(texts, vocab=None, tokenizer=tokenize):
+    """
+    Tokenize the texts once and map every token to an integer id
+
+    Parameters:
+    - texts (iterable): the texts, None values give empty rows
+    - vocab (dict): token to id mapping to extend (default is None, start a new one)
+    - tokenizer (callable): splits a text into tokens, e.g. TextCleaner.clean_tokens to clean and tokenize raw
+      text in one step (default is tokenize, for text that is already cleaned)
+
+    Returns:
+    - tuple: (ids, offsets, vocab) where ids is an int32 array of all the token ids, the tokens of row i being
+      ids[offsets[i]:offsets[i + 1]], and vocab maps each token to its id
+    """
+    vocab = {} if vocab is None else vocab
+    ids = []
+    lengths = []
+    for text in texts:
+        if text is None or (isinstance(text, float) and np.isnan(text)):
+            lengths.append(0)
+            continue
+        tokens = tokenizer(text)
+        ids.extend(vocab.setdefault(token, len(vocab)) for token in tokens)
+        lengths.append(len(tokens))
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return np.asarray(ids, dtype=np.int32), offsets, vocab
+
+
+def ngram_keys(ids, offsets, n, vocab_size):
+    """
+    Packs every n-gram that does not cross a row boundary into one int64 key
+
+    Parameters:
+    - ids (ndarray): the token ids of all rows
+    - offsets (ndarray): row boundaries in ids
+    - n (int): size of the n-grams
+    - vocab_size (int): number of distinct token ids
+
+    Returns:
+    - tuple: (keys, positions) the n-gram keys and the position in ids where each n-gram starts
+    """
+    if n < 1:
+        raise ValueError("number of n-grams should be >=1")
+    base = max(vocab_size, 1)
+    if base ** n >= 2 ** 63:
+        raise ValueError(f"{n}-grams over a vocabulary of {vocab_size} tokens do not fit in int64 keys")
+
+    rows = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    positions = np.arange(len(ids) - n + 1) if len(ids) >= n else np.arange(0)
+    positions = positions[positions + n <= offsets[rows[positions] + 1]]
+
+    keys = np.zeros(len(positions), dtype=np.int64)
+    for k in range(n):
+        keys = keys * base + ids[positions + k]
+    return keys, positions
+
+
+def decode_key(key, n, tokens):
+    """
+    Returns the token tuple of an n-gram key
+
+    Parameters:
+    - key (int): the packed n-gram
+    - n (int): size of the n-gram
+    - tokens (list): tokens by id
+
+    Returns:
+    - tuple: the n-gram tokens
+    """
+    base = max(len(tokens), 1)
+    parts = []
+    for _ in range(n):
+        key, token_id = divmod(int(key), base)
+        parts.append(tokens[token_id])
+    return tuple(reversed(parts))
+
+
+def top_ngrams_encoded(ids, offsets, vocab, ns=(1, 2, 3), k=10, groups=None):
+    """
+    Returns the k most frequent n-grams of each size for each group of rows, from already encoded texts.
+    Ties are broken by first occurrence, as Counter.most_common does.
+
+    Parameters:
+    - ids (ndarray): the token ids of all rows
+    - offsets (ndarray): row boundaries in ids
+    - vocab (dict): token to id mapping
+    - ns (tuple): sizes of the n-grams (default is (1, 2, 3))
+    - k (int): number of n-grams to return (default is 10)
+    - groups (array-like): group label of each row, rows labelled None are left out (default is None, a single
+      group labelled None holding all the rows)
+
+    Returns:
+    - dict: {(group, n): [(ngram tuple, count), ...]} in decreasing order of count
+    """
+    tokens = [None] * len(vocab)
+    for token, token_id in vocab.items():
+        tokens[token_id] = token
+
+    n_rows = len(offsets) - 1
+    if groups is None:
+        labels = [None]
+        row_codes = np.zeros(n_rows, dtype=np.int64)
+    else:
+        row_codes, labels = pd.factorize(pd.Series(groups, dtype=object), use_na_sentinel=True)
+        labels = list(labels)
+    rows = np.repeat(np.arange(n_rows), np.diff(offsets))
+
+    result = {}
+    for n in ns:
+        keys, positions = ngram_keys(ids, offsets, n, len(vocab))
+        codes = row_codes[rows[positions]] if len(positions) else np.zeros(0, dtype=np.int64)
+        keep = codes >= 0
+        keys, positions, codes = keys[keep], positions[keep], codes[keep]
+
+        # Sort by group, then n-gram, then position: each run is one n-gram of one group, starting at its
+        # first occurrence
+        order = np.lexsort((positions, keys, codes))
+        keys, positions, codes = keys[order], positions[order], codes[order]
+        starts = np.flatnonzero(np.r_[True, (keys[1:] != keys[:-1]) | (codes[1:] != codes[:-1])])
+        counts = np.diff(np.r_[starts, len(keys)])
+        run_codes = codes[starts]
+
+        for code, label in enumerate(labels):
+            runs = np.flatnonzero(run_codes == code)
+            top = runs[np.lexsort((positions[starts[runs]], -counts[runs]))][:k]
+            result[(label, n)] = [(decode_key(keys[starts[run]], n, tokens), int(counts[run])) for run in top]
+    return result
+
+
+def top_ngrams(texts, ns=(1, 2, 3), k=10, groups=None):
+    """
+    Returns the k most frequent n-grams of each size for each group of rows, tokenizing the texts only once
+
+    Parameters:
+    - texts (iterable): the cleaned texts, None values are skipped
+    - ns (tuple): sizes of the n-grams (default is (1, 2, 3))
+    - k (int): number of n-grams to return (default is 10)
+    - groups (array-like): group label of each text, e.g. 'high' for ratings >= 4 and 'low' for ratings <= 2,
+      texts labelled None are left out (default is None, a single group labelled None)
+
+    Returns:
+    - dict: {(group, n): [(ngram tuple, count), ...]} in decreasing order of count
+    """
+    ids, offsets, vocab = encode_texts(texts)
+    return top_ngrams_encoded(ids, offsets, vocab, ns=ns, k=k, groups=groups)
+
+
+def top_frequent_words(df, col_name, ngrams_num=1, num_top_words=10):
+    """
+    Create top words for the text
+
+    Parameters:
+    df (DataFrame): DataFrame containing the text column
+    col_name (str): column name that contains the text
+    ngrams_num (int): size of n-grams
+    num_top_words (int): size of top words
+
+    Returns:
+    list: the n-grams and their frequencies
+    """
+    if ngrams_num < 1:
+        raise ValueError("number of n-grams should be >=1")
+    return top_ngrams(df[col_name], ns=(ngrams_num,), k=num_top_words)[(None, ngrams_num)]
@@ -0,0 +1,307 @@
+## Bounded-memory, mergeable n-gram summaries per (asin, rating bucket)
+
+import gzip
+import json
+import os
+from collections import Counter
+from Preprocessing import get_default_cleaner, tokenize
+
+
+SKETCH_VERSION = 1
+
+# Stands for all the asins or all the rating buckets in the keys of the rolled-up summaries
+ALL = '*'
+
+
+def rating_bucket(rating):
+    """
+    Returns the rating bucket used by the reports: '4_above', '3' or '2_below'
+
+    Parameters:
+    - rating: the review rating, anything that is not a number gives 'unrated'
+
+    Returns:
+    - str: the bucket name
+    """
+    try:
+        rating = float(rating)
+    except (TypeError, ValueError):
+        return 'unrated'
+    if rating >= 4:
+        return '4_above'
+    if rating <= 2:
+        return '2_below'
+    return '3'
+
+
+def _rollup_keys(asin, bucket, n):
+    # The summary of the group and the ones of all the asins, of all the rating buckets and of all the reviews
+    return [(asin, bucket, n), (ALL, bucket, n), (asin, ALL, n), (ALL, ALL, n)]
+
+
+class SpaceSaving:
+    """
+    Space-Saving heavy hitter summary. At most capacity n-grams are kept, each with an overestimated count and
+    the maximum overestimation, so that count - error <= true count <= count. An n-gram that is not kept
+    occurred at most min_count() times. Summaries built separately can be merged with the same guarantees.
+
+    Parameters:
+    - capacity (int): number of n-grams kept (default is 1000), None keeps all of them and counts exactly
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.counts = {}
+        self.total = 0
+
+    def is_full(self):
+        return self.capacity is not None and len(self.counts) >= self.capacity
+
+    def min_count(self):
+        """
+        Returns the upper bound on the count of any n-gram that is not kept
+        """
+        if not self.is_full():
+            return 0
+        return min(count for count, _ in self.counts.values())
+
+    def _merge_counts(self, other_counts, other_min, other_total):
+        own_min = self.min_count()
+        merged = {}
+        for item in self.counts.keys() | other_counts.keys():
+            count, error = self.counts.get(item, (own_min, own_min))
+            other_count, other_error = other_counts.get(item, (other_min, other_min))
+            merged[item] = (count + other_count, error + other_error)
+        if self.capacity is not None and len(merged) > self.capacity:
+            kept = sorted(merged.items(), key=lambda entry: entry[1][0], reverse=True)[:self.capacity]
+            merged = dict(kept)
+        self.counts = merged
+        self.total += other_total
+
+    def update(self, counter):
+        """
+        Adds exact counts, e.g. the n-grams of a batch of new reviews
+
+        Parameters:
+        - counter (dict): count of each n-gram
+        """
+        counts = {item: (count, 0) for item, count in counter.items()}
+        self._merge_counts(counts, 0, sum(counter.values()))
+
+    def merge(self, other):
+        """
+        Adds another summary, built e.g. from another shard or scrape run
+
+        Parameters:
+        - other (SpaceSaving): the summary to add
+        """
+        self._merge_counts(other.counts, other.min_count(), other.total)
+
+    def top_k(self, k=10):
+        """
+        Returns the k n-grams with the highest counts
+
+        Parameters:
+        - k (int): number of n-grams (default is 10)
+
+        Returns:
+        - list: (ngram, count, error) tuples in decreasing order of count, the true count is between
+          count - error and count
+        """
+        top = sorted(self.counts.items(), key=lambda entry: entry[1][0], reverse=True)[:k]
+        return [(item, count, error) for item, (count, error) in top]
+
+    def to_dict(self):
+        return {'capacity': self.capacity, 'total': self.total,
+                'items': [[item, count, error] for item, (count, error) in self.counts.items()]}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['capacity'])
+        sketch.total = data['total']
+        sketch.counts = {item: (count, error) for item, count, error in data['items']}
+        return sketch
+
+
+class NGramSketchIndex:
+    """
+    Persistent n-gram summaries per (asin, rating bucket, n), updated with the reviews added to the collection
+    since the last update and answering top-k queries without going back to the reviews. The _ids of the
+    reviews read from the collection are kept with the index. The summaries of every asin, of every rating
+    bucket and of all the reviews are kept up to date too, so that a query reads a single summary however many
+    asins there are.
+
+    Parameters:
+    - ns (tuple): sizes of the n-grams tracked (default is (2, 3))
+    - capacity (int): n-grams kept per summary (default is 1000), None counts exactly, e.g. for validation
+    """
+
+    def __init__(self, ns=(2, 3), capacity=1000):
+        self.ns = tuple(ns)
+        self.capacity = capacity
+        self.sketches = {}
+        # _ids of the reviews read from the collection by update_from_collection
+        self.ingested = set()
+
+    def _sketch(self, asin, bucket, n):
+        key = (asin, bucket, n)
+        if key not in self.sketches:
+            self.sketches[key] = SpaceSaving(self.capacity)
+        return self.sketches[key]
+
+    def add_reviews(self, reviews, text_col='review_comment', cleaner=None):
+        """
+        Adds a batch of reviews, as scraped by AmazonScrapper.get_reviews or read from the collection
+
+        Parameters:
+        - reviews (iterable): review dicts with 'asin', 'ratings' and the text column
+        - text_col (str): the field holding the review text (default is 'review_comment')
+        - cleaner (TextCleaner): cleaner applied to the raw text (default is the shared english cleaner),
+          pass False when the text is already cleaned
+
+        Returns:
+        - int: number of reviews added
+        """
+        if cleaner is None:
+            cleaner = get_default_cleaner()
+        batches = {}
+        added = 0
+        for review in reviews:
+            text = review.get(text_col)
+            if not isinstance(text, str):
+                continue
+            if cleaner:
+                text = cleaner.clean(text)
+            tokens = tokenize(text)
+            group = (review.get('asin'), rating_bucket(review.get('ratings')))
+            for n in self.ns:
+                counter = batches.setdefault(group + (n,), Counter())
+                counter.update(' '.join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+            added += 1
+        rolled_up = {}
+        for (asin, bucket, n), counter in batches.items():
+            for key in _rollup_keys(asin, bucket, n):
+                rolled_up.setdefault(key, Counter()).update(counter)
+        for key, counter in rolled_up.items():
+            self._sketch(*key).update(counter)
+        return added
+
+    def update_from_collection(self, mongo_ops, db_name, collection_name, batch_size=1000, cleaner=None):
+        """
+        Adds the reviews of the collection that were not read by an earlier update. The _ids of the stored
+        reviews are read from the _id index and compared with the ones already read: the _ids are generated by
+        the writers, e.g. by pymongo in bulk_load, and are not committed in increasing order, so that no _id
+        can serve as a high-water mark.
+
+        Parameters:
+        - mongo_ops (MongoDBOps): the MongoDB operations object
+        - db_name (str): name of the database
+        - collection_name (str): name of the collection holding the reviews
+        - batch_size (int): number of reviews added at a time (default is 1000)
+        - cleaner (TextCleaner): cleaner applied to the raw text, see add_reviews (default is None)
+
+        Returns:
+        - int: number of reviews added
+        """
+        try:
+            collection = mongo_ops.get_collection(collection_name=collection_name, db_name=db_name)
+            stored_ids = (doc['_id'] for doc in collection.find({}, {'_id': 1}))
+            new_ids = [doc_id for doc_id in stored_ids if str(doc_id) not in self.ingested]
+            added = 0
+            for i in range(0, len(new_ids), batch_size):
+                reviews = list(collection.find({'_id': {'$in': new_ids[i:i + batch_size]}},
+                                               {'asin': 1, 'ratings': 1, 'review_comment': 1}))
+                added += self.add_reviews(reviews, cleaner=cleaner)
+                self.ingested.update(str(review['_id']) for review in reviews)
+            return added
+        except Exception as e:
+            raise Exception(f"update_from_collection: Failed to read the reviews of {collection_name} - {str(e)}")
+
+    def merge(self, other):
+        """
+        Adds the summaries of another index, e.g. built on another shard or in another run
+
+        Parameters:
+        - other (NGramSketchIndex): the index to add
+        """
+        # The rolled-up summaries of the other index are merged into the rolled-up ones
+        for (asin, bucket, n), sketch in other.sketches.items():
+            self._sketch(asin, bucket, n).merge(sketch)
+        self.ingested |= other.ingested
+
+    def top_k(self, n, k=10, asin=None, bucket=None):
+        """
+        Returns the most frequent n-grams for an asin and/or rating bucket
+
+        Parameters:
+        - n (int): size of the n-grams
+        - k (int): number of n-grams (default is 10)
+        - asin (str): only count reviews of this asin (default is None, all asins)
+        - bucket (str): only count reviews of this rating bucket, see rating_bucket (default is None, all)
+
+        Returns:
+        - list: (ngram tuple, count, error) in decreasing order of count, the true count is between
+          count - error and count
+        """
+        sketch = self.sketches.get((ALL if asin is None else asin, ALL if bucket is None else bucket, n))
+        if sketch is None:
+            return []
+        return [(tuple(item.split(' ')), count, error) for item, count, error in sketch.top_k(k)]
+
+    def save(self, path):
+        """
+        Saves the index as gzipped JSON
+
+        Parameters:
+        - path (str): the file to write
+        """
+        try:
+            data = {'version': SKETCH_VERSION, 'ns': list(self.ns), 'capacity': self.capacity,
+                    'ingested': sorted(self.ingested),
+                    'sketches': [dict(asin=asin, bucket=bucket, n=n, **sketch.to_dict())
+                                 for (asin, bucket, n), sketch in self.sketches.items()]}
+            with gzip.open(path, 'wt', encoding='utf-8') as f:
+                json.dump(data, f)
+        except Exception as e:
+            raise Exception(f"save: Failed to save the n-gram index to {path} - {str(e)}")
+
+    @classmethod
+    def open(cls, path, ns=(2, 3), capacity=1000):
+        """
+        Loads the index saved at path, or creates an empty one if the file does not exist yet
+
+        Parameters:
+        - path (str): the index file
+        - ns (tuple): sizes of the n-grams tracked by a new index (default is (2, 3))
+        - capacity (int): n-grams kept per summary of a new index (default is 1000)
+
+        Returns:
+        - NGramSketchIndex: the index
+        """
+        if os.path.exists(path):
+            return cls.load(path)
+        return cls(ns=ns, capacity=capacity)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads an index saved with save
+
+        Parameters:
+        - path (str): the file to read
+
+        Returns:
+        - NGramSketchIndex: the loaded index
+        """
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                data = json.load(f)
+            if data['version'] != SKETCH_VERSION:
+                raise ValueError(f"unsupported version {data['version']}")
+            index = cls(ns=data['ns'], capacity=data['capacity'])
+            index.ingested = set(data['ingested'])
+            for entry in data['sketches']:
+                index.sketches[(entry['asin'], entry['bucket'], entry['n'])] = SpaceSaving.from_dict(entry)
+            return index
+        except Exception as e:
+            raise Exception(f"load: Failed to load the n-gram index from {path} - {str(e)}")
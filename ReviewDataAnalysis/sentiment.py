@@ -0,0 +1,205 @@
+## Batched sentiment scoring with the RoBERTa sentiment model
+
+import numpy as np
+import pandas as pd
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+from analysis_metrics import METRICS
+from sentiment_backends import load_backend
+
+
+MODEL = "cardiffnlp/twitter-roberta-base-sentiment"
+LABELS = ['neg', 'neu', 'pos']
+
+
+def softmax(logits):
+    """
+    Row-wise softmax over a 2-d array of logits
+
+    Parameters:
+    - logits (ndarray): array of shape (n, classes)
+
+    Returns:
+    - ndarray: the probabilities, each row sums to 1
+    """
+    logits = np.asarray(logits, dtype=np.float64)
+    exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def review_texts(df, text_col='review_comment', fallback_col='review_title'):
+    """
+    Returns the text to be scored for every review: the review comment, or the review title when the comment
+    is missing
+
+    Parameters:
+    - df (DataFrame): the reviews
+    - text_col (str): the column scored by default (default is 'review_comment')
+    - fallback_col (str): the column used when text_col is missing (default is 'review_title')
+
+    Returns:
+    - list: one text per row, in row order
+    """
+    texts = df[text_col].where(df[text_col].notna(), df[fallback_col])
+    return ['' if pd.isna(text) else str(text) for text in texts]
+
+
+class SentimentScorer:
+    """
+    Scores review texts with a sequence classification model in batches.
+
+    Texts are tokenized once, sorted by length and padded per batch only to the longest text of that batch.
+    Texts longer than the model input are split into overlapping windows and the window probabilities are
+    averaged, weighted by the number of tokens of each window.
+
+    Parameters:
+    - model_name (str): name or path of the pretrained model (default is MODEL)
+    - tokenizer: an already loaded tokenizer, loaded from model_name when None
+    - model: an already loaded model, loaded from model_name when None
+    - max_length (int): maximum number of tokens per model input, special tokens included (default is 512)
+    - stride (int): number of tokens shared by consecutive windows of a long text (default is 128)
+    - backend (str): inference backend, 'eager', 'int8' or 'onnx' (default is 'eager')
+    - cache_dir (str): where converted int8/onnx artifacts are cached (default is ~/.cache/neemai_sentiment)
+    """
+
+    def __init__(self, model_name=MODEL, tokenizer=None, model=None, max_length=512, stride=128, backend='eager',
+                 cache_dir=None):
+        """
+        Initialize the SentimentScorer object
+
+        Parameters:
+        - model_name (str): name or path of the pretrained model (default is MODEL)
+        - tokenizer: an already loaded tokenizer, loaded from model_name when None
+        - model: an already loaded model, loaded from model_name when None
+        - max_length (int): maximum number of tokens per model input, special tokens included (default is 512)
+        - stride (int): number of tokens shared by consecutive windows of a long text (default is 128)
+        - backend (str): inference backend, 'eager', 'int8' or 'onnx' (default is 'eager')
+        - cache_dir (str): where converted int8/onnx artifacts are cached (default is ~/.cache/neemai_sentiment)
+        """
+        self.model_name = model_name
+        self.tokenizer = tokenizer if tokenizer is not None else AutoTokenizer.from_pretrained(model_name)
+        self.model = model if model is not None else AutoModelForSequenceClassification.from_pretrained(model_name)
+        self.model.eval()
+        self.backend_name = backend
+        self.backend = load_backend(backend, self.model, model_name, cache_dir=cache_dir)
+        # Identifies the scores produced by this scorer, quantized and exported backends differ slightly from eager
+        self.model_id = model_name if backend == 'eager' else f"{model_name}#{backend}"
+        self.max_length = max_length
+        # Special tokens the tokenizer puts around a single text, e.g. <s> and </s> for RoBERTa
+        bare = self.tokenizer('a', add_special_tokens=False)['input_ids']
+        full = self.tokenizer('a')['input_ids']
+        cut = next(i for i in range(len(full)) if full[i:i + len(bare)] == bare)
+        self.prefix_ids, self.suffix_ids = full[:cut], full[cut + len(bare):]
+        self.window = max_length - len(self.prefix_ids) - len(self.suffix_ids)
+        if not 0 <= stride < self.window:
+            raise ValueError(f"stride should be between 0 and {self.window - 1}")
+        self.stride = stride
+
+    def _windows(self, token_ids):
+        """
+        Split the token ids of one text into model inputs of at most max_length tokens
+        """
+        if len(token_ids) <= self.window:
+            return [self.prefix_ids + token_ids + self.suffix_ids]
+        step = self.window - self.stride
+        starts = range(0, len(token_ids) - self.stride, step)
+        return [self.prefix_ids + token_ids[start:start + self.window] + self.suffix_ids for start in starts]
+
+    def predict_logits(self, input_ids, batch_size=32):
+        """
+        Run the model over a list of model inputs
+
+        Parameters:
+        - input_ids (list): list of token id lists, special tokens included
+        - batch_size (int): number of inputs per forward pass (default is 32)
+
+        Returns:
+        - ndarray: the logits, one row per input in the input order
+        """
+        order = sorted(range(len(input_ids)), key=lambda i: len(input_ids[i]))
+        logits = np.empty((len(input_ids), self.model.config.num_labels), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            batch_idx = order[start:start + batch_size]
+            batch = self.tokenizer.pad({'input_ids': [input_ids[i] for i in batch_idx]},
+                                       padding=True, return_tensors='np')
+            logits[batch_idx] = self.backend(batch['input_ids'], batch['attention_mask'])
+        return logits
+
+    def score_batch(self, texts, batch_size=32):
+        """
+        Returns the polarity scores of the input texts
+
+        Parameters:
+        - texts (list): the texts to be scored
+        - batch_size (int): number of model inputs per forward pass (default is 32)
+
+        Returns:
+        - ndarray: array of shape (len(texts), 3) with the negative, neutral and positive scores
+        """
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, len(LABELS)))
+        with METRICS.time('tokenize', backend=self.backend_name):
+            encoded = self.tokenizer(texts, add_special_tokens=False)['input_ids']
+
+        owners = []
+        inputs = []
+        for i, token_ids in enumerate(encoded):
+            windows = self._windows(token_ids)
+            owners.extend([i] * len(windows))
+            inputs.extend(windows)
+
+        with METRICS.time('score', backend=self.backend_name):
+            probs = softmax(self.predict_logits(inputs, batch_size=batch_size))
+        METRICS.count('texts_scored', len(texts), backend=self.backend_name)
+        METRICS.count('score_windows', len(inputs), backend=self.backend_name)
+        if len(inputs) == len(texts):
+            return probs
+
+        owners = np.asarray(owners)
+        weights = np.array([len(ids) for ids in inputs], dtype=np.float64)
+        scores = np.zeros((len(texts), probs.shape[1]))
+        np.add.at(scores, owners, probs * weights[:, None])
+        return scores / np.bincount(owners, weights=weights)[:, None]
+
+    def score_df(self, df, text_col='review_comment', fallback_col='review_title', batch_size=32):
+        """
+        Returns the polarity scores of every review of a DataFrame, scoring the review comment or, when it is
+        missing, the review title
+
+        Parameters:
+        - df (DataFrame): the reviews
+        - text_col (str): the column scored by default (default is 'review_comment')
+        - fallback_col (str): the column used when text_col is missing (default is 'review_title')
+        - batch_size (int): number of model inputs per forward pass (default is 32)
+
+        Returns:
+        - DataFrame: neg, neu and pos columns with the index of df
+        """
+        scores = self.score_batch(review_texts(df, text_col, fallback_col), batch_size=batch_size)
+        return pd.DataFrame(scores, index=df.index, columns=LABELS)
+
+
+def compare_backends(texts, model_name=MODEL, backends=('int8', 'onnx'), batch_size=32, cache_dir=None):
+    """
+    Scores the texts with the eager model and with each of the other backends and reports how far their scores
+    are from the eager ones
+
+    Parameters:
+    - texts (list): the texts to be scored
+    - model_name (str): name or path of the pretrained model (default is MODEL)
+    - backends (tuple): backends to compare against eager mode (default is ('int8', 'onnx'))
+    - batch_size (int): number of model inputs per forward pass (default is 32)
+    - cache_dir (str): where converted artifacts are cached (default is ~/.cache/neemai_sentiment)
+
+    Returns:
+    - dict: the maximum absolute score deviation from eager mode for each backend
+    """
+    eager = SentimentScorer(model_name)
+    reference = eager.score_batch(texts, batch_size=batch_size)
+    deviations = {}
+    for backend in backends:
+        scorer = SentimentScorer(model_name, tokenizer=eager.tokenizer, model=eager.model, backend=backend,
+                                 cache_dir=cache_dir)
+        scores = scorer.score_batch(texts, batch_size=batch_size)
+        deviations[backend] = float(np.abs(scores - reference).max()) if len(texts) else 0.0
+    return deviations
@@ -0,0 +1,197 @@
+## CPU inference backends for the sentiment model
+
+import copy
+import hashlib
+import os
+import numpy as np
+import torch
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "neemai_sentiment")
+
+
+def model_fingerprint(model):
+    """
+    Returns a hash of the configuration and weights of a model, so that a fine-tuned or updated model saved
+    under the same name gets artifacts of its own
+
+    Parameters:
+    - model: the loaded sequence classification model
+
+    Returns:
+    - str: hex digest
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(model.config.to_json_string().encode('utf-8'))
+    for name, tensor in model.state_dict().items():
+        digest.update(name.encode('utf-8'))
+        digest.update(str(tensor.dtype).encode('utf-8'))
+        digest.update(tensor.detach().cpu().contiguous().view(-1).view(torch.uint8).numpy())
+    return digest.hexdigest()
+
+
+def model_cache_dir(model, model_name, cache_dir=None):
+    """
+    Returns the directory where the converted artifacts of a model are cached, creating it if needed
+
+    Parameters:
+    - model: the loaded sequence classification model, its fingerprint keys the directory
+    - model_name (str): name or path of the pretrained model
+    - cache_dir (str): root cache directory (default is ~/.cache/neemai_sentiment)
+
+    Returns:
+    - str: the directory for this model
+    """
+    path = os.path.join(cache_dir or DEFAULT_CACHE_DIR, model_name.strip("/").replace("/", "--"),
+                        model_fingerprint(model))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class EagerBackend:
+    """
+    Runs the full precision PyTorch model as it is.
+
+    Parameters:
+    - model: the loaded sequence classification model
+    """
+    name = 'eager'
+
+    def __init__(self, model, model_name=None, cache_dir=None):
+        self.model = model.eval()
+
+    def __call__(self, input_ids, attention_mask):
+        """
+        Returns the logits of one padded batch
+
+        Parameters:
+        - input_ids (ndarray): token ids of shape (batch, length)
+        - attention_mask (ndarray): attention mask of shape (batch, length)
+
+        Returns:
+        - ndarray: logits of shape (batch, labels)
+        """
+        with torch.inference_mode():
+            output = self.model(input_ids=torch.from_numpy(input_ids),
+                                attention_mask=torch.from_numpy(attention_mask))
+        return output.logits.float().numpy()
+
+
+class QuantizedBackend(EagerBackend):
+    """
+    Runs the model with its Linear layers dynamically quantized to int8. The quantized weights are saved on
+    first use, later runs load them into int8 layers without quantizing the model again.
+
+    Parameters:
+    - model: the loaded sequence classification model, a quantized copy of it is used
+    - model_name (str): name of the model, used for the cache location
+    - cache_dir (str): root cache directory (default is ~/.cache/neemai_sentiment)
+    """
+    name = 'int8'
+
+    def __init__(self, model, model_name, cache_dir=None):
+        path = os.path.join(model_cache_dir(model, model_name, cache_dir), "int8_state_dict.pt")
+        if os.path.exists(path):
+            quantized = self.int8_layers(model)
+            quantized.load_state_dict(torch.load(path, weights_only=True))
+        else:
+            quantized = torch.ao.quantization.quantize_dynamic(model.eval(), {torch.nn.Linear}, dtype=torch.qint8)
+            torch.save(quantized.state_dict(), path + ".tmp")
+            os.replace(path + ".tmp", path)
+        super().__init__(quantized)
+
+    @staticmethod
+    def int8_layers(model):
+        """
+        Returns a copy of the model with empty int8 layers in place of the Linear layers that quantize_dynamic
+        converts, to load saved quantized weights into
+
+        Parameters:
+        - model: the loaded sequence classification model
+
+        Returns:
+        - the copy of the model
+        """
+        copied = copy.deepcopy(model.eval())
+        for parent in list(copied.modules()):
+            for child_name, child in list(parent.named_children()):
+                if type(child) is torch.nn.Linear:
+                    setattr(parent, child_name, torch.ao.nn.quantized.dynamic.Linear(
+                        child.in_features, child.out_features, bias_=child.bias is not None, dtype=torch.qint8))
+        return copied
+
+
+class OnnxBackend:
+    """
+    Runs the model with ONNX Runtime. The model is exported to ONNX with dynamic batch and sequence axes on
+    first use and the exported file is reused afterwards.
+
+    Parameters:
+    - model: the loaded sequence classification model
+    - model_name (str): name of the model, used for the cache location
+    - cache_dir (str): root cache directory (default is ~/.cache/neemai_sentiment)
+    """
+    name = 'onnx'
+
+    def __init__(self, model, model_name, cache_dir=None):
+        import onnxruntime
+
+        path = os.path.join(model_cache_dir(model, model_name, cache_dir), "model.onnx")
+        if not os.path.exists(path):
+            self.export(model, path)
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+
+    @staticmethod
+    def export(model, path):
+        """
+        Export the model to an ONNX file
+
+        Parameters:
+        - model: the loaded sequence classification model
+        - path (str): the file to write
+        """
+        dummy = torch.ones((2, 8), dtype=torch.long)
+        tmp_path = path + ".tmp"
+        torch.onnx.export(model.eval(), (dummy, dummy), tmp_path, dynamo=False,
+                          input_names=['input_ids', 'attention_mask'], output_names=['logits'],
+                          dynamic_axes={'input_ids': {0: 'batch', 1: 'sequence'},
+                                        'attention_mask': {0: 'batch', 1: 'sequence'},
+                                        'logits': {0: 'batch'}})
+        os.replace(tmp_path, path)
+
+    def __call__(self, input_ids, attention_mask):
+        """
+        Returns the logits of one padded batch
+
+        Parameters:
+        - input_ids (ndarray): token ids of shape (batch, length)
+        - attention_mask (ndarray): attention mask of shape (batch, length)
+
+        Returns:
+        - ndarray: logits of shape (batch, labels)
+        """
+        return self.session.run(['logits'], {'input_ids': input_ids.astype(np.int64),
+                                             'attention_mask': attention_mask.astype(np.int64)})[0]
+
+
+BACKENDS = {backend.name: backend for backend in (EagerBackend, QuantizedBackend, OnnxBackend)}
+
+
+def load_backend(name, model, model_name, cache_dir=None):
+    """
+    Returns an inference backend for the model
+
+    Parameters:
+    - name (str): one of 'eager', 'int8' or 'onnx'
+    - model: the loaded sequence classification model
+    - model_name (str): name of the model, used for the cache location of converted artifacts
+    - cache_dir (str): root cache directory (default is ~/.cache/neemai_sentiment)
+
+    Returns:
+    - callable taking input_ids and attention_mask arrays and returning the logits
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"unknown backend {name}, expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name](model, model_name=model_name, cache_dir=cache_dir)
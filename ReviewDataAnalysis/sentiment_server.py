@@ -0,0 +1,362 @@
+## Local sentiment scoring server keeping the model loaded, and its client
+#
+# Start it once with:  python sentiment_server.py --port 8765 --backend eager
+# then score from a notebook or script with SentimentClient().score_batch(texts), or with connect_scorer() to fall
+# back to scoring in-process when the server is not running
+
+import argparse
+import json
+import logging
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+from sentiment import LABELS, MODEL, SentimentScorer, review_texts
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+logger = logging.getLogger(__name__)
+
+
+def validate_texts(payload):
+    """
+    Returns the texts of a /score request body, raises ValueError if it is not {"texts": [str, ...]}
+    """
+    texts = payload.get('texts') if isinstance(payload, dict) else None
+    if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+        raise ValueError("the body should be {\"texts\": [str, ...]}")
+    return texts
+
+
+class _Request:
+    """
+    Texts of one client request waiting to be scored
+    """
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.received = time.perf_counter()
+        self.done = threading.Event()
+        self.scores = None
+        self.error = None
+
+
+class MicroBatcher:
+    """
+    Merges concurrent scoring requests into micro-batches. The first waiting request opens a batch, which is
+    run as soon as it holds max_batch texts or max_wait_ms milliseconds have passed.
+
+    Parameters:
+    - scorer (SentimentScorer): the loaded scorer
+    - max_batch (int): maximum number of texts per micro-batch (default is 64)
+    - max_wait_ms (float): how long the first request of a batch waits for others (default is 10)
+    - batch_size (int): number of model inputs per forward pass (default is 32)
+    """
+
+    def __init__(self, scorer, max_batch=64, max_wait_ms=10, batch_size=32):
+        self.scorer = scorer
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=10000)
+        self.batch_sizes = deque(maxlen=10000)
+        self.requests_served = 0
+        self.texts_served = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, texts):
+        """
+        Scores the texts together with whatever other requests arrive in the same window
+
+        Parameters:
+        - texts (list): the texts to be scored
+
+        Returns:
+        - ndarray: array of shape (len(texts), 3) with the negative, neutral and positive scores
+        """
+        request = _Request(list(texts))
+        self.queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.scores
+
+    def _collect(self):
+        """
+        Blocks for the first request, then gathers more until the batch is full or the window has passed
+        """
+        batch = [self.queue.get()]
+        n_texts = len(batch[0].texts)
+        deadline = time.perf_counter() + self.max_wait
+        while n_texts < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            n_texts += len(request.texts)
+        return batch
+
+    def _score_alone(self, batch):
+        """
+        Scores the requests of a failed micro-batch one at a time, so that only the failing ones get the error
+        """
+        for request in batch:
+            try:
+                request.scores = self.scorer.score_batch(request.texts, batch_size=self.batch_size)
+            except Exception as e:
+                request.error = e
+            request.done.set()
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for request in batch for text in request.texts]
+            try:
+                scores = self.scorer.score_batch(texts, batch_size=self.batch_size)
+            except Exception:
+                self._score_alone(batch)
+                continue
+
+            finished = time.perf_counter()
+            start = 0
+            for request in batch:
+                request.scores = scores[start:start + len(request.texts)]
+                start += len(request.texts)
+                request.done.set()
+            with self.lock:
+                self.batch_sizes.append(len(texts))
+                self.latencies.extend(finished - request.received for request in batch)
+                self.requests_served += len(batch)
+                self.texts_served += len(texts)
+
+    def metrics(self):
+        """
+        Returns the queue depth, micro-batch sizes and request latency percentiles
+
+        Returns:
+        - dict: the server metrics, latencies are in milliseconds
+        """
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000
+            batch_sizes = np.array(self.batch_sizes)
+            metrics = {'queue_depth': self.queue.qsize(),
+                       'requests_served': self.requests_served,
+                       'texts_served': self.texts_served,
+                       'batches': len(batch_sizes)}
+        if len(batch_sizes):
+            metrics['batch_size_mean'] = float(batch_sizes.mean())
+            metrics['batch_size_max'] = int(batch_sizes.max())
+        if len(latencies):
+            for p in (50, 90, 99):
+                metrics[f'latency_p{p}_ms'] = float(np.percentile(latencies, p))
+        return metrics
+
+
+def make_handler(batcher):
+    """
+    Returns the HTTP request handler class serving the batcher
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                self._send(200, batcher.metrics())
+            elif self.path == "/health":
+                self._send(200, {'status': 'ok', 'model_id': batcher.scorer.model_id, 'max_batch': batcher.max_batch})
+            else:
+                self._send(404, {'error': f"unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path != "/score":
+                self._send(404, {'error': f"unknown path {self.path}"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                texts = validate_texts(json.loads(self.rfile.read(length)))
+            except ValueError as e:
+                # Also raised by json for a body that is not JSON
+                self._send(400, {'error': str(e)})
+                return
+            try:
+                scores = batcher.submit(texts)
+                self._send(200, {'model_id': batcher.scorer.model_id, 'scores': scores.tolist()})
+            except Exception as e:
+                self._send(500, {'error': str(e)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(scorer, host=DEFAULT_HOST, port=DEFAULT_PORT, max_batch=64, max_wait_ms=10, batch_size=32):
+    """
+    Serves the scorer over HTTP until interrupted
+
+    Parameters:
+    - scorer (SentimentScorer): the loaded scorer
+    - host (str): address to listen on (default is 127.0.0.1)
+    - port (int): port to listen on (default is 8765)
+    - max_batch (int): maximum number of texts per micro-batch (default is 64)
+    - max_wait_ms (float): how long the first request of a batch waits for others (default is 10)
+    - batch_size (int): number of model inputs per forward pass (default is 32)
+    """
+    batcher = MicroBatcher(scorer, max_batch=max_batch, max_wait_ms=max_wait_ms, batch_size=batch_size)
+    server = ThreadingHTTPServer((host, port), make_handler(batcher))
+    print(f"Scoring with {scorer.model_id} on http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+class SentimentClient:
+    """
+    Client of the local scoring server, with the same score_batch and model_id as SentimentScorer so that it can
+    be used in its place.
+
+    Parameters:
+    - host (str): address of the server (default is 127.0.0.1)
+    - port (int): port of the server (default is 8765)
+    - timeout (float): request timeout in seconds (default is 300)
+    - chunk_size (int): number of texts sent per request (default is None, the max_batch of the server), so
+      that a large input is scored in micro-batch sized requests, each within the timeout
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=300, chunk_size=None):
+        self.url = f"http://{host}:{port}"
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self._model_id = None
+
+    def _request(self, path, payload=None):
+        data = None if payload is None else json.dumps(payload).encode("utf-8")
+        request = urllib.request.Request(self.url + path, data=data, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise Exception(f"SentimentClient: request to {self.url + path} failed - {e.code} "
+                            f"{e.read().decode('utf-8', 'replace')}")
+        except Exception as e:
+            raise Exception(f"SentimentClient: request to {self.url + path} failed - {str(e)}")
+
+    def _health(self):
+        health = self._request("/health")
+        self._model_id = health['model_id']
+        if self.chunk_size is None:
+            self.chunk_size = health.get('max_batch', 64)
+
+    @property
+    def model_id(self):
+        if self._model_id is None:
+            self._health()
+        return self._model_id
+
+    def score_batch(self, texts, batch_size=None):
+        """
+        Returns the polarity scores of the input texts
+
+        Parameters:
+        - texts (list): the texts to be scored, sent chunk_size texts per request
+        - batch_size: unused, the server decides the batching
+
+        Returns:
+        - ndarray: array of shape (len(texts), 3) with the negative, neutral and positive scores
+        """
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, len(LABELS)))
+        if self.chunk_size is None:
+            self._health()
+        scores = [self._request("/score", {'texts': texts[start:start + self.chunk_size]})['scores']
+                  for start in range(0, len(texts), self.chunk_size)]
+        return np.concatenate([np.array(chunk).reshape(-1, len(LABELS)) for chunk in scores])
+
+    def score_df(self, df, text_col='review_comment', fallback_col='review_title', batch_size=None):
+        """
+        Returns the polarity scores of every review of a DataFrame, as SentimentScorer.score_df
+
+        Parameters:
+        - df (DataFrame): the reviews
+        - text_col (str): the column scored by default (default is 'review_comment')
+        - fallback_col (str): the column used when text_col is missing (default is 'review_title')
+        - batch_size: unused, the server decides the batching
+
+        Returns:
+        - DataFrame: neg, neu and pos columns with the index of df
+        """
+        scores = self.score_batch(review_texts(df, text_col, fallback_col))
+        return pd.DataFrame(scores.reshape(len(df), len(LABELS)), index=df.index, columns=LABELS)
+
+    def metrics(self):
+        """
+        Returns the server metrics: queue depth, micro-batch sizes and latency percentiles
+        """
+        return self._request("/metrics")
+
+
+def connect_scorer(host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=300, connect_timeout=2, model_name=MODEL,
+                   backend='eager'):
+    """
+    Returns a client of the scoring server when it answers, else a SentimentScorer loading the model in this
+    process, both having score_batch, score_df and model_id
+
+    Parameters:
+    - host (str): address of the server (default is 127.0.0.1)
+    - port (int): port of the server (default is 8765)
+    - timeout (float): request timeout in seconds of the client (default is 300)
+    - connect_timeout (float): timeout in seconds of the health check (default is 2)
+    - model_name (str): model of the fallback scorer (default is MODEL)
+    - backend (str): backend of the fallback scorer (default is 'eager')
+
+    Returns:
+    - SentimentClient or SentimentScorer: the scorer
+    """
+    client = SentimentClient(host, port, timeout=connect_timeout)
+    try:
+        client.model_id
+    except Exception as e:
+        logger.warning("Scoring in-process with %s, the server is unreachable - %s", model_name, str(e))
+        return SentimentScorer(model_name, backend=backend)
+    client.timeout = timeout
+    return client
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local sentiment scoring server")
+    parser.add_argument("--model", default=MODEL)
+    parser.add_argument("--backend", default="eager", choices=["eager", "int8", "onnx"])
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=10)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+    serve(SentimentScorer(args.model, backend=args.backend), host=args.host, port=args.port,
+          max_batch=args.max_batch, max_wait_ms=args.max_wait_ms, batch_size=args.batch_size)
@@ -0,0 +1,238 @@
+## Incremental sentiment scoring, with the scores stored back in the MongoDB review documents
+
+import hashlib
+import pandas as pd
+from pymongo import UpdateOne
+from sentiment import LABELS
+
+
+def score_key(text, model_id):
+    """
+    Returns the key identifying the score of a text by a model
+
+    Parameters:
+    - text (str): the scored text
+    - model_id (str): the id of the scoring model
+
+    Returns:
+    - str: hex digest of the model id and the text
+    """
+    return hashlib.sha1((model_id + "\0" + text).encode("utf-8")).hexdigest()
+
+
+def _doc_text(doc, text_col, fallback_col):
+    """
+    Returns the text scored for a review document: the comment, or the title when the comment is missing
+    """
+    text = doc.get(text_col)
+    if text is None or pd.isna(text):
+        text = doc.get(fallback_col)
+    return '' if text is None or pd.isna(text) else str(text)
+
+
+class SentimentStore:
+    """
+    Keeps sentiment scores in the review documents of a MongoDB collection, under a sub-document holding the
+    neg/neu/pos scores, the model id, the score key of the scored text and the fingerprint the document had
+    when it was scored. A scoring run only reads and scores the documents that have no score yet, found through
+    an index, and on request the documents whose fingerprint changed since they were scored, e.g. after an edit
+    of their text, which takes a scan of the collection.
+
+    Parameters:
+    - mongo_ops (MongoDBOps): the MongoDB operations object
+    - db_name (str): name of the database
+    - collection_name (str): name of the collection holding the reviews
+    - field (str): name of the field holding the scores (default is 'sentiment')
+    - text_col (str): the column scored by default (default is 'review_comment')
+    - fallback_col (str): the column used when text_col is missing (default is 'review_title')
+    - fingerprint_field (str): the field holding the fingerprint of the review, kept up to date by
+      MongoDBOps.upsert_reviews and ensure_fingerprint_index (default is 'fingerprint')
+    """
+
+    def __init__(self, mongo_ops, db_name, collection_name, field='sentiment', text_col='review_comment',
+                 fallback_col='review_title', fingerprint_field='fingerprint'):
+        """
+        Initialize the SentimentStore object
+
+        Parameters:
+        - mongo_ops (MongoDBOps): the MongoDB operations object
+        - db_name (str): name of the database
+        - collection_name (str): name of the collection holding the reviews
+        - field (str): name of the field holding the scores (default is 'sentiment')
+        - text_col (str): the column scored by default (default is 'review_comment')
+        - fallback_col (str): the column used when text_col is missing (default is 'review_title')
+        - fingerprint_field (str): the field holding the fingerprint of the review (default is 'fingerprint')
+        """
+        self.mongo_ops = mongo_ops
+        self.db_name = db_name
+        self.collection_name = collection_name
+        self.field = field
+        self.text_col = text_col
+        self.fallback_col = fallback_col
+        self.fingerprint_field = fingerprint_field
+
+    def _collection(self):
+        return self.mongo_ops.get_collection(collection_name=self.collection_name, db_name=self.db_name)
+
+    def pending_filter(self, model_id, rescore=False):
+        """
+        Returns the query selecting the documents to be scored, served by the index on the model of the scores:
+        documents without a score have a null model
+
+        Parameters:
+        - model_id (str): the id of the scoring model
+        - rescore (bool): also select documents scored by another model (default is False)
+
+        Returns:
+        - dict: the MongoDB filter
+        """
+        if rescore:
+            return {f"{self.field}.model": {'$ne': model_id}}
+        return {f"{self.field}.model": None}
+
+    def changed_filter(self, model_id):
+        """
+        Returns the query selecting the documents scored by the model whose fingerprint differs from the one
+        stored with their score. It compares two fields of each document, which no index can serve.
+
+        Parameters:
+        - model_id (str): the id of the scoring model
+
+        Returns:
+        - dict: the MongoDB filter
+        """
+        # Scores stored without a fingerprint compare as null
+        stored = {'$ifNull': [f"${self.field}.fingerprint", None]}
+        return {f"{self.field}.model": model_id, self.fingerprint_field: {'$exists': True},
+                '$expr': {'$ne': [stored, f"${self.fingerprint_field}"]}}
+
+    def _changed_ids(self, collection, model_id):
+        """
+        Returns the ids of documents without a fingerprint scored by the model whose text has changed since they
+        were scored
+        """
+        projection = {self.text_col: 1, self.fallback_col: 1, f"{self.field}.key": 1}
+        query = {f"{self.field}.model": model_id, self.fingerprint_field: {'$exists': False}}
+        changed = []
+        for doc in collection.find(query, projection):
+            text = _doc_text(doc, self.text_col, self.fallback_col)
+            if doc[self.field].get('key') != score_key(text, model_id):
+                changed.append(doc['_id'])
+        return changed
+
+    def _score_docs(self, collection, docs, scorer, batch_size, counts):
+        """
+        Scores a chunk of documents and writes the scores back with one unordered bulk write. A document whose
+        scored text is unchanged only gets its new fingerprint.
+        """
+        model_id = scorer.model_id
+        requests = []
+        pending = []
+        for doc in docs:
+            text = _doc_text(doc, self.text_col, self.fallback_col)
+            stored = doc.get(self.field) if isinstance(doc.get(self.field), dict) else {}
+            key = score_key(text, model_id)
+            if stored.get('model') == model_id and stored.get('key') == key:
+                requests.append(UpdateOne({'_id': doc['_id']}, {'$set': {
+                    f"{self.field}.fingerprint": doc.get(self.fingerprint_field)}}))
+                counts['refreshed'] += 1
+            else:
+                pending.append((doc, text, key, stored.get('model') == model_id))
+
+        scores = scorer.score_batch([text for _, text, _, _ in pending], batch_size=batch_size)
+        for (doc, text, key, changed), row in zip(pending, scores):
+            value = dict(zip(LABELS, map(float, row)))
+            value.update({'model': model_id, 'key': key})
+            if self.fingerprint_field in doc:
+                value['fingerprint'] = doc[self.fingerprint_field]
+            requests.append(UpdateOne({'_id': doc['_id']}, {'$set': {self.field: value}}))
+            counts['changed' if changed else 'scored'] += 1
+        if requests:
+            collection.bulk_write(requests, ordered=False)
+
+    def _score_query(self, collection, query, projection, scorer, batch_size, write_batch, counts):
+        """
+        Scores the documents matching the query, write_batch documents at a time in _id order. Each batch is
+        read in full before its scores are written, the scored documents leaving the query.
+        """
+        last_id = None
+        while True:
+            batch_query = query if last_id is None else {'$and': [query, {'_id': {'$gt': last_id}}]}
+            docs = list(collection.find(batch_query, projection).sort('_id', 1).limit(write_batch))
+            if not docs:
+                return
+            self._score_docs(collection, docs, scorer, batch_size, counts)
+            last_id = docs[-1]['_id']
+
+    def score(self, scorer, batch_size=32, write_batch=1000, rescore=False, check_text=False):
+        """
+        Scores the documents missing a score and stores the scores in the documents
+
+        Parameters:
+        - scorer (SentimentScorer): the scorer, its model_id is stored with each score
+        - batch_size (int): number of model inputs per forward pass (default is 32)
+        - write_batch (int): number of documents scored and written back at a time (default is 1000)
+        - rescore (bool): also rescore documents scored by another model, use after a model change
+          (default is False)
+        - check_text (bool): also rescore documents scored by this model whose text changed since, found by
+          their fingerprint, or for the documents without one by their text, this scans the collection
+          (default is False)
+
+        Returns:
+        - dict: number of documents scored for being unscored or scored by another model, rescored for having
+          changed text, and whose score only got the new fingerprint of the document
+        """
+        try:
+            collection = self._collection()
+            # Serves the pending and rescore queries
+            collection.create_index(f"{self.field}.model")
+            projection = {self.text_col: 1, self.fallback_col: 1, self.fingerprint_field: 1,
+                          f"{self.field}.model": 1, f"{self.field}.key": 1}
+            counts = {'scored': 0, 'changed': 0, 'refreshed': 0}
+            self._score_query(collection, self.pending_filter(scorer.model_id, rescore), projection, scorer,
+                              batch_size, write_batch, counts)
+
+            if check_text:
+                self._score_query(collection, self.changed_filter(scorer.model_id), projection, scorer,
+                                  batch_size, write_batch, counts)
+                changed = self._changed_ids(collection, scorer.model_id)
+                for i in range(0, len(changed), write_batch):
+                    docs = list(collection.find({'_id': {'$in': changed[i:i + write_batch]}}, projection))
+                    self._score_docs(collection, docs, scorer, batch_size, counts)
+            return counts
+        except Exception as e:
+            raise Exception(f"score: Failed to score the collection {self.collection_name} - {str(e)}")
+
+    def clear(self, model_id=None):
+        """
+        Removes stored scores, e.g. to force a full rescore
+
+        Parameters:
+        - model_id (str): only remove the scores of this model (default is None, remove all scores)
+
+        Returns:
+        - int: number of documents whose score was removed
+        """
+        try:
+            query = {f"{self.field}.model": model_id} if model_id else {self.field: {'$exists': True}}
+            return self._collection().update_many(query, {'$unset': {self.field: ""}}).modified_count
+        except Exception as e:
+            raise Exception(f"clear: Failed to remove scores - {str(e)}")
+
+    def load_scores(self, model_id):
+        """
+        Returns the stored scores of a model
+
+        Parameters:
+        - model_id (str): the id of the scoring model
+
+        Returns:
+        - DataFrame: neg, neu and pos columns indexed by the document _id
+        """
+        try:
+            projection = {f"{self.field}.{label}": 1 for label in LABELS}
+            rows = [dict(_id=doc['_id'], **{label: doc[self.field][label] for label in LABELS})
+                    for doc in self._collection().find({f"{self.field}.model": model_id}, projection)]
+            return pd.DataFrame(rows, columns=['_id'] + LABELS).set_index('_id')
+        except Exception as e:
+            raise Exception(f"load_scores: Failed to load scores - {str(e)}")
@@ -0,0 +1,298 @@
+## Versioned, partitioned Parquet snapshots of the review collection with the cleaned text and sentiment scores
+
+import datetime
+import json
+import os
+import uuid
+from urllib.parse import quote
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from bson import ObjectId
+
+
+SNAPSHOT_FORMAT = 1
+
+# Columns of every snapshot file, so that all the files of a snapshot read as one table
+SCHEMA = pa.schema([('_id', pa.string()), ('scrape_date', pa.string()), ('review_title', pa.string()),
+                    ('ratings', pa.float64()), ('review_comment', pa.string()), ('size', pa.string()),
+                    ('asin', pa.string()), ('fingerprint', pa.string()), ('clean_comment', pa.string()),
+                    ('sentiment_neg', pa.float64()), ('sentiment_neu', pa.float64()),
+                    ('sentiment_pos', pa.float64()), ('sentiment_model', pa.string()),
+                    ('sentiment_key', pa.string())])
+
+PARTITION_COLUMNS = ('asin', 'scrape_date')
+
+# Partitions re-exported per query during a refresh
+PARTITIONS_PER_QUERY = 200
+
+
+def _scrape_date(object_id):
+    return object_id.generation_time.strftime('%Y-%m-%d') if isinstance(object_id, ObjectId) else None
+
+
+def _text(value):
+    return value if isinstance(value, str) else None
+
+
+def snapshot_frame(records, cleaner=None, cache=None):
+    """
+    Flattens review documents into the snapshot columns: the _id as a string, the scrape date taken from the
+    ObjectId, the review fields, the cleaned comment and the scores of the sentiment sub-document
+
+    Parameters:
+    - records (list): review documents as read from the collection
+    - cleaner (TextCleaner): cleaner of the clean_comment column, False leaves it empty (default is the shared
+      english cleaner)
+    - cache (CleanTextCache): cache of already cleaned texts (default is the shared in-memory cache)
+
+    Returns:
+    - DataFrame: one row per document, with the SCHEMA columns
+    """
+    rows = {name: [] for name in SCHEMA.names}
+    for record in records:
+        rows['_id'].append(str(record.get('_id')))
+        rows['scrape_date'].append(_scrape_date(record.get('_id')))
+        for name in ('review_title', 'review_comment', 'size', 'asin', 'fingerprint'):
+            rows[name].append(_text(record.get(name)))
+        rows['ratings'].append(record.get('ratings'))
+        sentiment = record.get('sentiment') if isinstance(record.get('sentiment'), dict) else {}
+        for name in ('neg', 'neu', 'pos', 'model', 'key'):
+            rows[f'sentiment_{name}'].append(sentiment.get(name))
+    df = pd.DataFrame({name: pd.Series(values, dtype=object) for name, values in rows.items()})
+    for name in ('ratings', 'sentiment_neg', 'sentiment_neu', 'sentiment_pos'):
+        df[name] = pd.to_numeric(df[name], errors='coerce').astype(np.float64)
+    if cleaner is not False and len(df):
+        from Preprocessing import clean_text_df
+        df['clean_comment'] = df['review_comment']
+        df = clean_text_df(df, 'clean_comment', cleaner=cleaner or None, cache=cache)
+    return df
+
+
+class SnapshotStore:
+    """
+    Parquet snapshots of a review collection, partitioned by asin or by scrape date. Each snapshot is a version
+    listing its files in the manifest, files are never modified, so a version can be reloaded as it was for as
+    long as it is kept. A refresh only re-exports the partitions with new, rescored or deleted reviews and
+    shares the files of the other partitions with the previous version.
+
+    Parameters:
+    - path (str): directory of the store, created if needed
+    """
+
+    def __init__(self, path):
+        """
+        Initialize the SnapshotStore object
+        """
+        self.path = path
+        self.manifest_path = os.path.join(path, 'manifest.json')
+        self.manifest = {'format': SNAPSHOT_FORMAT, 'versions': []}
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, encoding='utf-8') as f:
+                    self.manifest = json.load(f)
+            except Exception as e:
+                raise Exception(f"__init__: Failed to read the snapshot manifest {self.manifest_path} - {str(e)}")
+            if self.manifest.get('format') != SNAPSHOT_FORMAT:
+                raise Exception(f"__init__: unsupported snapshot format {self.manifest.get('format')}")
+
+    @property
+    def versions(self):
+        return [entry['version'] for entry in self.manifest['versions']]
+
+    def version_info(self, version=None):
+        """
+        Returns the manifest entry of a version
+
+        Parameters:
+        - version (int): the version (default is None, the latest one)
+
+        Returns:
+        - dict: creation time, source, partition column, row count and files of the version
+        """
+        if not self.manifest['versions']:
+            raise ValueError(f"no snapshot in {self.path}")
+        if version is None:
+            return self.manifest['versions'][-1]
+        for entry in self.manifest['versions']:
+            if entry['version'] == version:
+                return entry
+        raise ValueError(f"no snapshot version {version} in {self.path}")
+
+    def _save_manifest(self):
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _write_partition(self, partition_by, value, df):
+        directory = os.path.join('data', f"{partition_by}={quote(str(value), safe='')}")
+        os.makedirs(os.path.join(self.path, directory), exist_ok=True)
+        name = os.path.join(directory, f"part-{uuid.uuid4().hex}.parquet")
+        table = pa.Table.from_pandas(df[SCHEMA.names], schema=SCHEMA, preserve_index=False)
+        pq.write_table(table, os.path.join(self.path, name))
+        return {'path': name, 'partition': value, 'rows': len(df)}
+
+    def _snapshot_signatures(self, entry):
+        table = self._read(entry['files'], ['_id', entry['partition_by'], 'sentiment_key'])
+        return table.to_pandas().set_index('_id')
+
+    @staticmethod
+    def _collection_signatures(collection, partition_by):
+        projection = {'_id': 1, 'sentiment.key': 1}
+        if partition_by == 'asin':
+            projection['asin'] = 1
+        rows = []
+        for doc in collection.find({}, projection):
+            sentiment = doc.get('sentiment') if isinstance(doc.get('sentiment'), dict) else {}
+            partition = _text(doc.get('asin')) if partition_by == 'asin' else _scrape_date(doc['_id'])
+            rows.append((str(doc['_id']), partition, sentiment.get('key')))
+        return pd.DataFrame(rows, columns=['_id', partition_by, 'sentiment_key']).set_index('_id')
+
+    @staticmethod
+    def _partition_query(partition_by, values):
+        clauses = []
+        if None in values:
+            # Reviews without an asin, or without an ObjectId to take the scrape date from
+            clauses.append({'asin': None} if partition_by == 'asin' else {'_id': {'$not': {'$type': 'objectId'}}})
+        values = [value for value in values if value is not None]
+        if partition_by == 'asin':
+            clauses.append({'asin': {'$in': values}})
+        for value in values if partition_by == 'scrape_date' else ():
+            start = datetime.datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=datetime.timezone.utc)
+            clauses.append({'_id': {'$gte': ObjectId.from_datetime(start),
+                                    '$lt': ObjectId.from_datetime(start + datetime.timedelta(days=1))}})
+        return clauses[0] if len(clauses) == 1 else {'$or': clauses}
+
+    def refresh(self, mongo_ops, db_name, collection_name, partition_by='asin', cleaner=None, cache=None,
+                full=False):
+        """
+        Creates a new version with the reviews added, rescored or deleted since the latest version, re-exporting
+        only their partitions
+
+        Parameters:
+        - mongo_ops (MongoDBOps): the MongoDB operations object
+        - db_name (str): name of the database
+        - collection_name (str): name of the collection holding the reviews
+        - partition_by (str): 'asin' or 'scrape_date', the date the review was stored, taken from its ObjectId
+          (default is 'asin', a store keeps the partitioning of its first version)
+        - cleaner (TextCleaner): cleaner of the clean_comment column, False leaves it empty (default is the shared
+          english cleaner)
+        - cache (CleanTextCache): cache of already cleaned texts (default is the shared in-memory cache)
+        - full (bool): re-export every partition (default is False)
+
+        Returns:
+        - dict: the manifest entry of the latest version, the previous one if nothing changed
+        """
+        try:
+            previous = self.manifest['versions'][-1] if self.manifest['versions'] else None
+            if previous is not None:
+                partition_by = previous['partition_by']
+            if partition_by not in PARTITION_COLUMNS:
+                raise ValueError(f"partition_by should be one of {PARTITION_COLUMNS}")
+            collection = mongo_ops.get_collection(collection_name=collection_name, db_name=db_name)
+
+            current = self._collection_signatures(collection, partition_by)
+            if previous is None or full:
+                affected = {_text(value) for value in current[partition_by]}
+                kept_files = []
+            else:
+                stored = self._snapshot_signatures(previous)
+                joined = current.join(stored, how='outer', lsuffix='_current', rsuffix='_stored')
+                in_both = joined.index.isin(current.index) & joined.index.isin(stored.index)
+                changed = ~in_both | (joined['sentiment_key_current'].fillna('')
+                                      != joined['sentiment_key_stored'].fillna(''))
+                affected = {_text(value) for value in joined.loc[changed & joined.index.isin(current.index),
+                                                                 f'{partition_by}_current']}
+                affected |= {_text(value) for value in joined.loc[changed & joined.index.isin(stored.index),
+                                                                  f'{partition_by}_stored']}
+                if not affected:
+                    return previous
+                kept_files = [file for file in previous['files'] if file['partition'] not in affected]
+
+            new_files = []
+            values = sorted(affected, key=lambda value: (value is None, value or ''))
+            for i in range(0, len(values), PARTITIONS_PER_QUERY):
+                batch = values[i:i + PARTITIONS_PER_QUERY]
+                query = self._partition_query(partition_by, batch)
+                df = snapshot_frame(list(collection.find(query)), cleaner=cleaner, cache=cache)
+                keys = df[partition_by].astype(object).where(df[partition_by].notna(), '')
+                for key, part in df.groupby(keys, sort=True):
+                    value = key if key != '' else None
+                    new_files.append(self._write_partition(partition_by, value, part))
+
+            from Preprocessing import get_default_cleaner
+            cleaner_key = None if cleaner is False else (cleaner or get_default_cleaner()).config_key
+            entry = {'version': (previous['version'] + 1) if previous else 1,
+                     'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+                     'parent': previous['version'] if previous and not full else None,
+                     'source': {'db': db_name, 'collection': collection_name},
+                     'partition_by': partition_by, 'cleaner': cleaner_key,
+                     'rows': sum(file['rows'] for file in kept_files + new_files),
+                     'refreshed_partitions': len(affected), 'files': kept_files + new_files}
+            self.manifest['versions'].append(entry)
+            self._save_manifest()
+            return entry
+        except Exception as e:
+            raise Exception(f"refresh: Failed to snapshot {collection_name} - {str(e)}")
+
+    def _read(self, files, columns=None, filters=None):
+        if not files:
+            return SCHEMA.empty_table().select(columns) if columns else SCHEMA.empty_table()
+        paths = [os.path.join(self.path, file['path']) for file in files]
+        return pq.read_table(paths, columns=columns, filters=filters, memory_map=True, schema=SCHEMA)
+
+    def load(self, version=None, columns=None, partitions=None, filters=None, arrow=False):
+        """
+        Loads a snapshot from the memory-mapped Parquet files, reading only the files of the requested partitions,
+        the requested columns and the row groups that can match the filters
+
+        Parameters:
+        - version (int): the version to load (default is None, the latest one)
+        - columns (list): the columns to read (default is None, all of them)
+        - partitions (list): the asins or scrape dates to read, by the partitioning of the store (default is
+          None, all of them)
+        - filters: row filter as accepted by pyarrow.parquet.read_table, e.g. [('ratings', '<=', 2)]
+          (default is None)
+        - arrow (bool): return the pyarrow Table instead of a DataFrame (default is False)
+
+        Returns:
+        - DataFrame: the reviews of the snapshot
+        """
+        try:
+            entry = self.version_info(version)
+            files = entry['files']
+            if partitions is not None:
+                wanted = set(partitions)
+                files = [file for file in files if file['partition'] in wanted]
+            table = self._read(files, columns=columns, filters=filters)
+            return table if arrow else table.to_pandas()
+        except Exception as e:
+            raise Exception(f"load: Failed to load the snapshot from {self.path} - {str(e)}")
+
+    def prune(self, keep=3):
+        """
+        Removes the oldest versions and the files no kept version uses
+
+        Parameters:
+        - keep (int): number of latest versions kept (default is 3)
+
+        Returns:
+        - int: number of files removed
+        """
+        if keep < 1:
+            raise ValueError("keep should be >=1")
+        self.manifest['versions'] = self.manifest['versions'][-keep:]
+        self._save_manifest()
+        used = {file['path'] for entry in self.manifest['versions'] for file in entry['files']}
+        removed = 0
+        data_dir = os.path.join(self.path, 'data')
+        for directory, _, names in os.walk(data_dir):
+            for name in names:
+                path = os.path.relpath(os.path.join(directory, name), self.path)
+                if name.endswith('.parquet') and path not in used:
+                    os.remove(os.path.join(directory, name))
+                    removed += 1
+        return removed
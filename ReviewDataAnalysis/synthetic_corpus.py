@@ -0,0 +1,133 @@
+## Synthetic review corpora shaped like the scraped Reviews.csv, for benchmarks at any scale
+
+import os
+import numpy as np
+import pandas as pd
+from Preprocessing import MEDIA_NOT_LOADED
+
+
+REVIEWS_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "AmazonScrapWebdriver", "Reviews.csv")
+
+REVIEW_FIELDS = ['review_title', 'ratings', 'review_comment', 'size', 'asin']
+
+# Comments are stitched together from runs of this many consecutive words of real comments with the same rating,
+# which keeps the bi-grams and tri-grams the reports look for
+PHRASE_LENGTH = 3
+
+
+class SyntheticReviews:
+    """
+    Generates reviews following the distributions of a sample of real ones: the joint rating, size, asin and
+    title of a review, the comment lengths, the words (emojis included) of the comments of each rating, the
+    comments that are missing or start with the 'media could not be loaded' banner, and the share of exact
+    duplicate rows. The same seed always gives the same corpus.
+
+    Parameters:
+    - df (DataFrame): the real reviews, with the Reviews.csv columns
+    """
+
+    def __init__(self, df):
+        """
+        Initialize the SyntheticReviews object
+        """
+        df = df.reset_index(drop=True)
+        if len(df) == 0:
+            raise ValueError("no reviews to learn the distributions from")
+        self.source = df[REVIEW_FIELDS]
+        comments = df['review_comment']
+        present = comments.map(lambda text: isinstance(text, str))
+        self.missing_rate = 1 - present.mean()
+        media = comments[present].str.lower().str.startswith(MEDIA_NOT_LOADED)
+        self.media_rate = media.mean()
+        self.media_prefix = "The media could not be loaded.\n                \n\n\n\n\xa0"
+        self.duplicate_rate = df[REVIEW_FIELDS].duplicated().mean()
+
+        words = comments[present].str.replace(MEDIA_NOT_LOADED, '', case=False, regex=False)
+        words = words.str.lstrip('.').str.split()
+        self.lengths = words.str.len().to_numpy()
+        self.lengths = self.lengths[self.lengths > 0]
+        # The words of all the comments of each rating in one stream
+        self.streams = {}
+        for rating, group in words.groupby(df.loc[present, 'ratings']):
+            stream = np.array([word for row in group for word in row], dtype=object)
+            if len(stream) >= PHRASE_LENGTH:
+                self.streams[rating] = stream
+        self.fallback_stream = np.concatenate(list(self.streams.values()))
+
+    @classmethod
+    def from_csv(cls, path=REVIEWS_CSV):
+        """
+        Learns the distributions from a CSV file of reviews
+
+        Parameters:
+        - path (str): the CSV file (default is the bundled AmazonScrapWebdriver/Reviews.csv)
+
+        Returns:
+        - SyntheticReviews: the generator
+        """
+        return cls(pd.read_csv(path))
+
+    def _comments(self, rng, ratings):
+        n_rows = len(ratings)
+        lengths = rng.choice(self.lengths, size=n_rows)
+        phrases = -(-lengths // PHRASE_LENGTH)
+        comments = np.empty(n_rows, dtype=object)
+        for rating in np.unique(ratings):
+            rows = np.flatnonzero(ratings == rating)
+            stream = self.streams.get(rating, self.fallback_stream)
+            # Start of every phrase, each row taking the first lengths[row] words of its phrases
+            starts = rng.integers(0, len(stream) - PHRASE_LENGTH + 1, size=phrases[rows].sum())
+            positions = (starts[:, None] + np.arange(PHRASE_LENGTH)).ravel()
+            row_words = stream[positions]
+            offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+            np.cumsum(phrases[rows] * PHRASE_LENGTH, out=offsets[1:])
+            comments[rows] = [' '.join(row_words[offsets[i]:offsets[i] + lengths[row]])
+                              for i, row in enumerate(rows)]
+        return comments
+
+    def generate(self, n_rows, seed=0):
+        """
+        Generates a corpus
+
+        Parameters:
+        - n_rows (int): number of reviews
+        - seed (int): seed of the random generator (default is 0)
+
+        Returns:
+        - DataFrame: the reviews, with the Reviews.csv columns
+        """
+        rng = np.random.default_rng(seed)
+        rows = self.source.iloc[rng.integers(0, len(self.source), size=n_rows)].reset_index(drop=True)
+        comments = self._comments(rng, rows['ratings'].to_numpy())
+
+        media = rng.random(n_rows) < self.media_rate
+        comments[media] = [self.media_prefix + comment for comment in comments[media]]
+        comments[rng.random(n_rows) < self.missing_rate] = None
+
+        # A duplicate repeats a random earlier row, following the chain back to an original row
+        copy_of = np.arange(n_rows)
+        duplicates = np.flatnonzero(rng.random(n_rows) < self.duplicate_rate)
+        duplicates = duplicates[duplicates > 0]
+        copy_of[duplicates] = (rng.random(len(duplicates)) * duplicates).astype(np.int64)
+        while True:
+            resolved = copy_of[copy_of]
+            if np.array_equal(resolved, copy_of):
+                break
+            copy_of = resolved
+        rows = rows.iloc[copy_of].reset_index(drop=True)
+        # Missing comments are None, as read from the collection
+        rows['review_comment'] = pd.Series(comments[copy_of], dtype=object)
+        return rows
+
+    def scaled(self, scale, seed=0):
+        """
+        Generates a corpus a multiple of the size of the real one
+
+        Parameters:
+        - scale (float): size relative to the real reviews, e.g. 1, 10, 100 or 1000
+        - seed (int): seed of the random generator (default is 0)
+
+        Returns:
+        - DataFrame: the reviews
+        """
+        return self.generate(int(round(scale * len(self.source))), seed=seed)
@@ -0,0 +1,248 @@
+## Tokenized review corpus shared by the n-gram counts and the word clouds
+
+import json
+import os
+import numpy as np
+import pandas as pd
+from ngram_counts import encode_texts, top_ngrams_encoded
+
+
+CORPUS_VERSION = 1
+
+# Row metadata kept by from_df when the columns are present
+META_COLUMNS = ('ratings', 'size', 'asin')
+
+
+class TokenCorpus:
+    """
+    Cleaned review text tokenized once: a vocabulary, the token ids of all the rows in one int32 array with the
+    row boundaries in an offsets array (the tokens of row i are ids[offsets[i]:offsets[i + 1]]), and per row
+    metadata such as the rating, size and asin to select rows with. A saved corpus is loaded memory-mapped.
+
+    Parameters:
+    - tokens (list): the token of each id
+    - ids (ndarray): the token ids of all the rows
+    - offsets (ndarray): row boundaries in ids, one more than the number of rows
+    - columns (dict): metadata column name to array with one value per row, numeric columns as floats and the
+      others as int32 codes into labels, -1 for missing values (default is None, no metadata)
+    - labels (dict): column name to the list of values of a coded column (default is None)
+    """
+
+    def __init__(self, tokens, ids, offsets, columns=None, labels=None):
+        """
+        Initialize the TokenCorpus object
+        """
+        self.tokens = list(tokens)
+        self.vocab = {token: token_id for token_id, token in enumerate(self.tokens)}
+        self.ids = ids
+        self.offsets = offsets
+        self.columns = dict(columns or {})
+        self.labels = dict(labels or {})
+
+    @classmethod
+    def from_texts(cls, texts, cleaner=None, **meta):
+        """
+        Builds a corpus from texts
+
+        Parameters:
+        - texts (iterable): the texts, None values give empty rows
+        - cleaner (TextCleaner): cleaner applied to raw text (default is None, the texts are already cleaned)
+        - meta: metadata columns, each an array-like with one value per text, e.g. ratings=df['ratings']
+
+        Returns:
+        - TokenCorpus: the corpus
+        """
+        if cleaner is None:
+            ids, offsets, vocab = encode_texts(texts)
+        else:
+            ids, offsets, vocab = encode_texts(texts, tokenizer=cleaner.clean_tokens)
+        tokens = sorted(vocab, key=vocab.get)
+        columns, labels = {}, {}
+        for name, values in meta.items():
+            values = pd.Series(values).reset_index(drop=True)
+            if len(values) != len(offsets) - 1:
+                raise ValueError(f"column {name} has {len(values)} values for {len(offsets) - 1} texts")
+            if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+                columns[name] = values.to_numpy(dtype=np.float64, na_value=np.nan)
+            else:
+                codes, uniques = pd.factorize(values.astype(object), use_na_sentinel=True)
+                columns[name] = codes.astype(np.int32)
+                labels[name] = list(uniques)
+        return cls(tokens, ids, offsets, columns, labels)
+
+    @classmethod
+    def from_df(cls, df, col_name='review_comment', meta_cols=META_COLUMNS, cleaner=None):
+        """
+        Builds a corpus from a text column of a DataFrame, e.g. after clean_text_df
+
+        Parameters:
+        - df (DataFrame): DataFrame containing the text column
+        - col_name (str): column name that contains the text (default is 'review_comment')
+        - meta_cols (tuple): columns kept as row metadata, the ones missing from df are skipped
+          (default is ('ratings', 'size', 'asin'))
+        - cleaner (TextCleaner): cleaner applied to raw text (default is None, the column is already cleaned)
+
+        Returns:
+        - TokenCorpus: the corpus
+        """
+        texts = [text if isinstance(text, str) else None for text in df[col_name]]
+        meta = {name: df[name] for name in meta_cols if name in df.columns}
+        return cls.from_texts(texts, cleaner=cleaner, **meta)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def n_tokens(self):
+        return len(self.ids)
+
+    def row_tokens(self, row):
+        """
+        Returns the tokens of a row
+        """
+        return [self.tokens[token_id] for token_id in self.ids[self.offsets[row]:self.offsets[row + 1]]]
+
+    def column(self, name):
+        """
+        Returns a metadata column with one value per row, e.g. to build a row mask from
+
+        Parameters:
+        - name (str): the column name
+
+        Returns:
+        - ndarray: the values, None for missing values of a coded column
+        """
+        values = self.columns[name]
+        if name not in self.labels:
+            return values
+        decoded = np.asarray(self.labels[name] + [None], dtype=object)
+        return decoded[values]
+
+    def _row_mask(self, rows):
+        if rows is None:
+            return None
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            if len(rows) != len(self):
+                raise ValueError(f"row mask has {len(rows)} values for {len(self)} rows")
+            return rows
+        mask = np.zeros(len(self), dtype=bool)
+        mask[rows] = True
+        return mask
+
+    def select(self, rows):
+        """
+        Returns the corpus of some of the rows, sharing the vocabulary
+
+        Parameters:
+        - rows (array-like): boolean mask or positions of the rows to keep
+
+        Returns:
+        - TokenCorpus: the selected rows, in corpus order
+        """
+        keep = np.flatnonzero(self._row_mask(rows))
+        lengths = np.diff(self.offsets)[keep]
+        offsets = np.zeros(len(keep) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        positions = np.repeat(self.offsets[keep] - offsets[:-1], lengths) + np.arange(offsets[-1])
+        columns = {name: np.asarray(values[keep]) for name, values in self.columns.items()}
+        return TokenCorpus(self.tokens, np.asarray(self.ids[positions]), offsets, columns, self.labels)
+
+    def token_counts(self, rows=None):
+        """
+        Counts every token of the corpus, or of some of its rows
+
+        Parameters:
+        - rows (array-like): boolean mask or positions of the rows to count (default is None, all the rows)
+
+        Returns:
+        - ndarray: the count of each token id
+        """
+        ids = self.ids
+        mask = self._row_mask(rows)
+        if mask is not None:
+            ids = ids[np.repeat(mask, np.diff(self.offsets))]
+        return np.bincount(ids, minlength=len(self.tokens))
+
+    def frequencies(self, rows=None, min_count=1):
+        """
+        Returns the token frequencies, as taken by WordCloud.generate_from_frequencies. The tokens are the
+        cleaned words as they are: unlike WordCloud.generate, there is no second stop word list, plural merging
+        or collocations.
+
+        Parameters:
+        - rows (array-like): boolean mask or positions of the rows to count (default is None, all the rows)
+        - min_count (int): leave out the tokens occurring fewer times (default is 1)
+
+        Returns:
+        - dict: token to count
+        """
+        counts = self.token_counts(rows)
+        kept = np.flatnonzero(counts >= max(min_count, 1))
+        return {self.tokens[token_id]: int(counts[token_id]) for token_id in kept}
+
+    def top_ngrams(self, ns=(1, 2, 3), k=10, groups=None):
+        """
+        Returns the k most frequent n-grams of each size for each group of rows, see top_ngrams_encoded
+
+        Parameters:
+        - ns (tuple): sizes of the n-grams (default is (1, 2, 3))
+        - k (int): number of n-grams to return (default is 10)
+        - groups (array-like): group label of each row, rows labelled None are left out (default is None, a
+          single group labelled None holding all the rows)
+
+        Returns:
+        - dict: {(group, n): [(ngram tuple, count), ...]} in decreasing order of count
+        """
+        return top_ngrams_encoded(np.asarray(self.ids), np.asarray(self.offsets), self.vocab, ns=ns, k=k,
+                                  groups=groups)
+
+    def save(self, path):
+        """
+        Saves the corpus in a directory: the arrays as .npy files and the vocabulary and column labels as JSON
+
+        Parameters:
+        - path (str): the directory to write, created if needed
+        """
+        try:
+            os.makedirs(path, exist_ok=True)
+            np.save(os.path.join(path, 'ids.npy'), np.asarray(self.ids, dtype=np.int32))
+            np.save(os.path.join(path, 'offsets.npy'), np.asarray(self.offsets, dtype=np.int64))
+            columns = []
+            for i, (name, values) in enumerate(self.columns.items()):
+                np.save(os.path.join(path, f'column_{i}.npy'), np.asarray(values))
+                columns.append({'name': name, 'file': f'column_{i}.npy', 'labels': self.labels.get(name)})
+            # Written last, a directory without it is not a complete corpus
+            with open(os.path.join(path, 'corpus.json'), 'w', encoding='utf-8') as f:
+                json.dump({'version': CORPUS_VERSION, 'tokens': self.tokens, 'columns': columns}, f)
+        except Exception as e:
+            raise Exception(f"save: Failed to save the corpus to {path} - {str(e)}")
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Loads a corpus saved with save
+
+        Parameters:
+        - path (str): the corpus directory
+        - mmap (bool): memory-map the arrays instead of reading them (default is True)
+
+        Returns:
+        - TokenCorpus: the loaded corpus
+        """
+        try:
+            with open(os.path.join(path, 'corpus.json'), encoding='utf-8') as f:
+                data = json.load(f)
+            if data['version'] != CORPUS_VERSION:
+                raise ValueError(f"unsupported version {data['version']}")
+            mmap_mode = 'r' if mmap else None
+            ids = np.load(os.path.join(path, 'ids.npy'), mmap_mode=mmap_mode)
+            offsets = np.load(os.path.join(path, 'offsets.npy'), mmap_mode=mmap_mode)
+            columns, labels = {}, {}
+            for column in data['columns']:
+                columns[column['name']] = np.load(os.path.join(path, column['file']), mmap_mode=mmap_mode)
+                if column['labels'] is not None:
+                    labels[column['name']] = column['labels']
+            return cls(data['tokens'], ids, offsets, columns, labels)
+        except Exception as e:
+            raise Exception(f"load: Failed to load the corpus from {path} - {str(e)}")
@@ -0,0 +1,26 @@
+## Shared test setup: the modules of both folders are imported by their flat names, as the scripts do
+
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, 'tests', 'fixtures')
+
+for folder in ('AmazonScrapWebdriver', 'ReviewDataAnalysis'):
+    path = os.path.join(ROOT, folder)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+
+@pytest.fixture
+def fixture_pages():
+    """
+    Returns the saved pages of tests/fixtures by file name
+    """
+    return {name: read_fixture(name) for name in sorted(os.listdir(FIXTURES)) if name.endswith('.html')}
@@ -0,0 +1,97 @@
+## CrawlCheckpoint resuming an interrupted crawl, and KnownReviews stopping on already stored reviews
+
+import json
+import os
+import mongomock
+import pytest
+from conftest import read_fixture
+from CrawlCheckpoint import CHECKPOINT_VERSION, CrawlCheckpoint, KnownReviews
+from MongoDBOperations import MongoDBOps
+from PageParsers import parse_review_page
+
+
+DB = 'Neemai'
+COLLECTION = 'maternity_wear'
+LINK = "/Maternity-Dress-Women-Feeding/product-reviews/B0TEST0001/ref=cm_cr_dp_d_show_all_btm?ie=UTF8"
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'crawl_checkpoint.json')
+
+
+def page_reviews(name):
+    reviews, _ = parse_review_page(read_fixture(name), LINK)
+    return reviews
+
+
+def test_new_checkpoint_is_not_resumed(path):
+    checkpoint = CrawlCheckpoint.open(path, 'maternity+dress')
+    assert not checkpoint.resumed
+    assert checkpoint.asins is None
+
+
+def test_interrupted_crawl_resumes_pending_asins_and_pages(path):
+    checkpoint = CrawlCheckpoint.open(path, 'maternity+dress')
+    checkpoint.start(['B0TEST0001', 'B0TEST0002', 'B0TEST0003'])
+    checkpoint.record_page('B0TEST0001', 1, LINK)
+    checkpoint.record_page('B0TEST0001', 2, LINK)
+    checkpoint.finish_asin('B0TEST0002')
+
+    resumed = CrawlCheckpoint.open(path, 'maternity+dress')
+    assert resumed.resumed
+    assert resumed.asins == ['B0TEST0001', 'B0TEST0002', 'B0TEST0003']
+    assert resumed.pending() == ['B0TEST0001', 'B0TEST0003']
+    assert resumed.start_pages() == {'B0TEST0001': 3}
+    assert resumed.review_links() == {'B0TEST0001': LINK}
+
+    resumed.finish_asin('B0TEST0001')
+    resumed = CrawlCheckpoint.open(path, 'maternity+dress')
+    assert resumed.pending() == ['B0TEST0003']
+    assert resumed.start_pages() == {}
+    resumed.clear()
+    assert not CrawlCheckpoint.open(path, 'maternity+dress').resumed
+
+
+def test_checkpoint_of_another_search_or_version_is_not_resumed(path):
+    CrawlCheckpoint.open(path, 'maternity+dress').start(['B0TEST0001'])
+    assert not CrawlCheckpoint.open(path, 'nursing+top').resumed
+    with open(path, encoding='utf-8') as f:
+        state = json.load(f)
+    state['version'] = CHECKPOINT_VERSION + 1
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    assert not CrawlCheckpoint.open(path, 'maternity+dress').resumed
+
+
+def test_save_leaves_no_partial_file(path):
+    checkpoint = CrawlCheckpoint.open(path, 'maternity+dress')
+    checkpoint.start(['B0TEST0001'])
+    with open(path, encoding='utf-8') as f:
+        assert json.load(f)['asins'] == ['B0TEST0001']
+    assert not os.path.exists(path + '.tmp')
+
+
+def test_known_reviews_stop_paging_at_a_page_already_stored():
+    with MongoDBOps(username=None, pwd=None, client=mongomock.MongoClient()) as mongo_ops:
+        mongo_ops.upsert_reviews(DB, COLLECTION, page_reviews('review_page_1.html'))
+        known = KnownReviews.load(mongo_ops.get_collection(collection_name=COLLECTION, db_name=DB),
+                                  ['B0TEST0001'])
+
+    first, second = page_reviews('review_page_1.html'), page_reviews('review_page_2.html')
+    assert len(known) == len(first)
+    assert not known.has_new('B0TEST0001', 1, first)
+    assert known.new(first) == []
+    assert known.has_new('B0TEST0001', 2, first[:2] + second)
+    assert known.new(first[:2] + second) == second
+    # An empty page does not end the crawl of the ASIN
+    assert known.has_new('B0TEST0001', 3, [])
+
+
+def test_known_reviews_only_load_the_crawled_asins():
+    with MongoDBOps(username=None, pwd=None, client=mongomock.MongoClient()) as mongo_ops:
+        mongo_ops.upsert_reviews(DB, COLLECTION, page_reviews('review_page_1.html'))
+        known = KnownReviews.load(mongo_ops.get_collection(collection_name=COLLECTION, db_name=DB),
+                                  ['B0TEST0002'])
+    assert len(known) == 0
+    assert known.has_new('B0TEST0001', 1, page_reviews('review_page_1.html'))
@@ -0,0 +1,161 @@
+## CrawlScheduler crawling the fixture pages served by a local HTTP server
+
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import pytest
+from conftest import read_fixture
+from CrawlScheduler import CrawlScheduler, TokenBucket
+from Fetchers import HttpFetcher
+
+
+class FixtureSite:
+    """
+    Serves the product page of B0TEST0001 and three pages of its reviews, the second one repeating the first, and
+    a product page without reviews for B0TEST0002. Statuses or pages queued in failures[path] are served first.
+    """
+
+    def __init__(self):
+        self.requests = Counter()
+        self.failures = {}
+        self.lock = threading.Lock()
+
+    def respond(self, path, query):
+        with self.lock:
+            self.requests[path, query.get('pageNumber', [None])[0]] += 1
+            queued = self.failures.get(path)
+            if queued:
+                return queued.pop(0)
+        if path == '/dp/B0TEST0001':
+            return read_fixture('product_page.html')
+        if path == '/dp/B0TEST0002':
+            return read_fixture('product_page_no_reviews.html')
+        if '/product-reviews/B0TEST0001/' in path:
+            return read_fixture('review_page_2.html' if query['pageNumber'] == ['3'] else 'review_page_1.html')
+        return 404
+
+
+@pytest.fixture
+def site():
+    site = FixtureSite()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            page = site.respond(url.path, parse_qs(url.query))
+            if isinstance(page, int):
+                self.send_error(page)
+                return
+            body = page.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    site.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield site
+    server.shutdown()
+    server.server_close()
+
+
+def scheduler(site, **kwargs):
+    options = dict(fetcher_factory=lambda: HttpFetcher(timeout=5), workers=3, rate=None, backoff=0.01,
+                   captcha_backoff=0.01, base_url=site.base_url)
+    options.update(kwargs)
+    return CrawlScheduler(**options)
+
+
+def test_pages_are_yielded_in_asin_and_page_order(site):
+    crawler = scheduler(site)
+    pages = list(crawler.crawl(['B0TEST0001', 'B0TEST0002', 'B0TEST0001']))
+    assert [(asin, page_nr) for asin, page_nr, _ in pages] == [('B0TEST0001', 1), ('B0TEST0001', 2),
+                                                               ('B0TEST0001', 3)]
+    # The second page repeats the reviews of the first one
+    assert [len(reviews) for _, _, reviews in pages] == [4, 0, 2]
+    assert crawler.stats['duplicate_reviews'] == 4
+    assert crawler.review_links['B0TEST0001'].startswith('/Maternity-Dress-Women-Feeding/product-reviews/')
+    assert 'B0TEST0002' not in crawler.review_links
+    assert crawler.stats['requests'] == 5
+
+
+def test_captcha_and_error_pages_are_retried(site):
+    site.failures['/dp/B0TEST0001'] = [read_fixture('captcha_page.html'), 503]
+    crawler = scheduler(site)
+    pages = list(crawler.crawl(['B0TEST0001']))
+    assert [page_nr for _, page_nr, _ in pages] == [1, 2, 3]
+    assert crawler.stats['captcha_hits'] == 1
+    assert crawler.stats['errors'] == 1
+    assert site.requests['/dp/B0TEST0001', None] == 3
+
+
+def test_page_failing_every_retry_ends_the_asin(site):
+    site.failures['/dp/B0TEST0001'] = [500] * 3
+    crawler = scheduler(site, max_retries=2)
+    assert list(crawler.crawl(['B0TEST0001'])) == []
+    assert crawler.stats['failed_pages'] == 1
+
+
+def test_should_continue_stops_paging(site):
+    calls = []
+
+    def first_page_only(asin, page_nr, reviews):
+        calls.append((asin, page_nr, len(reviews)))
+        return False
+
+    crawler = scheduler(site)
+    pages = list(crawler.crawl(['B0TEST0001'], should_continue=first_page_only))
+    assert [page_nr for _, page_nr, _ in pages] == [1]
+    assert calls == [('B0TEST0001', 1, 4)]
+    assert crawler.stats['early_stops'] == 1
+
+
+def test_failing_should_continue_keeps_the_page(site):
+    def broken(asin, page_nr, reviews):
+        raise ValueError("broken callback")
+
+    crawler = scheduler(site)
+    pages = list(crawler.crawl(['B0TEST0001'], should_continue=broken))
+    assert [(page_nr, len(reviews)) for _, page_nr, reviews in pages] == [(1, 4)]
+    assert crawler.stats['errors'] == 1
+    assert crawler.stats['early_stops'] == 0
+
+
+def test_known_review_link_and_start_page_skip_the_product_page(site):
+    link = "/Maternity-Dress-Women-Feeding/product-reviews/B0TEST0001/ref=cm_cr_dp_d_show_all_btm?ie=UTF8"
+    done = []
+    crawler = scheduler(site)
+    pages = list(crawler.crawl(['B0TEST0001'], review_links={'B0TEST0001': link}, start_pages={'B0TEST0001': 3},
+                               on_asin_done=done.append))
+    assert [page_nr for _, page_nr, _ in pages] == [3]
+    assert site.requests['/dp/B0TEST0001', None] == 0
+    assert done == ['B0TEST0001']
+
+
+def test_host_rate_limit(site):
+    crawler = scheduler(site, rate=20, burst=1)
+    start = time.monotonic()
+    list(crawler.crawl(['B0TEST0001']))
+    # 4 requests, the first one uses the initial token
+    assert time.monotonic() - start >= 3 / 20 * 0.9
+
+
+def test_token_bucket_without_rate_only_waits_for_pauses():
+    bucket = TokenBucket(None)
+    start = time.monotonic()
+    for _ in range(100):
+        bucket.acquire()
+    assert time.monotonic() - start < 0.05
+    bucket.pause(0.1)
+    bucket.acquire()
+    assert time.monotonic() - start >= 0.1
+    with pytest.raises(ValueError):
+        TokenBucket(0)
@@ -0,0 +1,141 @@
+## IngestPipeline storing pages through a writer thread, holding the crawl back and stopping on write errors
+
+import csv
+import threading
+import time
+import mongomock
+import pytest
+import IngestPipeline as ingest
+from IngestPipeline import CsvSink, IngestPipeline
+from MongoDBOperations import MongoDBOps
+
+
+DB = 'Neemai'
+COLLECTION = 'maternity_wear'
+FIELDS = ['review_title', 'ratings', 'review_comment', 'size', 'asin']
+
+
+def page(start, n=2, asin='B0TEST0001'):
+    return [{'asin': asin, 'review_title': f'title {i}', 'review_comment': f'comment {i}', 'ratings': 5,
+             'size': 'M'} for i in range(start, start + n)]
+
+
+class FakeMongoOps:
+    """
+    Records the upserted batches. Each write waits for release to be set and raises the queued errors first.
+    """
+
+    def __init__(self, errors=()):
+        self.batches = []
+        self.errors = list(errors)
+        self.release = threading.Event()
+        self.release.set()
+        self.writing = threading.Event()
+
+    def upsert_reviews(self, db_name, collection_name, source):
+        self.writing.set()
+        self.release.wait()
+        if self.errors:
+            raise self.errors.pop(0)
+        self.batches.append(source)
+        return {'inserted': len(source), 'matched': 0, 'skipped': 0}
+
+
+def test_pages_are_stored_before_their_callback(tmp_path):
+    stored = []
+    csv_path = str(tmp_path / 'Reviews.csv')
+    with MongoDBOps(username=None, pwd=None, client=mongomock.MongoClient()) as mongo_ops:
+        collection = mongo_ops.get_collection(collection_name=COLLECTION, db_name=DB)
+        with IngestPipeline(mongo_ops, DB, COLLECTION, batch_size=3, sinks=[CsvSink(csv_path, FIELDS)]) as pipeline:
+            for nr, reviews in enumerate([page(0), page(2), page(0), []], start=1):
+                pipeline.put(reviews, lambda nr=nr: stored.append((nr, collection.count_documents({}))))
+        assert collection.count_documents({}) == 4
+    # The first two pages fill a batch, the last two are written on close
+    assert stored == [(1, 4), (2, 4), (3, 4), (4, 4)]
+    assert pipeline.stats['batches'] == 2
+    assert (pipeline.stats['inserted'], pipeline.stats['matched']) == (4, 2)
+    with open(csv_path, encoding='utf-8', newline='') as f:
+        assert len(list(csv.DictReader(f))) == 6
+
+
+def test_batch_is_flushed_after_the_interval():
+    mongo_ops = FakeMongoOps()
+    stored = threading.Event()
+    with IngestPipeline(mongo_ops, DB, COLLECTION, batch_size=100, flush_interval=0.05) as pipeline:
+        pipeline.put(page(0), stored.set)
+        assert stored.wait(2)
+        assert mongo_ops.batches == [page(0)]
+
+
+def test_full_queue_holds_the_crawl_back():
+    mongo_ops = FakeMongoOps()
+    mongo_ops.release.clear()
+    pipeline = IngestPipeline(mongo_ops, DB, COLLECTION, batch_size=1, max_pending_pages=1)
+    pipeline.put(page(0))
+    assert mongo_ops.writing.wait(2)
+    # The writer is stuck on the first page, the second one fills the queue and the third has to wait
+    pipeline.put(page(2))
+    crawl = threading.Thread(target=pipeline.put, args=(page(4),))
+    crawl.start()
+    crawl.join(0.3)
+    assert crawl.is_alive()
+    assert mongo_ops.batches == []
+
+    mongo_ops.release.set()
+    crawl.join(2)
+    assert not crawl.is_alive()
+    stats = pipeline.close()
+    assert mongo_ops.batches == [page(0), page(2), page(4)]
+    assert stats['backpressure_waits'] >= 1
+    assert stats['blocked_seconds'] >= 0.3
+
+
+def test_failing_write_is_retried(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(ingest.time, 'sleep', sleeps.append)
+    mongo_ops = FakeMongoOps(errors=[Exception("primary stepped down")])
+    with IngestPipeline(mongo_ops, DB, COLLECTION, max_retries=1) as pipeline:
+        pipeline.put(page(0))
+    assert mongo_ops.batches == [page(0)]
+    assert sleeps == [1]
+
+
+def test_writer_error_stops_the_pipeline():
+    mongo_ops = FakeMongoOps(errors=[Exception("disk full")])
+    mongo_ops.release.clear()
+    stored = []
+    pipeline = IngestPipeline(mongo_ops, DB, COLLECTION, batch_size=1, max_pending_pages=1, max_retries=0)
+    pipeline.put(page(0), lambda: stored.append(1))
+    assert mongo_ops.writing.wait(2)
+    pipeline.put(page(2), lambda: stored.append(2))
+    # A put waiting for room is woken up by the error
+    crawl_error = []
+
+    def crawl():
+        try:
+            pipeline.put(page(4))
+        except Exception as e:
+            crawl_error.append(e)
+
+    thread = threading.Thread(target=crawl)
+    thread.start()
+    while not pipeline.stats['backpressure_waits']:
+        time.sleep(0.01)
+    mongo_ops.release.set()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert len(crawl_error) == 1 and 'disk full' in str(crawl_error[0])
+    with pytest.raises(Exception, match='disk full'):
+        pipeline.put(page(6))
+    with pytest.raises(Exception, match='disk full'):
+        pipeline.close()
+    assert stored == []
+
+
+def test_queued_pages_are_stored_when_the_crawl_fails():
+    mongo_ops = FakeMongoOps()
+    with pytest.raises(KeyboardInterrupt):
+        with IngestPipeline(mongo_ops, DB, COLLECTION, batch_size=100) as pipeline:
+            pipeline.put(page(0))
+            raise KeyboardInterrupt
+    assert mongo_ops.batches == [page(0)]
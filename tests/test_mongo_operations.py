@@ -0,0 +1,162 @@
+## MongoDBOps against an in-memory mongomock client
+
+import mongomock
+import pandas as pd
+import pytest
+from pymongo.errors import DuplicateKeyError
+from MongoDBOperations import FINGERPRINT_LOOKUP_INDEX, MongoDBOps, review_fingerprint
+from migrate_fingerprints import migrate
+
+
+DB = 'Neemai'
+COLLECTION = 'maternity_wear'
+
+
+def reviews(n, asin='B0TEST0001'):
+    return [{'asin': asin, 'review_title': f'title {i}', 'review_comment': f'comment {i}', 'ratings': 1 + i % 5,
+             'size': ['S', 'M', 'L'][i % 3]} for i in range(n)]
+
+
+@pytest.fixture
+def client():
+    return mongomock.MongoClient()
+
+
+@pytest.fixture
+def mongo_ops(client):
+    with MongoDBOps(username=None, pwd=None, client=client) as mongo_ops:
+        yield mongo_ops
+
+
+def test_handles_are_shared_and_cached(mongo_ops, client):
+    assert mongo_ops.get_mongo_client() is client
+    collection = mongo_ops.get_collection(collection_name=COLLECTION, db_name=DB)
+    assert mongo_ops.get_collection(collection_name=COLLECTION, db_name=DB) is collection
+    assert not mongo_ops.is_collection_present(collection_name=COLLECTION, db_name=DB)
+    mongo_ops.insert_records(db_name=DB, collection_name=COLLECTION, records=reviews(3))
+    assert mongo_ops.is_collection_present(collection_name=COLLECTION, db_name=DB)
+    assert mongo_ops.is_db_present(DB)
+    assert mongo_ops.drop_collection(collection_name=COLLECTION, db_name=DB)
+    assert not mongo_ops.is_collection_present(collection_name=COLLECTION, db_name=DB)
+
+
+def test_injected_client_stays_open_and_in_use(client):
+    with MongoDBOps(username=None, pwd=None, client=client) as mongo_ops:
+        mongo_ops.insert_records(db_name=DB, collection_name=COLLECTION, records=reviews(2))
+    assert mongo_ops.client is client
+    assert mongo_ops.collections == {}
+    # The next operation reuses the injected client instead of connecting to Atlas
+    assert mongo_ops.get_collection(collection_name=COLLECTION, db_name=DB).count_documents({}) == 2
+    assert client[DB][COLLECTION].count_documents({}) == 2
+
+
+def test_owned_client_is_created_lazily_and_closed():
+    mongo_ops = MongoDBOps(username='user', pwd='pwd')
+    assert mongo_ops.owns_client and mongo_ops.client is None
+    # Nothing to close before the first operation, no connection is made
+    mongo_ops.close_mongo_client()
+    assert mongo_ops.client is None
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_bulk_load_sources(mongo_ops, tmp_path, workers):
+    df = pd.DataFrame(reviews(25))
+    path = tmp_path / 'reviews.csv'
+    df.to_csv(path, index=False)
+    for source in (df, str(path), iter(reviews(25)), pd.read_csv(path, chunksize=7)):
+        mongo_ops.drop_collection(collection_name=COLLECTION, db_name=DB)
+        stats = mongo_ops.bulk_load(db_name=DB, collection_name=COLLECTION, source=source, chunk_size=10,
+                                    workers=workers)
+        assert stats['inserted'] == 25
+        stored = mongo_ops.get_dataframe_collection(db_name=DB, collection_name=COLLECTION,
+                                                    projection={'_id': 0})
+        assert sorted(stored['review_title']) == sorted(df['review_title'])
+
+
+def test_reads_in_chunks(mongo_ops):
+    mongo_ops.bulk_load(db_name=DB, collection_name=COLLECTION, source=reviews(25))
+    chunks = list(mongo_ops.iter_dataframes(db_name=DB, collection_name=COLLECTION, chunk_size=10))
+    assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+    table = mongo_ops.get_arrow_table(db_name=DB, collection_name=COLLECTION, chunk_size=10)
+    assert table.num_rows == 25
+    assert set(table.column_names) >= {'_id', 'asin', 'ratings', 'size'}
+    assert list(mongo_ops.iter_dataframes(db_name=DB, collection_name='missing')) == []
+
+
+def test_fingerprint_normalizes_numbers_only():
+    review = reviews(1)[0]
+    assert review_fingerprint(review) == review_fingerprint(dict(review, ratings=float(review['ratings'])))
+    assert review_fingerprint(review) == review_fingerprint(dict(review, ratings=str(review['ratings'])))
+    assert review_fingerprint(dict(review, review_title='1')) != review_fingerprint(dict(review, review_title='1.0'))
+
+
+def test_upsert_never_duplicates(mongo_ops):
+    first = mongo_ops.upsert_reviews(db_name=DB, collection_name=COLLECTION, source=reviews(10) + reviews(2))
+    assert first == {'inserted': 10, 'matched': 0, 'skipped': 2}
+    second = mongo_ops.upsert_reviews(db_name=DB, collection_name=COLLECTION, source=pd.DataFrame(reviews(12)))
+    assert second == {'inserted': 2, 'matched': 10, 'skipped': 0}
+    collection = mongo_ops.get_collection(collection_name=COLLECTION, db_name=DB)
+    assert collection.count_documents({}) == 12
+    assert collection.index_information()['fingerprint_1']['unique']
+
+
+def test_documents_without_fingerprint_do_not_collide(mongo_ops):
+    mongo_ops.upsert_reviews(db_name=DB, collection_name=COLLECTION, source=reviews(3))
+    # The unique index only covers fingerprinted documents
+    stats = mongo_ops.bulk_load(db_name=DB, collection_name='other', source=reviews(3))
+    assert stats['inserted'] == 3
+    mongo_ops.bulk_load(db_name=DB, collection_name=COLLECTION, source=[{'note': 'a'}, {'note': 'b'}])
+    assert mongo_ops.get_collection(collection_name=COLLECTION, db_name=DB).count_documents({}) == 5
+
+
+def test_duplicates_fall_back_to_a_lookup_index_until_migrated(mongo_ops):
+    mongo_ops.bulk_load(db_name=DB, collection_name=COLLECTION, source=reviews(5) + reviews(3))
+    counts = mongo_ops.upsert_reviews(db_name=DB, collection_name=COLLECTION, source=reviews(6))
+    assert counts == {'inserted': 1, 'matched': 5, 'skipped': 0}
+    collection = mongo_ops.get_collection(collection_name=COLLECTION, db_name=DB)
+    indexes = collection.index_information()
+    assert FINGERPRINT_LOOKUP_INDEX in indexes and 'fingerprint_1' not in indexes
+
+    result = migrate(mongo_ops, DB, COLLECTION)
+    assert result['duplicates_removed'] == 3 and result['unique']
+    assert collection.count_documents({}) == 6
+    indexes = collection.index_information()
+    assert FINGERPRINT_LOOKUP_INDEX not in indexes and indexes['fingerprint_1']['unique']
+    assert mongo_ops.upsert_reviews(db_name=DB, collection_name=COLLECTION, source=reviews(7))['inserted'] == 1
+
+
+def test_size_report_runs_on_the_server(mongo_ops):
+    mongo_ops.bulk_load(db_name=DB, collection_name=COLLECTION, source=reviews(9) + [{'size': 'Medium'}])
+    report = mongo_ops.size_distribution(db_name=DB, collection_name=COLLECTION, replacements={'Medium': 'M'})
+    assert dict(zip(report['size'], report['count'])) == {'S': 3, 'M': 4, 'L': 3}
+
+
+def test_reupsert_leaves_stored_reviews_unchanged(mongo_ops):
+    mongo_ops.upsert_reviews(db_name=DB, collection_name=COLLECTION, source=reviews(3))
+    collection = mongo_ops.get_collection(collection_name=COLLECTION, db_name=DB)
+    stored = list(collection.find({}, sort=[('_id', 1)]))
+    rescraped = [dict(review, scraped_at='later') for review in reviews(3)]
+    assert mongo_ops.upsert_reviews(db_name=DB, collection_name=COLLECTION, source=rescraped) == \
+        {'inserted': 0, 'matched': 3, 'skipped': 0}
+    assert list(collection.find({}, sort=[('_id', 1)])) == stored
+
+
+def test_fingerprint_index_is_partial_and_unique(mongo_ops):
+    mongo_ops.upsert_reviews(db_name=DB, collection_name=COLLECTION, source=reviews(2))
+    collection = mongo_ops.get_collection(collection_name=COLLECTION, db_name=DB)
+    index = collection.index_information()['fingerprint_1']
+    assert index['unique'] and index['partialFilterExpression'] == {'fingerprint': {'$exists': True}}
+    with pytest.raises(DuplicateKeyError):
+        collection.insert_one(dict(reviews(1)[0], fingerprint=review_fingerprint(reviews(1)[0])))
+    collection.insert_many([{'note': 'a'}, {'note': 'b'}])
+    assert collection.count_documents({}) == 4
+
+
+def test_legacy_index_is_rebuilt_partial_and_fingerprints_refreshed(mongo_ops):
+    collection = mongo_ops.get_collection(collection_name=COLLECTION, db_name=DB)
+    collection.insert_many([dict(review, fingerprint=f'old {i}') for i, review in enumerate(reviews(3))])
+    collection.create_index('fingerprint', unique=True)
+    counts = mongo_ops.ensure_fingerprint_index(db_name=DB, collection_name=COLLECTION, refresh=True)
+    assert counts == {'fingerprinted': 3, 'duplicates_removed': 0, 'unique': True}
+    assert 'partialFilterExpression' in collection.index_information()['fingerprint_1']
+    assert sorted(doc['fingerprint'] for doc in collection.find()) == sorted(map(review_fingerprint, reviews(3)))
@@ -0,0 +1,104 @@
+## NearDuplicateIndex clustering near-duplicate texts, added at once or incrementally and reloaded
+
+import numpy as np
+import pytest
+from near_duplicates import NearDuplicateIndex, lsh_bands
+
+
+# Letters only, as cleaned text is
+WORDS = [a + b + c for a in 'abcdefgh' for b in 'aeiou' for c in 'klmnprst']
+
+
+def corpus(n_bases=20, variants=3, length=100, seed=0):
+    """
+    Returns cleaned texts made of n_bases random texts each followed by variants with one word replaced, and
+    the base each text was made from
+    """
+    rng = np.random.default_rng(seed)
+    texts, bases = [], []
+    for base in range(n_bases):
+        words = list(rng.choice(WORDS, size=length))
+        texts.append(' '.join(words))
+        bases.append(base)
+        for _ in range(variants):
+            variant = list(words)
+            variant[rng.integers(length)] = 'edited'
+            texts.append(' '.join(variant))
+            bases.append(base)
+    return texts, bases
+
+
+def partition(clusters):
+    groups = {}
+    for row, cluster in enumerate(clusters):
+        groups.setdefault(int(cluster), []).append(row)
+    return sorted(groups.values())
+
+
+def test_variants_are_clustered_with_their_base():
+    texts, bases = corpus()
+    index = NearDuplicateIndex()
+    clusters = index.add(texts)
+    assert partition(clusters) == partition(bases)
+    # The cluster id is the position of the first row of the cluster
+    assert clusters[:8].tolist() == [0, 0, 0, 0, 4, 4, 4, 4]
+    assert index.cluster_sizes() == {4 * base: 4 for base in range(20)}
+
+
+def test_empty_and_missing_texts_stay_alone():
+    index = NearDuplicateIndex()
+    clusters = index.add(['good fabric soft cotton', None, '', 'good fabric soft cotton', None])
+    assert clusters.tolist() == [0, 1, 2, 0, 4]
+
+
+def test_incremental_adds_match_a_single_add():
+    texts, bases = corpus()
+    keys = [f"id{i}" for i in range(len(texts))]
+    # The rows of each cluster are spread over the batches
+    order = np.random.default_rng(1).permutation(len(texts))
+    index = NearDuplicateIndex()
+    for batch in np.array_split(order, 4):
+        index.add([texts[i] for i in batch], keys=[keys[i] for i in batch])
+    assert len(index) == len(texts)
+    assert partition(index.cluster_ids(keys)) == partition(bases)
+
+    # Keys already indexed are not added again
+    again = index.add(texts[:6] + texts[:2], keys=keys[:6] + keys[:2])
+    assert len(index) == len(texts)
+    assert again.tolist() == index.cluster_ids(keys[:6] + keys[:2]).tolist()
+
+
+def test_new_text_joins_an_existing_cluster():
+    texts, _ = corpus(n_bases=3)
+    index = NearDuplicateIndex()
+    index.add(texts, keys=list(range(len(texts))))
+    variant = texts[4].split()
+    variant[-1] = 'later'
+    clusters = index.add([' '.join(variant), 'unrelated short text'], keys=['new', 'other'])
+    assert clusters.tolist() == [4, len(texts) + 1]
+
+
+def test_saved_index_reopens_and_keeps_clustering(tmp_path):
+    texts, bases = corpus()
+    keys = [f"id{i}" for i in range(len(texts))]
+    path = str(tmp_path / 'near_duplicates')
+    index = NearDuplicateIndex.open(path, threshold=0.7)
+    index.add(texts[:40], keys=keys[:40])
+    index.save(path)
+
+    reopened = NearDuplicateIndex.open(path, threshold=0.7)
+    assert reopened.cluster_ids(keys[:40]).tolist() == index.cluster_ids(keys[:40]).tolist()
+    reopened.add(texts[40:], keys=keys[40:])
+    assert partition(reopened.cluster_ids(keys)) == partition(bases)
+    with pytest.raises(ValueError):
+        NearDuplicateIndex.open(path, threshold=0.8)
+
+
+@pytest.mark.parametrize('threshold', [0.5, 0.8, 0.95])
+def test_lsh_bands_fit_the_signatures(threshold):
+    bands, rows = lsh_bands(threshold, 128)
+    assert bands * rows <= 128
+    # Pairs halfway between the threshold and identical texts are likely to share a band, pairs well below it
+    # are unlikely to
+    assert 1 - (1 - ((1 + threshold) / 2) ** rows) ** bands > 0.7
+    assert 1 - (1 - (threshold / 2) ** rows) ** bands < 0.05
@@ -0,0 +1,87 @@
+## Page cache of AmazonScrapper: each review page is fetched once per run
+
+import time
+from conftest import read_fixture
+from AmazonReviewScrap import AmazonScrapper, review_page_url
+
+
+REVIEW_LINK = "/Maternity-Dress-Women-Feeding/product-reviews/B0TEST0001/ref=cm_cr_dp_d_show_all_btm?ie=UTF8"
+
+
+class FakeFetcher:
+    """
+    Serves the fixture pages by URL and records the fetched URLs
+    """
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.urls = []
+        self.closed = False
+
+    def __call__(self, url):
+        self.urls.append(url)
+        return self.pages[url]
+
+    def close(self):
+        self.closed = True
+
+
+def review_pages(n_pages=3):
+    pages = {review_page_url(REVIEW_LINK, page_nr): read_fixture('review_page_1.html')
+             for page_nr in range(1, n_pages)}
+    pages[review_page_url(REVIEW_LINK, n_pages)] = read_fixture('review_page_2.html')
+    return pages
+
+
+def test_reviews_and_next_page_status_fetch_the_page_once():
+    fetcher = FakeFetcher(review_pages())
+    scraper = AmazonScrapper("maternity wear", sleep_time=0, fetcher=fetcher)
+    reviews = scraper.get_reviews(REVIEW_LINK, 1)
+    assert len(reviews) == 4
+    assert scraper.get_np_status(REVIEW_LINK, 1) is True
+    assert scraper.get_np_status(REVIEW_LINK, 3) is False
+    assert scraper.get_reviews(REVIEW_LINK, 3)[0]['size'] == 'XXL'
+    assert fetcher.urls == [review_page_url(REVIEW_LINK, 1), review_page_url(REVIEW_LINK, 3)]
+
+
+def test_least_recently_used_page_is_evicted():
+    fetcher = FakeFetcher(review_pages())
+    scraper = AmazonScrapper("maternity wear", sleep_time=0, page_cache_size=2, fetcher=fetcher)
+    urls = [review_page_url(REVIEW_LINK, page_nr) for page_nr in (1, 2, 3)]
+    scraper.get_page(urls[0])
+    scraper.get_page(urls[1])
+    scraper.get_page(urls[0])
+    scraper.get_page(urls[2])
+    assert list(scraper.page_cache) == [urls[0], urls[2]]
+    scraper.get_page(urls[1])
+    assert fetcher.urls == [urls[0], urls[1], urls[2], urls[1]]
+
+
+def test_captcha_pages_are_fetched_again():
+    url = review_page_url(REVIEW_LINK, 1)
+    fetcher = FakeFetcher({url: read_fixture('captcha_page.html')})
+    scraper = AmazonScrapper("maternity wear", sleep_time=0, fetcher=fetcher)
+    assert scraper.get_review_page(REVIEW_LINK, 1) == (None, None)
+    fetcher.pages[url] = read_fixture('review_page_2.html')
+    reviews, np_status = scraper.get_review_page(REVIEW_LINK, 1)
+    assert len(reviews) == 2 and np_status is False
+    assert fetcher.urls == [url, url]
+
+
+def test_cache_hits_skip_the_request_delay():
+    fetcher = FakeFetcher(review_pages())
+    scraper = AmazonScrapper("maternity wear", sleep_time=0.2, fetcher=fetcher)
+    start = time.monotonic()
+    scraper.get_reviews(REVIEW_LINK, 1)
+    scraper.get_reviews(REVIEW_LINK, 2)
+    assert time.monotonic() - start >= 0.2
+    start = time.monotonic()
+    scraper.get_np_status(REVIEW_LINK, 1)
+    scraper.get_np_status(REVIEW_LINK, 2)
+    assert time.monotonic() - start < 0.1
+
+
+def test_injected_fetcher_is_left_open():
+    fetcher = FakeFetcher({})
+    AmazonScrapper("maternity wear", fetcher=fetcher).close()
+    assert not fetcher.closed
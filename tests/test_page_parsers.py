@@ -0,0 +1,51 @@
+## Parity of the lxml parsers of PageParsers with the BeautifulSoup parsers the scraper used before them
+
+import pytest
+from bs4 import BeautifulSoup as bs
+from conftest import read_fixture
+from PageParsers import parse_asins, parse_review_link_page, parse_review_page
+import ReferenceParsers as reference
+
+
+REVIEW_LINK = ("/Maternity-Dress-Women-Feeding/product-reviews/B0TEST0001/ref=cm_cr_dp_d_show_all_btm"
+               "?ie=UTF8&reviewerType=all_reviews")
+
+
+def test_review_pages_match_reference(fixture_pages):
+    for name, page in fixture_pages.items():
+        assert parse_review_page(page, REVIEW_LINK) == reference.parse_review_page(page, REVIEW_LINK), name
+
+
+def test_review_link_matches_reference(fixture_pages):
+    for name, page in fixture_pages.items():
+        assert parse_review_link_page(page) == reference.parse_review_link(bs(page, 'html.parser')), name
+
+
+def test_asins_match_reference(fixture_pages):
+    for name, page in fixture_pages.items():
+        assert parse_asins(page) == reference.parse_asins(bs(page, 'html.parser')), name
+
+
+def test_review_page_fields():
+    reviews, np_status = parse_review_page(read_fixture('review_page_1.html'), REVIEW_LINK)
+    assert np_status is True
+    assert [review['size'] for review in reviews] == ['M', 'XL', 'no size', 'no size']
+    assert reviews[0]['review_title'] == 'Lovely fabric, fits through all trimesters'
+    assert reviews[0]['ratings'] == 5.0
+    assert reviews[0]['review_comment'].startswith('Very comfortable')
+    assert 'display: none' not in reviews[2]['review_comment']
+    assert (reviews[3]['review_title'], reviews[3]['ratings']) == ('no title', 'no ratings')
+    assert {review['asin'] for review in reviews} == {'B0TEST0001'}
+
+
+@pytest.mark.parametrize('name, np_status', [('review_page_1.html', True), ('review_page_2.html', False),
+                                             ('review_page_single.html', False), ('captcha_page.html', False)])
+def test_next_page_status(name, np_status):
+    assert parse_review_page(read_fixture(name), REVIEW_LINK)[1] is np_status
+
+
+def test_product_and_search_pages():
+    assert parse_review_link_page(read_fixture('product_page.html')).startswith(
+        '/Maternity-Dress-Women-Feeding/product-reviews/B0TEST0001/')
+    assert parse_review_link_page(read_fixture('product_page_no_reviews.html')) is None
+    assert parse_asins(read_fixture('search_page.html')) == ['B0TEST0001', 'B0TEST0003', 'B0TEST0004']
@@ -0,0 +1,165 @@
+## TextCleaner and the tokenize fast path against the original clean_text steps, and the parallel cleaning
+
+import os
+import re
+import multiprocessing
+import string
+from functools import partial
+import contractions
+import nltk
+import pandas as pd
+import pytest
+from nltk.tokenize import word_tokenize
+import Preprocessing
+from Preprocessing import EMOJI_PATTERN, EMOTICONS, TextCleaner, _TOKENIZER_SPLITS, clean_many_parallel, tokenize
+from conftest import ROOT
+
+
+# Stand-in for the NLTK english stop word list when its data is not installed
+STOP_WORDS = ("i me my we our you your he him his she her it its they them their what which who this that "
+              "these those am is are was were be been being have has had do does did a an the and but if or "
+              "because as until while of at by for with about against between into through during before after "
+              "to from up down in out on off over under again further then once here there when where why how "
+              "all any both each few more most other some such no nor not only own same so than too very s t "
+              "can will just don should now d ll m o re ve y ain aren couldn didn doesn isn wasn weren won").split()
+
+EXTRA_TEXTS = [
+    "Loved it 😀😀 great fit 👍",
+    "Nice colour :) would buy again :-) 8-) =]",
+    "Size ３ is fine, the ٣rd wash faded ² times",
+    "I can't believe it's not butter, they'd've liked it",
+    "The media could not be loaded. Fabric is soft",
+    "CANNOT return it, gonna wanna gimme lemme gotta",
+    "   extra    spaces\tand\nnew lines   ",
+    "",
+]
+
+
+class _StopWords:
+
+    def __init__(self, words):
+        self._words = words
+
+    def words(self, language):
+        return list(self._words)
+
+
+def _has_nltk_data(resource):
+    try:
+        nltk.data.find(resource)
+        return True
+    except LookupError:
+        return False
+
+
+@pytest.fixture
+def nltk_words(monkeypatch):
+    """
+    Returns the stop word corpus and the tokenizer used by both the original steps and TextCleaner. Without the
+    NLTK data, a fixed stop word list and word_tokenize without the Punkt sentence split stand in for them: the
+    text reaching the tokenizer has no punctuation left, so Punkt returns it as a single sentence anyway.
+    """
+    corpus = nltk.corpus.stopwords if _has_nltk_data('corpora/stopwords') else _StopWords(STOP_WORDS)
+    tokenizer = word_tokenize if _has_nltk_data('tokenizers/punkt_tab') else partial(word_tokenize,
+                                                                                    preserve_line=True)
+    monkeypatch.setattr(Preprocessing, 'stopwords', corpus)
+    monkeypatch.setattr(Preprocessing, 'word_tokenize', tokenizer)
+    return corpus, tokenizer
+
+
+def original_clean_text(text, corpus, tokenizer):
+    """
+    The clean_text steps as they were before TextCleaner
+    """
+    text = text.lower()
+    text = contractions.fix(text)
+    text = ''.join(char for char in text if char not in string.punctuation)
+    text = ''.join(char for char in text if not char.isdigit())
+    text = ' '.join(text.split())
+    text = re.compile(EMOJI_PATTERN).sub('', text)
+    text = re.compile("|".join(re.escape(emoticon) for emoticon in EMOTICONS.keys())).sub('', text)
+    text = text.replace('the media could not be loaded', '')
+    text = ' '.join(word for word in tokenizer(text) if word not in corpus.words('english'))
+    return text
+
+
+def review_texts():
+    reviews = pd.read_csv(os.path.join(ROOT, 'AmazonScrapWebdriver', 'Reviews.csv'))
+    texts = pd.concat([reviews['review_comment'], reviews['review_title']]).dropna()
+    return texts.drop_duplicates().tolist()
+
+
+def test_clean_matches_original_on_reviews(nltk_words):
+    corpus, tokenizer = nltk_words
+    cleaner = TextCleaner()
+    texts = review_texts() + EXTRA_TEXTS + [f"I {word} do it" for word in _TOKENIZER_SPLITS]
+    mismatches = [text for text in texts if cleaner.clean(text) != original_clean_text(text, corpus, tokenizer)]
+    assert mismatches == []
+
+
+@pytest.mark.parametrize('text', EXTRA_TEXTS)
+def test_clean_matches_original_on_edge_cases(nltk_words, text):
+    corpus, tokenizer = nltk_words
+    assert TextCleaner().clean(text) == original_clean_text(text, corpus, tokenizer)
+
+
+def test_tokenize_fast_path_matches_word_tokenize(nltk_words):
+    _, tokenizer = nltk_words
+    words = list(_TOKENIZER_SPLITS) + [word.upper() for word in _TOKENIZER_SPLITS] + ['Cannot', 'GoNna']
+    texts = [' '.join(words), 'good product', 'cannotx xcannot wanna be', '  spaced   out  ', '']
+    cleaner = TextCleaner()
+    # Only the cleaned reviews made of letters and spaces take the fast path
+    texts += [text for text in map(cleaner.clean, review_texts()[:2000]) if Preprocessing._SIMPLE_TEXT.fullmatch(text)]
+    for text in texts:
+        assert tokenize(text) == tokenizer(text), text
+
+
+@pytest.fixture
+def pools(monkeypatch):
+    """
+    Records the process pools started by clean_many_parallel
+    """
+    started = []
+
+    class RecordingPool(Preprocessing.ProcessPoolExecutor):
+
+        def __init__(self, *args, **kwargs):
+            started.append(kwargs.get('max_workers'))
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(Preprocessing, 'ProcessPoolExecutor', RecordingPool)
+    return started
+
+
+def _texts_with_none(n):
+    texts = review_texts()[:n]
+    for i in range(0, n, 5):
+        texts[i] = None
+    return texts
+
+
+# The workers build their cleaner from the module, so the stand-ins of nltk_words only reach them through fork
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork' and not _has_nltk_data('corpora/stopwords'),
+                    reason="the workers need the NLTK stop word list")
+def test_clean_many_parallel_matches_clean_many(nltk_words, pools, monkeypatch):
+    monkeypatch.setattr(Preprocessing, 'MIN_ROWS_PER_WORKER', 1)
+    texts = _texts_with_none(60)
+    cleaner = TextCleaner()
+    cleaned = clean_many_parallel(texts, workers=3, chunksize=7, cleaner=cleaner)
+    assert pools == [3]
+    assert cleaned == cleaner.clean_many(texts)
+    assert [i for i, text in enumerate(cleaned) if text is None] == list(range(0, 60, 5))
+
+
+def test_clean_many_parallel_serial_below_threshold(nltk_words, pools, monkeypatch):
+    monkeypatch.setattr(Preprocessing, 'MIN_ROWS_PER_WORKER', 100)
+    texts = _texts_with_none(60)
+    cleaner = TextCleaner()
+    assert clean_many_parallel(texts, workers=3, chunksize=7, cleaner=cleaner) == cleaner.clean_many(texts)
+    assert clean_many_parallel(texts, workers=1, chunksize=7, cleaner=cleaner) == cleaner.clean_many(texts)
+    assert pools == []
+
+
+def test_clean_many_parallel_rejects_chunksize(nltk_words):
+    with pytest.raises(ValueError):
+        clean_many_parallel(['text'], chunksize=0, cleaner=TextCleaner())
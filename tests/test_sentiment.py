@@ -0,0 +1,84 @@
+## Batched scoring of SentimentScorer against per-text scoring, with a tiny randomly initialized model
+
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+from tokenizers import Tokenizer, models, pre_tokenizers, processors
+from transformers import PreTrainedTokenizerFast, RobertaConfig, RobertaForSequenceClassification
+from sentiment import LABELS, SentimentScorer, softmax
+
+
+WORDS = ("the dress is good bad fit size small large fabric soft cotton colour faded stitching "
+         "comfortable return worth price zip feeding nice okay not very , . !").split()
+
+TEXTS = ["The dress is good", "bad fit , very small", "nice", "soft cotton , not faded . worth the price !",
+         "stitching came off", "", "okay okay"]
+
+
+@pytest.fixture(scope='module')
+def tiny_model(tmp_path_factory):
+    """
+    Saves a 2 layer RoBERTa classifier with a word level tokenizer, returns its directory
+    """
+    path = str(tmp_path_factory.mktemp('tiny_model'))
+    vocab = {'<s>': 0, '<pad>': 1, '</s>': 2, '<unk>': 3}
+    for word in WORDS:
+        vocab.setdefault(word, len(vocab))
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token='<unk>'))
+    tokenizer.pre_tokenizer = pre_tokenizers.BertPreTokenizer()
+    tokenizer.post_processor = processors.RobertaProcessing(('</s>', 2), ('<s>', 0))
+    PreTrainedTokenizerFast(tokenizer_object=tokenizer, bos_token='<s>', eos_token='</s>', pad_token='<pad>',
+                            unk_token='<unk>', cls_token='<s>', sep_token='</s>',
+                            model_max_length=512).save_pretrained(path)
+    config = RobertaConfig(vocab_size=len(vocab), hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+                           intermediate_size=64, max_position_embeddings=514, num_labels=3, pad_token_id=1)
+    torch.manual_seed(0)
+    RobertaForSequenceClassification(config).save_pretrained(path)
+    return path
+
+
+def per_text_scores(scorer, texts):
+    # One forward pass per text, as the notebook scored the reviews before the batched scorer
+    scores = []
+    for text in texts:
+        encoded = scorer.tokenizer(text, return_tensors='pt')
+        with torch.no_grad():
+            logits = scorer.model(**encoded).logits.numpy()
+        scores.append(softmax(logits)[0])
+    return np.array(scores)
+
+
+def test_batches_match_per_text_scoring(tiny_model):
+    scorer = SentimentScorer(tiny_model)
+    expected = per_text_scores(scorer, TEXTS)
+    for batch_size in (1, 3, 32):
+        np.testing.assert_allclose(scorer.score_batch(TEXTS, batch_size=batch_size), expected, atol=1e-5)
+    assert scorer.score_batch([]).shape == (0, len(LABELS))
+
+
+def test_long_texts_average_their_windows(tiny_model):
+    scorer = SentimentScorer(tiny_model, max_length=8, stride=2)
+    text = "the dress is good but the fit is small and the fabric is not soft , worth the price"
+    token_ids = scorer.tokenizer(text, add_special_tokens=False)['input_ids']
+    windows = scorer._windows(token_ids)
+    assert len(windows) > 1
+    assert all(len(window) <= 8 for window in windows)
+
+    probs = softmax(scorer.predict_logits(windows, batch_size=1))
+    weights = np.array([len(window) for window in windows], dtype=np.float64)
+    expected = (probs * weights[:, None]).sum(axis=0) / weights.sum()
+    scores = scorer.score_batch(["nice", text, "bad"], batch_size=2)
+    np.testing.assert_allclose(scores[1], expected, atol=1e-5)
+    np.testing.assert_allclose(scores[[0, 2]], per_text_scores(scorer, ["nice", "bad"]), atol=1e-5)
+
+
+def test_score_df_falls_back_to_the_title(tiny_model):
+    scorer = SentimentScorer(tiny_model)
+    df = pd.DataFrame({'review_comment': ["The dress is good", None, "bad fit"],
+                       'review_title': ["nice", "okay okay", None]}, index=[10, 11, 12], dtype=object)
+    result = scorer.score_df(df, batch_size=2)
+    assert list(result.columns) == LABELS
+    assert list(result.index) == [10, 11, 12]
+    np.testing.assert_allclose(result.values, per_text_scores(scorer, ["The dress is good", "okay okay", "bad fit"]),
+                               atol=1e-5)
@@ -0,0 +1,89 @@
+## Scoring server: micro-batching, request validation and the chunking client
+
+import threading
+import numpy as np
+import pytest
+from http.server import ThreadingHTTPServer
+from sentiment_server import MicroBatcher, SentimentClient, connect_scorer, make_handler
+
+
+class LengthScorer:
+    """
+    Scores a text by its length, fails on the text 'fail', and records the size of every batch it scores
+    """
+    model_id = 'length'
+
+    def __init__(self):
+        self.batches = []
+
+    def score_batch(self, texts, batch_size=32):
+        self.batches.append(len(texts))
+        if 'fail' in texts:
+            raise ValueError("cannot score 'fail'")
+        lengths = np.array([len(text) for text in texts], dtype=np.float64)
+        return np.stack([lengths, lengths + 1, lengths + 2], axis=1)
+
+
+def expected(texts):
+    lengths = np.array([len(text) for text in texts], dtype=np.float64)
+    return np.stack([lengths, lengths + 1, lengths + 2], axis=1)
+
+
+@pytest.fixture
+def server():
+    scorer = LengthScorer()
+    batcher = MicroBatcher(scorer, max_batch=4, max_wait_ms=50)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(batcher))
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    server.scorer = scorer
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_failing_request_does_not_fail_its_batch():
+    batcher = MicroBatcher(LengthScorer(), max_batch=64, max_wait_ms=200)
+    results = {}
+
+    def submit(name, texts):
+        try:
+            results[name] = batcher.submit(texts)
+        except Exception as e:
+            results[name] = e
+
+    threads = [threading.Thread(target=submit, args=(name, texts))
+               for name, texts in (('good', ['ab', 'abc']), ('bad', ['fail']), ('other', ['a']))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert isinstance(results['bad'], ValueError)
+    np.testing.assert_array_equal(results['good'], expected(['ab', 'abc']))
+    np.testing.assert_array_equal(results['other'], expected(['a']))
+
+
+def test_client_sends_max_batch_sized_chunks(server):
+    client = SentimentClient(port=server.server_address[1])
+    texts = [str(i) * (i % 7) for i in range(11)]
+    np.testing.assert_array_equal(client.score_batch(texts), expected(texts))
+    assert client.chunk_size == 4
+    assert max(server.scorer.batches) <= 4
+    assert client.score_batch([]).shape == (0, 3)
+
+
+@pytest.mark.parametrize('body', [{'texts': 'not a list'}, {'texts': [1, 2]}, {'other': []}, ['a']])
+def test_invalid_requests_are_rejected(server, body):
+    client = SentimentClient(port=server.server_address[1])
+    with pytest.raises(Exception, match='400'):
+        client._request('/score', body)
+    assert server.scorer.batches == []
+
+
+def test_unreachable_server_falls_back_to_local_scoring(monkeypatch, caplog):
+    import sentiment_server
+    monkeypatch.setattr(sentiment_server, 'SentimentScorer', lambda model_name, backend: ('local', model_name))
+    with ThreadingHTTPServer(('127.0.0.1', 0), make_handler(None)) as unused:
+        port = unused.server_address[1]
+    assert connect_scorer(port=port, model_name='tiny', connect_timeout=0.5) == ('local', 'tiny')
+    assert 'unreachable' in caplog.text
@@ -0,0 +1,123 @@
+## SnapshotStore refreshing only the changed partitions of a mongomock collection, and pruned reads
+
+import datetime
+import os
+import mongomock
+import pyarrow.parquet as pq
+import pytest
+from bson import ObjectId
+import snapshot_store
+from MongoDBOperations import MongoDBOps
+from snapshot_store import SnapshotStore
+
+
+DB = 'Neemai'
+COLLECTION = 'maternity_wear'
+
+
+def object_id(day):
+    """
+    Returns a new ObjectId generated on 2024-05-<day>
+    """
+    generated = datetime.datetime(2024, 5, day, 12, tzinfo=datetime.timezone.utc)
+    return ObjectId(ObjectId.from_datetime(generated).binary[:4] + ObjectId().binary[4:])
+
+
+def review(asin, i, day=1, **fields):
+    return dict({'_id': object_id(day), 'asin': asin, 'review_title': f'title {i}', 'review_comment': f'comment {i}',
+                 'ratings': 1 + i % 5, 'size': 'M'}, **fields)
+
+
+@pytest.fixture
+def mongo_ops():
+    with MongoDBOps(username=None, pwd=None, client=mongomock.MongoClient()) as mongo_ops:
+        collection = mongo_ops.get_collection(collection_name=COLLECTION, db_name=DB)
+        collection.insert_many([review(asin, i, day=1 + i % 2) for asin in ('A1', 'A2', 'A3', 'A4') for i in range(3)])
+        yield mongo_ops
+
+
+@pytest.fixture
+def collection(mongo_ops):
+    return mongo_ops.get_collection(collection_name=COLLECTION, db_name=DB)
+
+
+@pytest.fixture
+def read_paths(monkeypatch):
+    """
+    Records the files read by the store
+    """
+    paths = []
+    read_table = pq.read_table
+
+    def recording_read_table(source, **kwargs):
+        paths.extend(os.path.basename(os.path.dirname(path)) for path in source)
+        return read_table(source, **kwargs)
+
+    monkeypatch.setattr(snapshot_store.pq, 'read_table', recording_read_table)
+    return paths
+
+
+def refresh(store, mongo_ops, **kwargs):
+    return store.refresh(mongo_ops, DB, COLLECTION, cleaner=False, **kwargs)
+
+
+def files_by_partition(entry):
+    return {file['partition']: file['path'] for file in entry['files']}
+
+
+def test_refresh_only_rewrites_changed_partitions(tmp_path, mongo_ops, collection):
+    store = SnapshotStore(str(tmp_path / 'snapshots'))
+    first = refresh(store, mongo_ops)
+    assert (first['version'], first['rows'], first['refreshed_partitions']) == (1, 12, 4)
+
+    collection.insert_one(review('A1', 3))
+    collection.update_one({'asin': 'A2'}, {'$set': {'sentiment': {'neg': 0.1, 'neu': 0.2, 'pos': 0.7,
+                                                                  'model': 'm', 'key': 'k'}}})
+    collection.delete_one({'asin': 'A3'})
+    second = refresh(store, mongo_ops)
+    assert (second['version'], second['parent'], second['rows'], second['refreshed_partitions']) == (2, 1, 12, 3)
+    assert files_by_partition(second)['A4'] == files_by_partition(first)['A4']
+    assert files_by_partition(second)['A1'] != files_by_partition(first)['A1']
+
+    # Nothing changed since, no new version
+    assert refresh(store, mongo_ops) == second
+    assert store.versions == [1, 2]
+
+    latest = store.load()
+    assert sorted(latest.groupby('asin').size().items()) == [('A1', 4), ('A2', 3), ('A3', 2), ('A4', 3)]
+    assert latest.loc[latest['sentiment_key'].notna(), 'sentiment_pos'].tolist() == [0.7]
+    # The first version is kept as it was
+    assert len(store.load(version=1)) == 12
+    assert len(SnapshotStore(store.path).load(version=1)) == 12
+
+
+def test_scrape_date_partitions(tmp_path, mongo_ops, collection):
+    store = SnapshotStore(str(tmp_path / 'snapshots'))
+    first = refresh(store, mongo_ops, partition_by='scrape_date')
+    assert sorted(files_by_partition(first)) == ['2024-05-01', '2024-05-02']
+    collection.insert_one(review('A1', 9, day=3))
+    second = refresh(store, mongo_ops, partition_by='asin')
+    assert second['partition_by'] == 'scrape_date' and second['refreshed_partitions'] == 1
+    assert files_by_partition(second)['2024-05-01'] == files_by_partition(first)['2024-05-01']
+    assert store.load(partitions=['2024-05-03'])['review_title'].tolist() == ['title 9']
+
+
+def test_load_reads_only_the_requested_partitions_and_rows(tmp_path, mongo_ops, read_paths):
+    store = SnapshotStore(str(tmp_path / 'snapshots'))
+    refresh(store, mongo_ops)
+    read_paths.clear()
+    df = store.load(columns=['asin', 'ratings'], partitions=['A2', 'A4'], filters=[('ratings', '<=', 2)])
+    assert sorted(read_paths) == ['asin=A2', 'asin=A4']
+    assert sorted(df.itertuples(index=False, name=None)) == [('A2', 1.0), ('A2', 2.0), ('A4', 1.0), ('A4', 2.0)]
+    assert list(store.load(partitions=['A9']).columns) == snapshot_store.SCHEMA.names
+
+
+def test_prune_removes_files_of_dropped_versions(tmp_path, mongo_ops, collection):
+    store = SnapshotStore(str(tmp_path / 'snapshots'))
+    first = refresh(store, mongo_ops)
+    collection.insert_one(review('A1', 3))
+    refresh(store, mongo_ops)
+    assert store.prune(keep=1) == 1
+    assert store.versions == [2]
+    assert not os.path.exists(os.path.join(store.path, files_by_partition(first)['A1']))
+    assert len(store.load()) == 13
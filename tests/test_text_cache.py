@@ -0,0 +1,86 @@
+## CleanTextCache tiers and the cached cleaning of Preprocessing
+
+from Preprocessing import _clean_with_cache
+from TextCache import CleanTextCache
+
+
+class CountingCleaner:
+    """
+    Upper-cases texts and records the texts it was asked to clean
+    """
+
+    def __init__(self, config_key='v1'):
+        self.config_key = config_key
+        self.cleaned = []
+
+    def clean_many(self, texts):
+        self.cleaned.extend(texts)
+        return [text.upper() for text in texts]
+
+
+def key(text, config_key='v1'):
+    return CleanTextCache.make_key(text, config_key)
+
+
+def test_hits_and_misses_are_counted():
+    cache = CleanTextCache()
+    assert cache.get_many([key('a'), key('b')]) == {}
+    cache.put_many({key('a'): 'A'})
+    assert cache.get_many([key('a'), key('b')]) == {key('a'): 'A'}
+    assert cache.stats() == {'hits': 1, 'misses': 3, 'memory_entries': 1}
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = CleanTextCache(maxsize=2)
+    cache.put_many({key('a'): 'A', key('b'): 'B'})
+    cache.get_many([key('a')])
+    cache.put_many({key('c'): 'C'})
+    assert cache.get_many([key('a'), key('b'), key('c')]) == {key('a'): 'A', key('c'): 'C'}
+    assert cache.stats()['memory_entries'] == 2
+
+
+def test_sqlite_tier_persists_across_instances(tmp_path):
+    path = str(tmp_path / 'cleaned.sqlite')
+    with CleanTextCache(path=path) as cache:
+        cache.put_many({key('a'): 'A', key('b'): 'B'})
+
+    with CleanTextCache(maxsize=1, path=path) as cache:
+        assert cache.stats()['memory_entries'] == 0
+        assert cache.get_many([key('a'), key('b'), key('c')]) == {key('a'): 'A', key('b'): 'B'}
+        assert cache.stats() == {'hits': 2, 'misses': 1, 'memory_entries': 1}
+        # Evicted from memory, still read back from disk
+        assert cache.get_many([key('a')]) == {key('a'): 'A'}
+
+
+def test_clean_with_cache_only_cleans_misses():
+    cache = CleanTextCache()
+    cleaner = CountingCleaner()
+    assert _clean_with_cache(['a', None, 'b', 'a'], cache, cleaner, None, 10) == ['A', None, 'B', 'A']
+    assert cleaner.cleaned == ['a', 'b']
+    assert _clean_with_cache(['b', 'c', None], cache, cleaner, None, 10) == ['B', 'C', None]
+    assert cleaner.cleaned == ['a', 'b', 'c']
+
+
+def test_config_key_change_invalidates_entries():
+    cache = CleanTextCache()
+    _clean_with_cache(['a', 'b'], cache, CountingCleaner('v1'), None, 10)
+    cleaner = CountingCleaner('v2')
+    assert _clean_with_cache(['a', 'b'], cache, cleaner, None, 10) == ['A', 'B']
+    assert cleaner.cleaned == ['a', 'b']
+    # The entries of the first configuration are still there
+    cleaner = CountingCleaner('v1')
+    _clean_with_cache(['a', 'b'], cache, cleaner, None, 10)
+    assert cleaner.cleaned == []
+
+
+def test_config_key_change_invalidates_persisted_entries(tmp_path):
+    path = str(tmp_path / 'cleaned.sqlite')
+    with CleanTextCache(path=path) as cache:
+        _clean_with_cache(['a', 'b'], cache, CountingCleaner('v1'), None, 10)
+    with CleanTextCache(path=path) as cache:
+        cleaner = CountingCleaner('v1')
+        _clean_with_cache(['a', 'b'], cache, cleaner, None, 10)
+        assert cleaner.cleaned == []
+        cleaner = CountingCleaner('v2')
+        _clean_with_cache(['a', 'b'], cache, cleaner, None, 10)
+        assert cleaner.cleaned == ['a', 'b']
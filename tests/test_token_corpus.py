@@ -0,0 +1,78 @@
+## TokenCorpus rows and metadata, saved and loaded back memory-mapped
+
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from token_corpus import TokenCorpus
+
+
+# Already cleaned text, as after clean_text_df
+REVIEWS = pd.DataFrame({
+    'review_comment': ['good fabric soft cotton', None, 'size small return', 'good fabric', '', 'cannot return'],
+    'ratings': [5.0, 3.0, 1.0, 4.0, None, 2.0],
+    'size': ['M', 'L', None, 'M', 'XL', 'L'],
+    'asin': ['B0TEST0001', 'B0TEST0001', 'B0TEST0002', 'B0TEST0002', 'B0TEST0002', 'B0TEST0001'],
+}, dtype=object).astype({'ratings': float})
+
+
+def expected_rows():
+    return [text.split() if isinstance(text, str) else [] for text in REVIEWS['review_comment']]
+
+
+def assert_same_corpus(corpus, other):
+    assert len(corpus) == len(other) and corpus.tokens == other.tokens
+    assert np.array_equal(corpus.ids, other.ids) and np.array_equal(corpus.offsets, other.offsets)
+    assert [corpus.row_tokens(row) for row in range(len(corpus))] == \
+        [other.row_tokens(row) for row in range(len(other))]
+    for name in ('ratings', 'size', 'asin'):
+        assert list(map(str, corpus.column(name))) == list(map(str, other.column(name)))
+
+
+def test_rows_are_stored_as_ids_and_offsets():
+    corpus = TokenCorpus.from_df(REVIEWS)
+    assert len(corpus) == 6 and corpus.n_tokens == 12
+    assert corpus.offsets.tolist() == [0, 4, 4, 7, 9, 9, 12]
+    assert [corpus.row_tokens(row) for row in range(len(corpus))][:5] == expected_rows()[:5]
+    # The cleaned text is tokenized like word_tokenize
+    assert corpus.row_tokens(5) == ['can', 'not', 'return']
+    assert corpus.column('size').tolist() == ['M', 'L', None, 'M', 'XL', 'L']
+    assert np.isnan(corpus.column('ratings')[4])
+    assert corpus.frequencies()['good'] == 2
+
+
+def test_metadata_length_must_match():
+    with pytest.raises(ValueError):
+        TokenCorpus.from_texts(['a b', 'c'], ratings=[5.0])
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+def test_saved_corpus_loads_back(tmp_path, mmap):
+    corpus = TokenCorpus.from_df(REVIEWS)
+    path = str(tmp_path / 'corpus')
+    corpus.save(path)
+    loaded = TokenCorpus.load(path, mmap=mmap)
+    assert isinstance(loaded.ids, np.memmap) == mmap
+    assert all(isinstance(values, np.memmap) == mmap for values in loaded.columns.values())
+    assert_same_corpus(loaded, corpus)
+    assert loaded.frequencies() == corpus.frequencies()
+    assert loaded.top_ngrams(ns=(1, 2), k=3) == corpus.top_ngrams(ns=(1, 2), k=3)
+
+
+def test_selection_of_a_mapped_corpus(tmp_path):
+    path = str(tmp_path / 'corpus')
+    TokenCorpus.from_df(REVIEWS).save(path)
+    loaded = TokenCorpus.load(path)
+    positive = loaded.select(loaded.column('ratings') >= 4)
+    assert [positive.row_tokens(row) for row in range(len(positive))] == [expected_rows()[0], expected_rows()[3]]
+    assert positive.column('asin').tolist() == ['B0TEST0001', 'B0TEST0002']
+    assert loaded.token_counts(loaded.column('size') == 'L').sum() == 3
+    assert_same_corpus(loaded.select(np.arange(len(loaded))), loaded)
+
+
+def test_incomplete_corpus_is_not_loaded(tmp_path):
+    path = str(tmp_path / 'corpus')
+    TokenCorpus.from_df(REVIEWS).save(path)
+    os.remove(os.path.join(path, 'corpus.json'))
+    with pytest.raises(Exception, match='load'):
+        TokenCorpus.load(path)